@@ -0,0 +1,33 @@
+import asyncio
+import importlib.util
+import io
+
+import pytest
+from rich.console import Console
+
+from worlds import make_world
+
+if importlib.util.find_spec("pytest_benchmark") is None:
+    # 没有安装 pytest-benchmark 时跳过全部性能测试
+    collect_ignore_glob = ["test_*.py"]
+
+sizes = {
+    "small": dict(hosts=4, depth=3, fanout=4, file_size=128),
+    "large": dict(hosts=16, depth=4, fanout=6, file_size=512),
+}
+
+
+@pytest.fixture(params=list(sizes))
+def world(request, tmp_path):
+    w = make_world(**sizes[request.param])
+    w._path = tmp_path / "bench.save"
+    for host in w.hosts.values():
+        host.console = Console(file=io.StringIO(), width=120)
+    return w
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
@@ -0,0 +1,52 @@
+import argparse
+
+import pytest
+from prompt_toolkit.completion import CompleteEvent
+from prompt_toolkit.document import Document
+
+from nkgame.commands import Command, expansion
+from nkgame.commands.console import LsCommand
+from nkgame.commands.status import TreeSystem
+from nkgame.pb.game_status_pb2 import FileType
+
+
+def test_ls(benchmark, world, loop):
+    host = world.user0
+    cmd = LsCommand(host)
+    benchmark(lambda: loop.run_until_complete(cmd.run(argparse.Namespace(long=False, page=False))))
+
+
+def test_ls_long(benchmark, world, loop):
+    host = world.user0
+    cmd = LsCommand(host)
+    benchmark(lambda: loop.run_until_complete(cmd.run(argparse.Namespace(long=True, page=False))))
+
+
+@pytest.mark.parametrize("long", [False, True], ids=["short", "long"])
+def test_ls_huge_dir(benchmark, world, loop, long):
+    host = world.user0
+    big = TreeSystem("big", FileType.dir)
+    for i in range(50000):
+        big.add(TreeSystem(f"file_{i:05}.txt", FileType.txt, data="x" * (i % 64)))
+    host.file_sys.add(big)
+    host.path = ["root", "big"]
+    cmd = LsCommand(host)
+    benchmark(lambda: loop.run_until_complete(cmd.run(argparse.Namespace(long=long, page=False))))
+
+
+def test_completer(benchmark, world):
+    Command.status = world.user0
+    document = Document("cd ")
+    event = CompleteEvent(completion_requested=True)
+    benchmark(lambda: list(Command.completer.get_completions(document, event)))
+
+
+def test_glob_huge_dir(benchmark, world):
+    """大目录中匹配少量文件, 通配符的正则表达式已经缓存"""
+    host = world.user0
+    big = TreeSystem("big", FileType.dir)
+    for i in range(50000):
+        big.add(TreeSystem(f"file_{i:05}.txt", FileType.txt))
+    host.file_sys.add(big)
+    result = benchmark(lambda: list(expansion.expand(host, "big/file_4999?.txt big/*_1234?.*")))
+    assert len(result) == 20
@@ -0,0 +1,55 @@
+import io
+import random
+
+import openai
+from rich.console import Console
+from rich.live import Live
+
+from nkgame.commands.chatgpt import ChatGPT, MarkdownStream
+from nkgame.game.game_base import TetrisGame
+
+
+def test_tetris_next_frame(benchmark, world, loop):
+    random.seed(0)
+    game = TetrisGame(world.user0)
+    benchmark(lambda: loop.run_until_complete(game.next_frame(b"")) if not game.state.game_over else None)
+
+
+def test_tetris_draw(benchmark, world):
+    random.seed(0)
+    game = TetrisGame(world.user0)
+    console = Console(file=io.StringIO(), width=120)
+    benchmark(lambda: console.print(game.draw()))
+
+
+def reply(paragraphs=50):
+    text = ""
+    for i in range(paragraphs):
+        text += f"Paragraph {i} with some *markdown* and `code`.\n\n"
+        if i % 10 == 0:
+            text += "```python\nfor x in range(10):\n    print(x)\n```\n\n"
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def stub_create(chunks):
+    def create(**kwargs):
+        yield {"choices": [{"finish_reason": None, "delta": {"role": "assistant"}}]}
+        for c in chunks:
+            yield {"choices": [{"finish_reason": None, "delta": {"content": c}}]}
+        yield {"choices": [{"finish_reason": "stop", "delta": {}}]}
+    return create
+
+
+def test_chatgpt_stream(benchmark, loop, monkeypatch):
+    monkeypatch.setattr(openai.ChatCompletion, "create", stub_create(reply()))
+    console = Console(file=io.StringIO(), width=120)
+
+    async def consume():
+        with Live(console=console, auto_refresh=False) as live:
+            stream = MarkdownStream(live, ChatGPT(None).next_frame, ChatGPT.refresh_per)
+            async for role, content in ChatGPT.request("stub", []):
+                if content:
+                    stream.feed(content)
+            stream.close()
+
+    benchmark(lambda: loop.run_until_complete(consume()))
@@ -0,0 +1,30 @@
+import random
+
+from nkgame.game.player import Player
+from nkgame.game.scheduler import Scheduler
+
+
+def test_schedule_and_fire(benchmark):
+    """1 万台主机各有一个到期的事件"""
+    now = [0.0]
+    scheduler = Scheduler(clock=lambda: now[0])
+    rng = random.Random(42)
+    delays = [rng.uniform(0, 60) for _ in range(10000)]
+
+    def run():
+        for x in delays:
+            scheduler.call_later(x, lambda: None)
+        now[0] += 60
+        return scheduler.run_pending()
+
+    assert benchmark(run) == 10000
+
+
+def test_spawn_exit(benchmark):
+    player = Player()
+
+    def run():
+        for _ in range(100):
+            player.spawn("sh", 1, 1).exit()
+
+    benchmark(run)
@@ -0,0 +1,57 @@
+import random
+
+from nkgame.game.scores import Board, Scores
+
+
+def test_submit(benchmark):
+    """几十万局之后提交一局成绩并查询名次, 只和不同分数的数量有关"""
+    board = Board("tetris")
+    rng = random.Random(0)
+    for i in range(200_000):
+        board.submit(f"p{i % 1000}", rng.randrange(100_000), i)
+
+    def submit():
+        score = rng.randrange(100_000)
+        board.submit("guest", score, 0.0)
+        return board.rank(score)
+
+    assert benchmark(submit) >= 1
+
+
+def test_shared_file(tmp_path):
+    """两个进程共用一个文件: 读入对方追加的成绩, 重写时不丢失对方的数据块, 自己的成绩不重复计算"""
+    path = tmp_path / "bench.scores"
+    a, b = Scores(path), Scores(path)
+    a.submit("tetris", "a", 10)
+    a.flush()
+    b.submit("tetris", "b", 20)
+    b.flush()
+    assert a.board("tetris").total == b.board("tetris").total == 2
+
+    b.submit("tetris", "b", 30)
+    b.flush()
+    a.submit("tetris", "a", 40)
+    a.compact()
+    b.submit("tetris", "b", 50)
+    b.flush()
+    assert b.board("tetris").total == 5
+    assert a.board("tetris").total == 5
+    assert Scores(path).board("tetris").total == 5
+    assert [x[0] for x in Scores(path).board("tetris").top.entries()] == [50, 40, 30, 20, 10]
+
+
+def test_torn_chunk(tmp_path):
+    """写到一半退出的数据块在读取时去掉, 之后追加的成绩可以读到"""
+    path = tmp_path / "bench.scores"
+    a = Scores(path)
+    a.submit("tetris", "a", 10)
+    a.flush()
+    a.submit("tetris", "a", 20)
+    a.flush()
+    with open(path, "r+b") as f:
+        f.truncate(path.stat().st_size - 3)
+    b = Scores(path)
+    assert b.board("tetris").total == 1
+    b.submit("tetris", "b", 30)
+    b.flush()
+    assert Scores(path).board("tetris").total == 2
@@ -0,0 +1,21 @@
+from nkgame.commands.script import ProgramCache, compile_script
+from nkgame.commands.status import TreeSystem
+from nkgame.pb.game_status_pb2 import FileType
+
+source = "\n".join([
+    "for x in 1 2 3; do",
+    "  if [ $x -gt 1 ]; then echo big; else echo small; fi",
+    "done",
+] * 200)
+
+
+def test_compile(benchmark):
+    benchmark(compile_script, source)
+
+
+def test_cached(benchmark):
+    """同样的脚本再次执行时只计算摘要"""
+    cache = ProgramCache()
+    tree = TreeSystem("run.sh", FileType.exe, data=source)
+    program = cache.get(tree)
+    assert benchmark(cache.get, tree) is program
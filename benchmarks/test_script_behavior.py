@@ -0,0 +1,83 @@
+"""
+脚本的行为测试, 不计时
+"""
+from nkgame.commands import Command
+from nkgame.commands.script import Interpreter, compile_script
+from nkgame.commands.status import TreeSystem
+from nkgame.pb.game_status_pb2 import FileType
+
+
+def run(host, loop, source: str) -> tuple[int, list[str]]:
+    """执行脚本, 返回结果和输出的行"""
+    out = host.console.file
+    out.seek(0)
+    out.truncate()
+    code = loop.run_until_complete(Interpreter(host, compile_script(source), ["test.sh"]).run())
+    return code, out.getvalue().splitlines()
+
+
+def test_argparse_exit_in_script(world, loop):
+    """参数错误和 --help 不会结束脚本, 命令的结果不是 0"""
+    host = Command.status = world.user0
+    code, lines = run(host, loop, "ls --help\necho $?\nmkdir\necho $?\necho done")
+    assert [x for x in lines if x in ("1", "done")] == ["1", "1", "done"]
+    assert code == 0
+
+
+
+def test_for_expands_words_first(world, loop):
+    """循环开始时展开全部变量, 循环体中的赋值不影响后面的单词"""
+    host = world.user0
+    code, lines = run(host, loop, "v=one\nfor x in $v $v; do\n  echo $x\n  v=two\ndone")
+    assert lines == ["one", "one"]
+
+
+def test_for_status_expanded_first(world, loop):
+    """$? 是循环开始之前的命令的结果"""
+    host = world.user0
+    code, lines = run(host, loop, "false\nfor x in $? $?; do\n  true\n  echo $x\ndone")
+    assert lines == ["1", "1"]
+
+
+def test_for_brace_sequence(world, loop):
+    """大括号序列按需展开, 仍然按顺序"""
+    host = world.user0
+    code, lines = run(host, loop, "for x in a{1..3} b; do echo $x; done")
+    assert lines == ["a1", "a2", "a3", "b"]
+
+
+def test_failed_commands(world, loop):
+    """输出错误的命令结果不是 0, 条件, while, && 和 || 按结果执行"""
+    host = Command.status = world.user0
+    code, lines = run(host, loop, "cd /nonexistent\necho $?\nrm nonexistent\necho $?\ncd /\necho $?")
+    assert [x for x in lines if not x.startswith("ERR")] == ["1", "1", "0"]
+
+    code, lines = run(host, loop, "if cd nonexistent; then echo yes; else echo no; fi")
+    assert lines[-1] == "no"
+    code, lines = run(host, loop, "rm nonexistent && echo bad\nrm nonexistent || echo failed")
+    assert "bad" not in lines and lines[-1] == "failed"
+    code, lines = run(host, loop, "echo x > f.txt\nwhile rm f.txt; do echo removed; done\necho end")
+    assert [x for x in lines if not x.startswith("ERR")] == ["removed", "end"]
+
+
+def test_nested_script_exit_code(world, loop):
+    """sh 的结果是脚本的退出码"""
+    host = Command.status = world.user0
+    host.file_sys.add(TreeSystem("inner.sh", FileType.exe, data="exit 3"))
+    code, lines = run(host, loop, "sh inner.sh\necho $?")
+    assert lines[-1] == "3"
+
+
+def test_echo_redirect(world, loop):
+    """重定向只把文件写入增量存档, 不能写入根目录本身"""
+    host = Command.status = world.user0
+    world.save()
+    saved = world._path.read_bytes()
+    names = set(host.file_sys.index)
+    code, lines = run(host, loop, "echo x > /\necho $?\necho 中文 >> log.txt\necho $?")
+    assert [x for x in lines if not x.startswith("ERR")] == ["1", "0"]
+    assert set(host.file_sys.index) == names | {"log.txt"}
+    assert world._path.read_bytes() == saved
+
+    world.load()
+    assert host.file_sys.index["log.txt"].data == "中文\n"
@@ -0,0 +1,100 @@
+import random
+
+from nkgame.commands.status import TreeSystem
+from nkgame.game.shard import merge
+from nkgame.game.snapshot import FrozenTree, Interner
+from nkgame.pb.game_status_pb2 import FileType
+
+from worlds import deepest_path, make_tree
+
+
+def test_merge(benchmark):
+    """两个进程同时修改同一台主机的不同文件, 只需要比较两条修改过的路径"""
+    interner = Interner()
+    tree = make_tree(4, 6, 256, random.Random(0))
+    base = interner.freeze(tree)
+
+    def edit(path: list[str], data: str) -> FrozenTree:
+        copy = base.thaw()
+        copy.find(path).update(data)
+        return interner.freeze(copy)
+
+    path = deepest_path(tree)
+    current = edit(path, "a")
+    incoming = edit(path[:-1] + [next(x.name for x in tree.find(path[:-1]).sub if x.name != path[-1])], "b")
+    merged = benchmark(merge, interner, base, current, incoming)
+    assert merged.digest not in (current.digest, incoming.digest)
+
+
+def small_tree() -> TreeSystem:
+    root = TreeSystem("root", FileType.dir)
+    lib = root.add(TreeSystem("lib", FileType.dir))
+    lib.add(TreeSystem("a.txt", FileType.txt, data="a"))
+    lib.add(TreeSystem("b.txt", FileType.txt, data="b"))
+    root.add(TreeSystem("c.txt", FileType.txt, data="c"))
+    return root
+
+
+def merged(base: FrozenTree, mine, theirs, interner: Interner) -> TreeSystem:
+    """两边各自修改 base 的副本后合并, 返回合并结果的文件树"""
+    current, incoming = base.thaw(), base.thaw()
+    mine(current)
+    theirs(incoming)
+    return merge(interner, base, interner.freeze(current), interner.freeze(incoming)).thaw()
+
+
+def names(tree: TreeSystem) -> dict[str, str]:
+    """路径 -> 内容, 目录的内容是 None"""
+    result = {}
+    stack = [("", tree)]
+    while stack:
+        p, x = stack.pop()
+        for y in x.sub:
+            path = f"{p}/{y.name}"
+            result[path] = None if y.type == FileType.dir else y.data
+            stack.append((path, y))
+    return result
+
+
+def test_merge_deletions():
+    """一边删除, 另一边没有改动时删除; 另一边修改的其他文件保留"""
+    interner = Interner()
+    base = interner.freeze(small_tree())
+    tree = merged(
+        base,
+        lambda t: t.find(["lib"]).remove(t.find(["lib", "a.txt"])),
+        lambda t: t.find(["lib", "b.txt"]).update("B"),
+        interner,
+    )
+    assert names(tree) == {"/lib": None, "/lib/b.txt": "B", "/c.txt": "c"}
+
+    tree = merged(base, lambda t: t.find(["c.txt"]).update("C"), lambda t: t.remove(t.find(["lib"])), interner)
+    assert names(tree) == {"/c.txt": "C"}
+
+
+def test_merge_delete_and_modify():
+    """一边删除一边修改同一个文件时以后到的一方为准"""
+    interner = Interner()
+    base = interner.freeze(small_tree())
+    tree = merged(base, lambda t: t.remove(t.find(["c.txt"])), lambda t: t.find(["c.txt"]).update("C"), interner)
+    assert names(tree)["/c.txt"] == "C"
+    tree = merged(base, lambda t: t.find(["c.txt"]).update("C"), lambda t: t.remove(t.find(["c.txt"])), interner)
+    assert "/c.txt" not in names(tree)
+
+
+def test_merge_new_directories():
+    """两边创建的同名目录逐项合并, 只在一边修改的权限保留"""
+    interner = Interner()
+    base = interner.freeze(small_tree())
+
+    def mine(t):
+        t.add(TreeSystem("new", FileType.dir)).add(TreeSystem("x.txt", FileType.txt, data="x"))
+        t.find(["lib"]).mode = 0o700
+
+    def theirs(t):
+        t.add(TreeSystem("new", FileType.dir)).add(TreeSystem("y.txt", FileType.txt, data="y"))
+
+    tree = merged(base, mine, theirs, interner)
+    assert names(tree)["/new/x.txt"] == "x" and names(tree)["/new/y.txt"] == "y"
+    assert tree.find(["lib"]).mode == 0o700
+    assert [x.name for x in tree.sub] == sorted(x.name for x in tree.sub if x.type == FileType.dir) + ["c.txt"]
@@ -0,0 +1,38 @@
+from nkgame.commands.status import GameStatus, TreeSystem
+from nkgame.pb.game_status_pb2 import FileType
+
+from worlds import deepest_path
+
+
+def test_save(benchmark, world):
+    benchmark(world.save)
+
+
+def test_load(benchmark, world):
+    world.save()
+
+    def setup():
+        g = GameStatus()
+        g._path = world._path
+        return (g,), {}
+
+    benchmark.pedantic(GameStatus.load, setup=setup, rounds=5)
+
+
+def test_find(benchmark, world):
+    tree = world.user0.file_sys
+    path = deepest_path(tree)
+    assert benchmark(tree.find, path) is not None
+
+
+def test_access(benchmark, world):
+    """最深的节点的有效权限, 第一次计算之后直接读取缓存, 不遍历祖先"""
+    host = world.user0
+    tree = host.file_sys.find(deepest_path(host.file_sys))
+    tree.access("guest")
+    assert benchmark(tree.access, "guest") == tree.access("guest")
+
+
+def test_append_large_file(benchmark):
+    tree = TreeSystem("log.txt", FileType.txt, data="x" * 10 * 1024 ** 2)
+    benchmark(tree.append, "line\n")
@@ -0,0 +1,94 @@
+"""
+存档读取的行为测试, 不计时
+"""
+import os
+
+import pytest
+
+from nkgame import metrics
+from nkgame.commands.status import GameStatus, FileType, tree_size
+from nkgame.game.savefile import SaveFileError
+from nkgame.game.world import WorldGenerator
+
+
+def test_load_truncated_keeps_world(world):
+    """存档被截断时读取失败, 内存中的世界保持不变, 之后的存档不会写入空的世界"""
+    world.save()
+    hosts = dict(world.hosts)
+    user0 = world.user0
+    files = {k: v.file_sys for k, v in hosts.items()}
+    with open(world._path, "r+b") as f:
+        f.truncate(os.path.getsize(world._path) - 20)
+
+    with pytest.raises(SaveFileError):
+        world.load()
+    assert dict(world.hosts) == hosts
+    assert world.user0 is user0
+    assert {k: v.file_sys for k, v in hosts.items()} == files
+
+    world.save()
+    g = GameStatus()
+    g._path = world._path
+    g.load()
+    assert sorted(g.hosts.keys()) == sorted(hosts)
+
+
+def test_load_reuses_hosts(world):
+    """重新读取时已经存在的主机对象保留, 只替换内容"""
+    world.save()
+    user0 = world.user0
+    count = len(user0.file_sys.sub)
+    user0.file_sys.remove(user0.file_sys.sub[0])
+    world.load()
+    assert world.user0 is user0
+    assert len(user0.file_sys.sub) == count
+
+
+def test_replaced_hosts_stop_cron(world):
+    """生成的主机被替换时取消原来的定时任务, 重新生成的主机不会和旧主机同时运行"""
+    world.set_generator(WorldGenerator(7, 50))
+    name = world.hosts.generator.names[0]
+    node = world.hosts[name]
+    timers = list(node.player.crons.values())
+    assert timers and node.player.processes
+
+    world.save()
+    world.load()
+    assert all(x.cancelled for x in timers)
+    assert not node.player.crons and not node.player.processes
+    again = world.hosts[name]
+    assert again is not node and again.player.crons
+
+    # 更换世界时, 旧世界中没有改动的主机被移除
+    timers = list(again.player.crons.values())
+    world.set_generator(WorldGenerator(8, 50))
+    assert all(x.cancelled for x in timers)
+    assert dict.get(world.hosts, name) is None
+
+
+def test_cache_tracks_writes(world):
+    """常驻主机的修改计入缓存占用, 超过上限时换出其他主机; 命中次数按使用主机的次数统计"""
+    node = world.user0
+    node.file_sys
+    used = world.cache.used
+    f = node.file_sys.sub[0]
+    while f.type == FileType.dir:
+        f = f.sub[0]
+    f.append("x" * 1000)
+    node.file_sys
+    assert world.cache.used == used + 1000
+    assert node.tree_size == tree_size(node.file_sys)
+
+    world.cache.budget = world.cache.used
+    evictions = metrics.host_cache_evictions.get()
+    f.append("x" * 1000)
+    node.file_sys
+    assert metrics.host_cache_evictions.get() > evictions
+    assert node.resident and world.cache.used <= world.cache.budget
+
+    hits = metrics.host_cache_hits.get()
+    for _ in range(10):
+        node.file_sys
+    assert metrics.host_cache_hits.get() == hits
+    world.cache.lookup(node)
+    assert metrics.host_cache_hits.get() == hits + 1
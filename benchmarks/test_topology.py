@@ -0,0 +1,29 @@
+import itertools
+
+from nkgame.game.topology import Topology
+from nkgame.game.world import WorldGenerator
+
+
+def test_topology_build(benchmark):
+    names = WorldGenerator(42, 10000).names
+    benchmark(Topology.build, names, 42)
+
+
+def test_route_cached(benchmark):
+    names = WorldGenerator(42, 10000).names
+    topology = Topology.build(names, 42)
+    targets = itertools.cycle(names)
+    benchmark(lambda: topology.route(names[0], next(targets)))
+
+
+def test_add_host(benchmark):
+    names = WorldGenerator(42, 10000).names
+    topology = Topology.build(names, 42)
+    topology.route(names[0], names[1])
+    hosts = (f"172.16.{i // 256}.{i % 256}" for i in itertools.count())
+    benchmark(lambda: topology.add_host(next(hosts)))
+
+
+def test_ip_range(benchmark, world):
+    world.set_generator(WorldGenerator(42, 10000))
+    benchmark(lambda: sum(1 for _ in world.hosts.ip_range("10.0.0.0/18")))
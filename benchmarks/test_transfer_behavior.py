@@ -0,0 +1,95 @@
+"""
+复制的行为测试, 不计时
+"""
+import argparse
+
+from nkgame.commands.status import ROOT, TreeSystem
+from nkgame.commands.transfer import CpCommand
+from nkgame.pb.game_status_pb2 import FileType
+
+
+def make_dirs(root: TreeSystem):
+    """src 中 a 是目录, b 是文件; dst/src 中正好相反"""
+    src = root.add(TreeSystem("src", FileType.dir))
+    src.add(TreeSystem("a", FileType.dir)).add(TreeSystem("x.txt", FileType.txt, data="x"))
+    src.add(TreeSystem("b", FileType.txt, data="b"))
+    src.add(TreeSystem("c.txt", FileType.txt, data="new"))
+    old = root.add(TreeSystem("dst", FileType.dir)).add(TreeSystem("src", FileType.dir))
+    old.add(TreeSystem("c.txt", FileType.txt, data="old"))
+    # 其他用户可以读取和进入, 不能修改
+    stack = [src, old.parent]
+    while stack:
+        x = stack.pop()
+        x.mode = 0o755 if x.type == FileType.dir else 0o644
+        stack.extend(x.sub)
+    return old
+
+
+def cp(host, loop, *paths):
+    cmd = CpCommand(host)
+    loop.run_until_complete(cmd.run(argparse.Namespace(paths=list(paths), recursive=True)))
+    return host.console.file.getvalue()
+
+
+def test_nested_type_conflict(world, loop):
+    """下层的目录和文件互相覆盖时拒绝复制, 不修改目标"""
+    host = world.user0
+    old = make_dirs(host.file_sys)
+    old.add(TreeSystem("a", FileType.txt, data="file"))
+    out = cp(host, loop, "src", "dst")
+    assert "dst/src/a already exists" in out
+    assert old.index["a"].data == "file" and old.index["c.txt"].data == "old"
+
+    old.remove(old.index["a"])
+    b = old.add(TreeSystem("b", FileType.dir))
+    b.add(TreeSystem("y.txt", FileType.txt, data="y"))
+    out = cp(host, loop, "src", "dst")
+    assert "dst/src/b already exists" in out
+    assert b.type == FileType.dir and not b.data and b.index["y.txt"].data == "y"
+    assert old.index["c.txt"].data == "old"
+
+
+def test_nested_copy(world, loop):
+    """没有冲突时合并到已经存在的目录中"""
+    host = world.user0
+    old = make_dirs(host.file_sys)
+    cp(host, loop, "src", "dst")
+    assert old.index["c.txt"].data == "new"
+    assert old.index["a"].index["x.txt"].data == "x"
+    assert old.index["b"].data == "b"
+
+
+def test_nested_permissions(world, loop):
+    """下层已经存在的文件和目录也要有写权限, 检查在创建任何节点之前"""
+    host = world.user0
+    root = host.file_sys
+    root.owner = ROOT
+    root.mode = 0o777
+    old = make_dirs(root)
+    host.name = "guest"
+    out = cp(host, loop, "src", "dst")
+    assert "dst/src/a permission denied" in out
+    assert "a" not in old.index and old.index["c.txt"].data == "old"
+
+    old.mode = 0o777
+    out = cp(host, loop, "src", "dst")
+    assert "dst/src/c.txt permission denied" in out
+    assert "a" not in old.index and old.index["c.txt"].data == "old"
+
+    old.index["c.txt"].mode = 0o666
+    cp(host, loop, "src", "dst")
+    assert old.index["c.txt"].data == "new" and old.index["a"].index["x.txt"].data == "x"
+
+
+def test_nested_read_permission(world, loop):
+    """源目录中不能读的文件不会被复制"""
+    host = world.user0
+    root = host.file_sys
+    root.owner = ROOT
+    root.mode = 0o777
+    make_dirs(root)
+    root.index["src"].index["b"].mode = 0o600
+    host.name = "guest"
+    out = cp(host, loop, "src", "copy")
+    assert "copy/b permission denied" in out
+    assert "copy" not in root.index
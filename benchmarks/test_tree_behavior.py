@@ -0,0 +1,211 @@
+"""
+文件树的行为测试, 不计时
+"""
+import argparse
+
+from nkgame.commands import Command, console
+from nkgame.commands.console import PyEvalCommand
+from nkgame.commands.files import ChmodCommand, ChownCommand, DuCommand
+from nkgame.commands.snapshot import RestoreCommand
+from nkgame.commands.status import EXEC, READ, ROOT, VISIBLE, WRITE, TreeSystem
+from nkgame.game.snapshot import Interner, encode_nodes
+from nkgame.game.text import CHUNK_SIZE
+from nkgame.pb.game_status_pb2 import FileType, SnapshotNode as SnapshotNodeData, TreeSystem as TreeSystemData
+
+
+def check_totals(tree: TreeSystem):
+    """逐个节点重新计算子树统计, 和增量维护的结果比较"""
+    expected = tree.contribution()
+    for x in tree.sub:
+        sub = check_totals(x) if x.type == FileType.dir else x.contribution()
+        expected = [a + b for a, b in zip(expected, sub)]
+        assert tree._keys == sorted(tree._keys)
+    assert tree.totals == expected
+    return expected
+
+
+def test_exp_file_changes_type(world, loop, monkeypatch):
+    """exp -f 写入已有的文本文件后类型变为 bin, 之后仍然可以删除, 统计正确"""
+    async def evaluate(source, env):
+        return [1, 2, 3]
+
+    monkeypatch.setattr(console.engine, "evaluate", evaluate)
+    host = world.user0
+    root = host.file_sys
+    root.add(TreeSystem("a.txt", FileType.txt, data="hello"))
+    interner = Interner()
+    before = interner.freeze(root)
+    cmd = PyEvalCommand(host)
+    loop.run_until_complete(cmd.run(argparse.Namespace(exp="x", out="", file="a.txt")))
+    f = root.index["a.txt"]
+    assert f.type == FileType.bin
+    assert root._frozen is None
+    assert interner.freeze(root).digest != before.digest
+    check_totals(root)
+    bins = root.count(FileType.bin)
+    root.remove(f)
+    assert "a.txt" not in root.index
+    assert root.count(FileType.bin) == bins - 1
+    check_totals(root)
+
+
+def test_access_invalidated(world):
+    """修改上级目录的权限和所有者后, 子孙缓存的有效权限重新计算"""
+    root = world.user0.file_sys
+    root.owner = ROOT
+    d = root.add(TreeSystem("d", FileType.dir))
+    f = TreeSystem("f.txt", FileType.txt, data="x")
+    d.add(f)
+    d.mode, f.mode = 0o755, 0o644
+    assert f.access("guest") == READ
+    d.mode = 0o750
+    assert f.access("guest") == 0
+    d.mode = 0o755
+    d.owner = "guest"
+    assert f.effective_owner == "guest"
+    assert f.access("guest") == READ | WRITE | VISIBLE
+    assert f.access(ROOT) == READ | WRITE | EXEC | VISIBLE
+
+
+def test_mode_zero_round_trip(world):
+    """chmod 000 的节点存档和快照读取后仍然是 000, 不会当作旧存档"""
+    root = world.user0.file_sys
+    f = TreeSystem("f.txt", FileType.txt, data="x")
+    root.add(f)
+    f.mode = 0
+    assert TreeSystem.load_proto(f.to_proto()).mode == 0
+
+    world.save()
+    world.load()
+    assert world.user0.file_sys.index["f.txt"].mode == 0
+
+    interner = Interner()
+    frozen = interner.freeze(root)
+    nodes = []
+    encode_nodes(frozen, {}, nodes)
+    decoded = []
+    for x in nodes:
+        decoded.append(Interner().decode(SnapshotNodeData.FromString(x.SerializeToString()), decoded))
+    assert decoded[-1].digest == frozen.digest
+    assert decoded[-1].thaw().index["f.txt"].mode == 0
+
+
+def test_legacy_mode():
+    """旧存档没有 mode 字段, 按 readable 等标记计算"""
+    pb = TreeSystemData(name="f.txt", type=FileType.txt, readable=True)
+    assert TreeSystem.load_proto(pb).mode == 0o744
+
+
+def test_chown_recursive_checks_every_node(world, loop):
+    """chown -R 会清除子孙的所有者, 子孙中有别人的文件时不能修改"""
+    host = world.user0
+    host.name = "guest"
+    d = host.file_sys.add(TreeSystem("d", FileType.dir))
+    d.owner = "guest"
+    shadow = TreeSystem("shadow", FileType.txt, data="x")
+    d.add(shadow)
+    shadow.owner = ROOT
+    cmd = ChownCommand(host)
+    loop.run_until_complete(cmd.run(argparse.Namespace(owner="guest", paths=["d"], recursive=True)))
+    assert shadow.owner == ROOT
+    assert shadow.effective_owner == ROOT
+
+    host.name = ROOT
+    loop.run_until_complete(cmd.run(argparse.Namespace(owner="guest", paths=["d"], recursive=True)))
+    assert shadow.owner == ""
+    assert shadow.effective_owner == "guest"
+
+
+def test_size_in_bytes(world):
+    """大小按 utf-8 字节数统计, 追加和修改内容时增量更新"""
+    root = world.user0.file_sys
+    before = root.size
+    d = root.add(TreeSystem("d", FileType.dir))
+    f = TreeSystem("f.txt", FileType.txt, data="中文")
+    d.add(f)
+    assert f.size == 6 and d.size == 6
+    f.append("a" * CHUNK_SIZE + "文")
+    f.update(f.data.replace("a", "字", 10))
+    size = len(f.data.encode())
+    assert f.size == size and f.text.nbytes == size
+    assert d.size == size and root.size == before + size
+    f.data = "x"
+    assert d.size == 1
+    check_totals(root)
+
+
+def test_chmod_recursive_checks_first(world, loop):
+    """chmod -R 先检查所有节点和权限格式, 出错时什么都不修改"""
+    host = world.user0
+    host.name = "guest"
+    d = host.file_sys.add(TreeSystem("d", FileType.dir))
+    d.owner = "guest"
+    mine = TreeSystem("a.txt", FileType.txt, data="x")
+    shadow = TreeSystem("shadow", FileType.txt, data="x")
+    d.add(mine)
+    d.add(shadow)
+    shadow.owner = ROOT
+    cmd = ChmodCommand(host)
+    loop.run_until_complete(cmd.run(argparse.Namespace(mode="o+r", paths=["d"], recursive=True)))
+    assert cmd.code == 1
+    assert (d.mode, mine.mode, shadow.mode) == (0o700, 0o700, 0o700)
+    cmd = ChmodCommand(host)
+    loop.run_until_complete(cmd.run(argparse.Namespace(mode="o+q", paths=["d/a.txt"], recursive=False)))
+    assert cmd.code == 1 and mine.mode == 0o700
+
+    shadow.owner = ""
+    loop.run_until_complete(cmd.run(argparse.Namespace(mode="u-w,o+r", paths=["d"], recursive=True)))
+    assert (d.mode, mine.mode, shadow.mode) == (0o504, 0o504, 0o504)
+
+
+def test_du_skips_unreadable(world, loop):
+    """du 不统计不能读取的目录中的内容, 不能读取的目录本身报错"""
+    host = world.user0
+    host.name = "guest"
+    root = host.file_sys
+    d = root.add(TreeSystem("d", FileType.dir))
+    d.owner = "guest"
+    d.mode = 0o755
+    d.add(TreeSystem("a.txt", FileType.txt, data="x" * 10))
+    secret = d.add(TreeSystem("secret", FileType.dir))
+    secret.owner = ROOT
+    secret.visible = True
+    secret.add(TreeSystem("b.txt", FileType.txt, data="x" * 1000))
+
+    out = host.console.file
+    out.seek(0)
+    out.truncate()
+    cmd = DuCommand(host)
+    loop.run_until_complete(cmd.run(argparse.Namespace(path="/d", depth=1, summarize=False, types=True)))
+    assert cmd.code == 1
+    assert "cannot read directory /root/d/secret" in out.getvalue()
+    assert "│ bytes │ 10    │" in out.getvalue()
+    assert "│ txt   │ 1     │" in out.getvalue()
+
+    cmd = DuCommand(host)
+    loop.run_until_complete(cmd.run(argparse.Namespace(path="/d/secret", depth=1, summarize=False, types=False)))
+    assert cmd.code == 1 and "permission denied" in out.getvalue()
+
+    host.name = ROOT
+    out.seek(0)
+    out.truncate()
+    cmd = DuCommand(host)
+    loop.run_until_complete(cmd.run(argparse.Namespace(path="/d", depth=1, summarize=True, types=False)))
+    assert cmd.code == 0 and out.getvalue().startswith("1010B")
+
+
+def test_restore_checks_owner(world, loop):
+    """恢复快照会替换整个文件树, 有别人的文件时不能恢复, 也不会只恢复一部分主机"""
+    host = Command.status = world.user0
+    other = list(world.hosts.values())[1]
+    host.name = "guest"
+    snapshot = world.snapshots.take("", {x.ip: x.file_sys for x in world.hosts.values()})
+    host.file_sys.add(TreeSystem("new.txt", FileType.txt, data="x"))
+    other.file_sys.index[other.file_sys.sub[0].name].owner = ROOT
+    cmd = RestoreCommand(host)
+    loop.run_until_complete(cmd.run(argparse.Namespace(id=snapshot.id, current=False)))
+    assert cmd.code == 1 and "new.txt" in host.file_sys.index
+
+    cmd = RestoreCommand(host)
+    loop.run_until_complete(cmd.run(argparse.Namespace(id=snapshot.id, current=True)))
+    assert cmd.code == 0 and "new.txt" not in host.file_sys.index
@@ -0,0 +1,15 @@
+import itertools
+
+from nkgame.commands.status import GameStatus
+from nkgame.game.world import WorldGenerator
+
+
+def test_world_create(benchmark):
+    benchmark(WorldGenerator, 42, 10000)
+
+
+def test_host_generate(benchmark):
+    generator = WorldGenerator(42, 10000)
+    game = GameStatus()
+    hosts = itertools.cycle(generator.names)
+    benchmark(lambda: generator.generate(next(hosts), game))
@@ -0,0 +1,53 @@
+"""
+生成用于性能测试的虚拟世界
+"""
+import random
+import string
+
+from nkgame.commands.status import GameStatus, HostNode, TreeSystem
+from nkgame.pb.game_status_pb2 import FileType
+
+file_types = (FileType.txt, FileType.exe, FileType.bin, FileType.img)
+
+
+def random_name(rng: random.Random, n=8):
+    return "".join(rng.choices(string.ascii_lowercase, k=n))
+
+
+def make_tree(depth: int, fanout: int, file_size: int, rng: random.Random, name="root") -> TreeSystem:
+    """
+    生成一棵目录树
+    每层有 fanout 个子目录 (最后一层没有) 和 fanout 个文件
+    """
+    tree = TreeSystem(name, FileType.dir, data="")
+    tree.readable = tree.writable = tree.executable = tree.visible = True
+    for i in range(fanout):
+        ft = rng.choice(file_types)
+        data = "".join(rng.choices(string.printable, k=file_size))
+        tree.add(TreeSystem(f"{random_name(rng)}_{i}.{FileType.Name(ft)}", ft, data=data))
+        if depth > 1:
+            tree.add(make_tree(depth - 1, fanout, file_size, rng, name=f"{random_name(rng)}_{i}"))
+    return tree
+
+
+def make_world(hosts=10, depth=3, fanout=5, file_size=256, seed=0) -> GameStatus:
+    rng = random.Random(seed)
+    world = GameStatus()
+    for i in range(hosts):
+        host = f"10.0.{i // 256}.{i % 256}"
+        world.hosts[host] = HostNode(
+            name=f"u{i}", host=host, file=make_tree(depth, fanout, file_size, rng), game=world
+        )
+    world._user0 = next(iter(world.hosts))
+    return world
+
+
+def deepest_path(tree: TreeSystem) -> list[str]:
+    """沿着第一个子目录一直向下的路径"""
+    path = []
+    while True:
+        d = next((x for x in tree.sub if x.type == FileType.dir), None)
+        if d is None:
+            return path
+        path.append(d.name)
+        tree = d
@@ -0,0 +1,371 @@
+"""
+在真实的目录和虚拟文件系统之间批量导入导出
+
+    nkgame import <主机> <目录> [目标目录]
+    nkgame export <主机> <目录|文件.tar> [虚拟路径]
+
+导入不读取整个存档, 读到的文件按批追加到增量存档 (见 nkgame.game.journal), 下次启动游戏时合并进存档.
+线程池同时列目录和读文件, 同时读取的文件数量和字节数都有上限, 内存占用和目录的总大小无关.
+导出时按块写出文件内容, tar 以流的方式写入, 不需要先生成整个归档
+"""
+import argparse
+import base64
+import codecs
+import concurrent.futures
+import io
+import json
+import os
+import tarfile
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+from rich.console import Console
+
+from nkgame.commands.status import GameStatus, TreeSystem
+from nkgame.game import savefile
+from nkgame.game.journal import Journal
+from nkgame.pb.game_status_pb2 import FileType, TreeSystem as TreeSystemData, JournalEntry as JournalEntryData
+
+console = Console()
+
+extensions = {
+    FileType.txt: (
+        ".txt", ".md", ".log", ".json", ".csv", ".ini", ".cfg", ".conf", ".yml", ".yaml", ".xml", ".html",
+        ".py", ".c", ".h", ".js",
+    ),
+    FileType.exe: (".sh", ".exe", ".bat", ".cmd", ".run"),
+    FileType.img: (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"),
+    FileType.bin: (".bin", ".so", ".dll", ".dat", ".db", ".o", ".a"),
+    FileType.enc: (".enc", ".gpg", ".pgp", ".aes"),
+}
+file_types = {ext: ft for ft, exts in extensions.items() for ext in exts}
+
+# 生成的世界中二进制内容保存为字节的 json 列表, 每个字节要 4 个字符左右;
+# 导入的文件保存为 {"base64": "..."}, 仍然是 json, 大小只有原来的 4/3, 导出时两种格式都可以还原
+binary_types = (FileType.img, FileType.bin, FileType.enc)
+
+# 读取文件的块大小, 是 3 的倍数, 每块单独编码为 base64 后直接拼接
+READ_SIZE = 3 * 64 * 1024
+
+
+def file_type(name: str) -> Optional[int]:
+    """按扩展名确定文件类型, 不认识的扩展名返回 None, 按内容判断"""
+    return file_types.get(os.path.splitext(name)[1].lower())
+
+
+def read_file(path: Path, ft: Optional[int]) -> tuple[int, str]:
+    """按块读取并解码, 不是 utf-8 的文本按二进制保存"""
+    if ft not in binary_types:
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        parts = []
+        try:
+            with open(path, "rb") as f:
+                while chunk := f.read(READ_SIZE):
+                    parts.append(decoder.decode(chunk))
+                parts.append(decoder.decode(b"", final=True))
+            return ft if ft is not None else FileType.txt, "".join(parts)
+        except UnicodeDecodeError:
+            pass
+    parts = ['{"base64": "']
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_SIZE):
+            parts.append(base64.b64encode(chunk).decode("ascii"))
+    parts.append('"}')
+    return ft if ft in binary_types else FileType.bin, "".join(parts)
+
+
+def entry(host: str, path: list[str], pb: TreeSystemData) -> JournalEntryData:
+    # 路径的第一项是根目录, 重放时不参与查找
+    return JournalEntryData(ip=host, path=["", *path], file=pb)
+
+
+def node_proto(name: str, ft: int, data: str = "") -> TreeSystemData:
+    return TreeSystemData(
+        name=name, type=ft, data=data,
+        readable=True, writable=True, executable=ft in (FileType.dir, FileType.exe),
+        visible=not name.startswith("."),
+    )
+
+
+def host_exists(game: GameStatus, host: str) -> bool:
+    """只按块读取存档检查主机是否存在, 不创建主机"""
+    if not game._path.exists():
+        return False
+    reader = savefile.SaveReader(game._path)
+    if reader.header.world_size:
+        from nkgame.game.world import WorldGenerator
+        if host in WorldGenerator(reader.header.seed, reader.header.world_size):
+            reader.close()
+            return True
+    for node in reader:
+        if host in (node.host, node.ip):
+            reader.close()
+            return True
+    return False
+
+
+class Importer:
+
+    def __init__(self, journal: Journal, host: str, workers: int, max_size: int, buffer: int = 64 * 1024 ** 2):
+        self.journal = journal
+        self.host = host
+        self.workers = workers
+        self.max_size = max_size
+        # 正在读取和等待记录的文件总大小的上限
+        self.buffer = buffer
+        self.batch: list[JournalEntryData] = []
+        self.batch_size = 0
+        self.files = self.dirs = self.skipped = 0
+        self.bytes = 0
+
+    def add(self, path: list[str], pb: TreeSystemData):
+        self.batch.append(entry(self.host, path, pb))
+        self.batch_size += len(pb.data)
+        if self.batch_size >= savefile.CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.journal.append(self.batch)
+            self.batch = []
+            self.batch_size = 0
+
+    @staticmethod
+    def scan(real: Path) -> list[os.DirEntry]:
+        with os.scandir(real) as it:
+            return sorted(it, key=lambda x: x.name)
+
+    def run(self, source: Path, target: list[str]):
+        """
+        列目录和读文件都在线程池中进行, 目录在列出后立即记录, 一定在其中的文件之前;
+        同时读取的文件不超过 workers * 2 个, 总大小不超过 buffer, 比 buffer 大的文件单独读取
+        """
+        # 目标目录不存在时依次创建, 已经存在的目录重放时保留
+        for i in range(len(target)):
+            self.add(target[:i + 1], node_proto(target[i], FileType.dir))
+        self.add(target + [source.name], node_proto(source.name, FileType.dir))
+        self.dirs += 1
+        limit = self.workers * 2
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            running: dict[concurrent.futures.Future, tuple] = {
+                pool.submit(self.scan, source): ("dir", target + [source.name], 0),
+            }
+            files: list[tuple[os.DirEntry, list[str], int]] = []
+            reading = 0
+            while running or files:
+                # 有空闲时开始读取等待中的文件
+                while files and len(running) < limit:
+                    item, path, size = files[-1]
+                    if reading and reading + size > self.buffer:
+                        break
+                    files.pop()
+                    reading += size
+                    ft = file_type(item.name)
+                    running[pool.submit(read_file, Path(item.path), ft)] = ("file", path + [item.name], size)
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    kind, path, size = running.pop(future)
+                    reading -= size
+                    try:
+                        result = future.result()
+                    except OSError as e:
+                        console.print(f"[red]ERR[/] {'/'.join(path)}: {e}")
+                        self.skipped += 1
+                        continue
+                    if kind == "file":
+                        ft, data = result
+                        self.add(path, node_proto(path[-1], ft, data))
+                        self.files += 1
+                        self.bytes += len(data)
+                        continue
+                    for item in result:
+                        if item.is_dir(follow_symlinks=False):
+                            self.add(path + [item.name], node_proto(item.name, FileType.dir))
+                            self.dirs += 1
+                            running[pool.submit(self.scan, Path(item.path))] = ("dir", path + [item.name], 0)
+                        elif item.is_file() and item.stat().st_size <= self.max_size:
+                            files.append((item, path, item.stat().st_size))
+                        else:
+                            self.skipped += 1
+        self.flush()
+
+
+def open_game(args: argparse.Namespace) -> GameStatus:
+    game = GameStatus()
+    if args.save:
+        game._path = Path(args.save)
+    return game
+
+
+def import_dir(args: argparse.Namespace) -> int:
+    game = open_game(args)
+    source = Path(args.source).resolve()
+    if not source.is_dir():
+        console.print(f"[red]ERR[/] {args.source} is not a directory.")
+        return 1
+    if not host_exists(game, args.host):
+        console.print(f"[red]ERR[/] host {args.host} not exists.")
+        return 1
+    target = [x for x in args.target.split("/") if x and x != "."]
+    st = time.perf_counter()
+    importer = Importer(game.journal, args.host, args.workers, args.max_size * 1024 ** 2, args.buffer * 1024 ** 2)
+    importer.run(source, target)
+    console.print(
+        f"imported {importer.dirs} directories, {importer.files} files ({importer.bytes} bytes), "
+        f"skipped {importer.skipped} in {time.perf_counter() - st:.2f}s, "
+        f"merged into the save at next start."
+    )
+    return 0
+
+
+def encode(tree: TreeSystem) -> Iterator[bytes]:
+    """按块返回文件内容, 二进制文件还原为原来的字节"""
+    if tree.type in binary_types:
+        data = tree.data or "[]"
+        prefix = '{"base64": "'
+        if data.startswith(prefix) and data.endswith('"}'):
+            # 按块解码, 每块的长度是 4 的倍数
+            step = READ_SIZE // 3 * 4
+            for i in range(len(prefix), len(data) - 2, step):
+                yield base64.b64decode(data[i:min(i + step, len(data) - 2)])
+            return
+        try:
+            data = json.loads(data)
+            if isinstance(data, list):
+                yield bytes(x & 0xff for x in data if isinstance(x, int))
+                return
+        except ValueError:
+            pass
+    for chunk in tree.text.chunks():
+        yield chunk.encode()
+
+
+class ChunkReader(io.RawIOBase):
+    """把按块返回的内容包装成文件对象, 给 tarfile 读取"""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b) -> int:
+        while not self.buffer:
+            self.buffer = next(self.chunks, None)
+            if self.buffer is None:
+                self.buffer = b""
+                return 0
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+
+def walk(tree: TreeSystem, path: str) -> Iterator[tuple[str, TreeSystem]]:
+    stack = [(tree, path)]
+    while stack:
+        x, p = stack.pop()
+        yield p, x
+        if x.type == FileType.dir:
+            stack.extend((sub, f"{p}/{sub.name}" if p else sub.name) for sub in reversed(x.sub))
+
+
+def write_file(path: Path, tree: TreeSystem):
+    with open(path, "wb") as f:
+        for chunk in encode(tree):
+            f.write(chunk)
+    if tree.type == FileType.exe:
+        path.chmod(0o755)
+
+
+def export_dir(tree: TreeSystem, out: Path, workers: int) -> tuple[int, int]:
+    dirs = files = 0
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        futures = []
+        for p, x in walk(tree, tree.name):
+            if x.type == FileType.dir:
+                (out / p).mkdir(parents=True, exist_ok=True)
+                dirs += 1
+            else:
+                futures.append(pool.submit(write_file, out / p, x))
+                files += 1
+            # 不让等待写入的任务无限增长
+            if len(futures) >= workers * 4:
+                done, pending = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for x in done:
+                    x.result()
+                futures = list(pending)
+        for x in futures:
+            x.result()
+    return dirs, files
+
+
+def export_tar(tree: TreeSystem, out: Path) -> tuple[int, int]:
+    mode = "w|gz" if out.name.endswith((".tar.gz", ".tgz")) else "w|"
+    dirs = files = 0
+    mtime = time.time()
+    with tarfile.open(str(out), mode) as tar:
+        for p, x in walk(tree, tree.name):
+            info = tarfile.TarInfo(p)
+            info.mtime = mtime
+            if x.type == FileType.dir:
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                tar.addfile(info)
+                dirs += 1
+                continue
+            # 先算出大小, 再按块写入, 不需要把整个文件编码到内存中
+            info.size = sum(len(chunk) for chunk in encode(x))
+            info.mode = 0o755 if x.type == FileType.exe else 0o644
+            tar.addfile(info, io.BufferedReader(ChunkReader(encode(x))))
+            files += 1
+    return dirs, files
+
+
+def export(args: argparse.Namespace) -> int:
+    game = open_game(args)
+    game.load()
+    node = game.hosts.get(args.host)
+    if node is None:
+        console.print(f"[red]ERR[/] host {args.host} not exists.")
+        return 1
+    tree = node.lookup(node.abspath(args.path))
+    if tree is None:
+        console.print(f"[red]ERR[/] {args.path} not exists.")
+        return 1
+    out = Path(args.out)
+    st = time.perf_counter()
+    if out.name.endswith((".tar", ".tar.gz", ".tgz")):
+        dirs, files = export_tar(tree, out)
+    else:
+        dirs, files = export_dir(tree, out, args.workers)
+    console.print(f"exported {dirs} directories, {files} files in {time.perf_counter() - st:.2f}s.")
+    return 0
+
+
+parser = argparse.ArgumentParser(prog="nkgame", description="批量导入导出文件, 不带参数时启动游戏")
+parser.add_argument("--save", dest="save", help="存档文件, 默认是游戏自带的存档", default=None)
+commands = parser.add_subparsers(dest="command", required=True)
+
+import_args = commands.add_parser("import", description="把真实的目录导入到主机, 下次启动时合并进存档")
+import_args.add_argument("host", help="主机名或 ip")
+import_args.add_argument("source", help="真实的目录")
+import_args.add_argument("target", help="主机上的目标目录", nargs="?", default="/")
+import_args.add_argument("-j", "--workers", dest="workers", help="线程数", type=int, default=8)
+import_args.add_argument("--max-size", dest="max_size", help="跳过大于这个大小的文件, MB", type=int, default=64)
+import_args.add_argument("--buffer", dest="buffer", help="同时读取的文件总大小的上限, MB", type=int, default=64)
+import_args.set_defaults(func=import_dir)
+
+export_args = commands.add_parser("export", description="把主机上的目录导出到真实的目录或 tar 文件")
+export_args.add_argument("host", help="主机名或 ip")
+export_args.add_argument("out", help="输出目录, 或者 .tar/.tar.gz 文件")
+export_args.add_argument("path", help="主机上的路径", nargs="?", default="/")
+export_args.add_argument("-j", "--workers", dest="workers", help="线程数", type=int, default=8)
+export_args.set_defaults(func=export)
+
+
+def main(argv: list[str]) -> int:
+    args = parser.parse_args(argv)
+    return args.func(args)
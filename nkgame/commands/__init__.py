@@ -1,15 +1,33 @@
-import shlex
+import re
 
-from .base import Command, ArgumentParser, MissCommand, ShellContinue, ShellBreak
+from .base import Command, ShellContinue, ShellBreak, parse
 
 from .console import name as _
 from .chatgpt import name as _
+from .jobs import name as _, Job
+from .stats import name as _
+from .network import name as _
+from .transfer import name as _
+from .process import name as _
+from .files import name as _
+from .snapshot import name as _
+from .script import name as _
+from .scores import name as _
+
+pager_regex = re.compile(r"\|\s*(less|more)\s*$")
 
 
 async def shell(session, status):
+    # 会话期间主机的文件系统不会被换出
+    with status.pinned():
+        await _shell(session, status)
+
+
+async def _shell(session, status):
     while True:
         try:
             Command.status = status
+            Job.reap(status)
             result = await session.prompt_async(
                 f"[{status.name}@{status.host} {'/'.join(status.path)}] # ",
                 completer=Command.completer,
@@ -20,20 +38,31 @@ async def shell(session, status):
 
             if not result:
                 continue
+
+            # 以 & 结尾的命令作为后台任务执行
+            background = result.endswith("&") and not result.endswith("&&")
+            if background:
+                result = result[:-1].rstrip()
+
+            # 只支持把输出交给分页器, 即命令的 --page 参数
+            pager = pager_regex.search(result)
+            if pager:
+                result = result[:pager.start()].rstrip()
+
             try:
-                cmd, *args = shlex.split(result)
-            except Exception as e:
-                status.console.print(f"[red]ERR[/] error: command format error: {e}")
-                continue
-            c = Command.commands.get(cmd, MissCommand)
-            if c.args is None:
-                c.args = ArgumentParser()
-            try:
-                nargs, v = c.args.parse_known_args(args)
-                if v:
-                    status.console.print(f"[red]ERR[/] args error: [red]{''.join(v)}[/]")
+                parsed = parse(status, result)
+                if parsed is None:
+                    continue
+                c, nargs = parsed
+                if pager:
+                    if not hasattr(nargs, "page"):
+                        status.console.print(f"[red]ERR[/] {c.name} does not support pager.")
+                        continue
+                    nargs.page = True
+                if background:
+                    Job.start(status, result, c, nargs)
                     continue
-                await c(status).run(nargs)
+                await c.execute(status, nargs)
             except ShellContinue:
                 continue
             except ShellBreak:
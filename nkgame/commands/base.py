@@ -1,5 +1,6 @@
 import argparse
 import abc
+import time
 
 try:
     import termios
@@ -8,11 +9,15 @@ except ImportError:
     # TODO
     pass
 
+from collections.abc import Mapping
 from typing import Union, Any
 
 from prompt_toolkit.completion import NestedCompleter
 
+from nkgame import metrics
+from nkgame.commands import expansion
 from nkgame.commands.status import HostNode
+from nkgame.game.player import Process
 
 
 class ArgumentParser(argparse.ArgumentParser):
@@ -32,6 +37,12 @@ class Command(metaclass=abc.ABCMeta):
     name: str = ""
     words: Union[str, dict] = ""
 
+    # 需要独占终端的命令, 不能放到后台执行
+    interactive: bool = False
+    # 作为后台任务运行时占用的主机负载和内存
+    load: int = 5
+    memory: int = 4
+
     def __init_subclass__(cls, **kwargs):
         if isinstance(cls.words, str):
             cls.completer.options[cls.words] = None
@@ -43,11 +54,78 @@ class Command(metaclass=abc.ABCMeta):
 
     def __init__(self, status: HostNode):
         self.status = status
+        # 命令的结果, 0 是成功, 脚本中是 $?, 条件和 && || 按它判断
+        self.code = 0
+
+    def error(self, message: str):
+        """输出错误, 命令的结果记为失败"""
+        self.code = 1
+        self.status.console.print(f"[red]ERR[/] {message}")
+
+    @classmethod
+    def is_interactive(cls, args: argparse.Namespace) -> bool:
+        """使用这些参数执行时是否需要占用终端, 需要的命令不能在后台执行"""
+        return cls.interactive
 
     @abc.abstractmethod
     async def run(self, args: argparse.Namespace):
         raise NotImplementedError()
 
+    @classmethod
+    async def execute(cls, status: HostNode, args: argparse.Namespace, process: Process = None) -> int:
+        """
+        执行命令, 并记录次数和耗时, 返回命令的结果, 0 是成功
+        命令执行期间作为主机上的进程占用负载和内存, 前台命令不检查剩余资源
+        """
+        if process is None:
+            process = status.player.spawn(cls.name, cls.load, cls.memory, force=True)
+        metrics.command_total.inc(command=cls.name)
+        if status.game is not None:
+            status.game.cache.lookup(status)
+        st = time.perf_counter()
+        command = cls(status)
+        try:
+            await command.run(args)
+            return command.code
+        except (ShellContinue, ShellBreak):
+            raise
+        except BaseException:
+            metrics.command_errors.inc(command=cls.name)
+            raise
+        finally:
+            process.exit()
+            metrics.command_seconds.observe(time.perf_counter() - st, command=cls.name)
+
+
+def parse(status: HostNode, line: str, env: Mapping = None) -> Union[None, tuple[type[Command], argparse.Namespace]]:
+    """
+    展开并解析一行命令, 返回命令和参数, 出错时输出错误并返回 None, 展开见 nkgame.commands.expansion.
+    带路径的命令名 (如 ./run.sh, lib/v1.sh) 作为脚本执行, 见 nkgame.commands.script
+    """
+    try:
+        argv = list(expansion.expand(status, line, env))
+    except ValueError as e:
+        status.console.print(f"[red]ERR[/] error: command format error: {e}")
+        return None
+    return parse_argv(status, argv)
+
+
+def parse_argv(status: HostNode, argv: list[str]) -> Union[None, tuple[type[Command], argparse.Namespace]]:
+    """解析已经展开的参数, 第一个是命令名"""
+    if not argv:
+        return None
+    cmd, *args = argv
+    if "/" in cmd:
+        cmd, args = "sh", ["--exec", cmd, *args]
+    c = Command.commands.get(cmd, MissCommand)
+    if c.args is None:
+        c.args = ArgumentParser()
+    nargs, v = c.args.parse_known_args(args)
+    if v:
+        status.console.print(f"[red]ERR[/] args error: [red]{' '.join(v)}[/]")
+        return None
+    return c, nargs
+
 
 class ShellContinue(Exception):
     pass
@@ -62,4 +140,4 @@ class MissCommand(Command):
     words = None
 
     async def run(self, args: argparse.Namespace):
-        self.status.console.print("[red]ERR[/] miss command.")
+        self.error("miss command.")
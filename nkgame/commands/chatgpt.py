@@ -1,27 +1,185 @@
 import argparse
-
+import asyncio
+import hashlib
+import json
 import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+
 import openai
 from rich.live import Live
 from rich.markdown import Markdown
 
+import nkgame
 from .base import Command, ArgumentParser
 
 
+class MarkdownStream:
+    """
+    流式 Markdown 渲染
+    已经结束的块 (空行分隔, 代码块内除外) 只解析并打印一次, Live 中只重绘末尾未结束的块,
+    并且按 Live 的刷新频率合并更新, 每个 token 的开销与回复总长度无关
+    """
+
+    fence_regex = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+
+    def __init__(self, live: Live, render, refresh_per_second: float = 5):
+        self.live = live
+        self.render = render
+        self.interval = 1 / refresh_per_second
+        # 末尾未结束的块, 以及其中已经扫描过的位置
+        self.block = ""
+        self.scanned = 0
+        # 当前所在代码块的围栏, 不在代码块中为 None
+        self.fence = None
+        self.last_update = 0.0
+        self.dirty = False
+
+    def feed(self, text: str):
+        self.block += text
+        self.dirty = True
+        while True:
+            i = self.block.find("\n", self.scanned)
+            if i < 0:
+                break
+            line = self.block[self.scanned:i]
+            self.scanned = i + 1
+            m = self.fence_regex.match(line)
+            if m:
+                if self.fence is None:
+                    self.fence = m.group(1)
+                elif m.group(1).startswith(self.fence) and not line.strip(m.group(1)[0] + " "):
+                    self.fence = None
+            elif self.fence is None and not line.strip() and self.block[:i].strip():
+                self.freeze(self.block[:self.scanned])
+        self.refresh()
+
+    def freeze(self, text: str):
+        """打印已经结束的块, 之后不再重绘"""
+        self.block = self.block[self.scanned:]
+        self.scanned = 0
+        self.live.console.print(self.render(text.rstrip()))
+        self.live.update(self.render(""))
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not self.dirty or (not force and now - self.last_update < self.interval):
+            return
+        self.live.update(self.render(self.block), refresh=force)
+        self.last_update = now
+        self.dirty = False
+
+    def close(self):
+        self.refresh(force=True)
+
+
+class ResponseCache:
+    """
+    对话回复的本地缓存, 存放在 sqlite 文件中
+    key 为 模型 + 规整后的消息历史 的哈希, 超过容量时按最近使用时间淘汰, 超过 ttl 的记录视为失效
+    """
+
+    def __init__(self, path: Path, max_bytes: int = 8 * 1024 * 1024, ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._db = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            with self._db:
+                self._db.execute(
+                    "create table if not exists responses ("
+                    "key text primary key, role text, content text, size integer, created real, used real)"
+                )
+                self._db.execute("create index if not exists responses_used on responses (used)")
+        return self._db
+
+    @staticmethod
+    def make_key(model: str, messages: list[dict]) -> str:
+        history = [(x["role"], " ".join(x["content"].split())) for x in messages]
+        return hashlib.sha256(json.dumps([model, history], ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        row = self.db.execute("select role, content, created from responses where key = ?", (key,)).fetchone()
+        if row is None or now - row[2] > self.ttl:
+            self.misses += 1
+            return None
+        with self.db:
+            self.db.execute("update responses set used = ? where key = ?", (now, key))
+        self.hits += 1
+        return row[0], row[1]
+
+    def put(self, key: str, role: str, content: str):
+        size = len(content.encode())
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "insert or replace into responses values (?, ?, ?, ?, ?, ?)", (key, role, content, size, now, now)
+            )
+            self.evictions += self.db.execute("delete from responses where created < ?", (now - self.ttl,)).rowcount
+            total = self.size()
+            if total <= self.max_bytes:
+                return
+            expired = []
+            for k, s in self.db.execute("select key, size from responses order by used"):
+                if total <= self.max_bytes:
+                    break
+                expired.append((k,))
+                total -= s
+            self.db.executemany("delete from responses where key = ?", expired)
+            self.evictions += len(expired)
+
+    def size(self) -> int:
+        return self.db.execute("select coalesce(sum(size), 0) from responses").fetchone()[0]
+
+    def count(self) -> int:
+        return self.db.execute("select count(*) from responses").fetchone()[0]
+
+
 class ChatGPT(Command):
     name = "chatgpt"
     words = "chatgpt"
+    interactive = True
 
     args = ArgumentParser(prog="chatgpt", usage="chatgpt", description="开始一个对话机器人", epilog="")
     args.add_argument("--model", help="使用的模型", default="gpt-3.5-turbo")
 
     args.add_argument("--key", help="OpenAI API Key", default=os.getenv("OPENAI_API_KEY"))
+    args.add_argument("--cache", help="使用本地回复缓存", action="store_true")
+    args.add_argument("--rate", help="缓存回复的输出速度 (字/秒)", default=200, type=float)
+    args.add_argument("--stats", help="显示缓存命中统计", action="store_true")
+
+    cache = ResponseCache(Path(nkgame.__file__).parent / 'chatgpt.cache')
 
     def __init__(self, status):
         super().__init__(status)
         self.role = self.name
 
+    # 流式输出的刷新频率
+    refresh_per = 5
+
     async def run(self, args: argparse.Namespace):
+        if args.stats:
+            c = self.cache
+            self.status.console.print(
+                f"cache: hit {c.hits}  miss {c.misses}  evict {c.evictions}  "
+                f"entries {c.count()}  size {c.size()}/{c.max_bytes}"
+            )
+            return
+        if not args.rate > 0:
+            self.error("rate must be positive.")
+            return
 
         openai.api_key = args.key
 
@@ -40,22 +198,28 @@ class ChatGPT(Command):
 
                 messages.append({"role": "user", "content": query})
 
-                response = openai.ChatCompletion.create(
-                    stream=True, model=args.model, messages=messages
-                )
+                key = args.cache and self.cache.make_key(args.model, messages)
+                cached = key and self.cache.get(key)
+                if cached:
+                    response = self.replay(*cached, rate=args.rate)
+                else:
+                    response = self.request(args.model, messages)
 
                 result = ""
-                with Live(await self.next_frame(result), refresh_per_second=5) as live:
-                    for line in response:
-                        if line["choices"][0]["finish_reason"] == "stop":
-                            break
-                        delta = line["choices"][0]["delta"]
-                        if delta.get("role"):
-                            self.role = delta["role"]
-                        if delta.get("content"):
-                            result += delta["content"]
-                            messages.append({"role": self.role, "content": delta["content"]})
-                        live.update(await self.next_frame(result))
+                with Live(self.next_frame(result), refresh_per_second=self.refresh_per) as live:
+                    stream = MarkdownStream(live, self.next_frame, self.refresh_per)
+                    async for role, content in response:
+                        if role:
+                            self.role = role
+                        if content:
+                            if not result:
+                                stream.feed(f"*{self.role}*: ")
+                            result += content
+                            stream.feed(content)
+                    stream.close()
+                messages.append({"role": self.role, "content": result})
+                if key and not cached and result:
+                    self.cache.put(key, self.role, result)
             except openai.error.RateLimitError:
                 self.status.console.print("Rate limit or maximum monthly limit exceeded", style="bold red")
                 break
@@ -68,8 +232,29 @@ class ChatGPT(Command):
                 self.status.console.print(e)
                 break
 
-    async def next_frame(self, text):
-        return Markdown(f"*{self.role}*: {text}")
+    @staticmethod
+    async def request(model, messages):
+        response = openai.ChatCompletion.create(
+            stream=True, model=model, messages=messages
+        )
+        for line in response:
+            if line["choices"][0]["finish_reason"] == "stop":
+                break
+            delta = line["choices"][0]["delta"]
+            yield delta.get("role"), delta.get("content")
+
+    chunk_regex = re.compile(r"\S+\s*|\s+")
+
+    @classmethod
+    async def replay(cls, role, content, rate):
+        """按照指定速度模拟流式输出缓存的回复"""
+        yield role, None
+        for m in cls.chunk_regex.finditer(content):
+            await asyncio.sleep(len(m.group()) / rate)
+            yield None, m.group()
+
+    def next_frame(self, text):
+        return Markdown(text)
 
 
 name = "chatgpt"
@@ -3,6 +3,7 @@ import argparse
 import asyncio
 import json
 from pathlib import Path
+from typing import Callable, Union
 
 try:
     import termios
@@ -20,15 +21,19 @@ from pyvim.io.base import EditorIO
 from pyvim.commands.handler import handle_command
 
 import nkgame
-from nkgame.commands.status import HostNode, TreeSystem
+from nkgame.commands.status import HostNode, TreeSystem, READ, WRITE, EXEC
 from nkgame.pb.game_status_pb2 import FileType
 from rich.live import Live
 from rich.panel import Panel
+from rich.segment import Segment, Segments
+from rich.style import Style as RichStyle
 from rich.text import Text
 
 from nkgame.game.game_base import Game
 
 from .base import Command, ArgumentParser, ShellContinue, ShellBreak
+from .pager import Pager
+from .expression import engine, ExpressionError
 
 
 class HelpCommand(Command):
@@ -52,6 +57,7 @@ class HelpCommand(Command):
 class ExitCommand(Command):
     name = "exit"
     words = "exit"
+    interactive = True
 
     dialog_style = Style.from_dict({
         'dialog': 'bg:#000000',
@@ -81,24 +87,94 @@ class PwdCommand(Command):
         self.status.console.print("/" + "/".join(self.status.path))
 
 
+class TextBuilder:
+    """
+    逐段拼接带样式的文本, 直接生成 rich 的 Segment, 输出时不需要再经过 Text 的换行和拆分
+    """
+
+    styles: dict[str, RichStyle] = {}
+
+    def __init__(self):
+        self.segments: list[Segment] = []
+
+    def append(self, text: str, style: str = None):
+        if style is not None:
+            s = self.styles.get(style)
+            if s is None:
+                s = self.styles[style] = RichStyle.parse(style)
+            self.segments.append(Segment(text, s))
+        else:
+            self.segments.append(Segment(text))
+
+    def build(self) -> Segments:
+        return Segments(self.segments)
+
+
 class LsCommand(Command):
     name = "ls"
     words = "ls"
 
     args = ArgumentParser(prog="ls", usage="ls", description="显示目录下内容", epilog="")
     args.add_argument("-l", "--long", help="显示详细信息", action="store_true")
+    args.add_argument("-p", "--page", help="分页显示, 同 ls | less", action="store_true")
+
+    # 每次输出的行数, 大目录分批输出
+    batch_size = 1000
+
+    @classmethod
+    def is_interactive(cls, args: argparse.Namespace) -> bool:
+        return args.page
+
+    @staticmethod
+    def long_line(x: TreeSystem, line: TextBuilder):
+        # 类型只有一位, 直接补齐到 8 列, 和制表符的效果相同, 避免 rich 展开制表符
+        line.append(f"{x.type:<8}")
+        line.append(x.name, x.color)
+        line.append(
+            f"{' ' * (20 - x.width)}{0 if x.type == FileType.dir else x.size:<10}"
+            f"{x.mode_string}  {x.effective_owner or '-'}"
+        )
+
+    def lines(self, data: list[TreeSystem], long: bool) -> tuple[int, Callable[[int, TextBuilder], None]]:
+        """返回行数和输出第 i 行的函数"""
+        if long:
+            return len(data), lambda i, line: self.long_line(data[i], line)
+
+        # 按最长的名称分列, 名称宽度在节点上缓存
+        column = max((x.width for x in data), default=0) + 4
+        cols = max(self.status.console.width // column, 1)
+
+        def short_line(i: int, line: TextBuilder):
+            row = data[i * cols:(i + 1) * cols]
+            for x in row[:-1]:
+                line.append(x.name, x.color)
+                line.append(" " * (column - x.width))
+            line.append(row[-1].name, row[-1].color)
+
+        return (len(data) + cols - 1) // cols, short_line
 
     async def run(self, args: argparse.Namespace):
-        values = self.status.file_sys.find(self.status.path[1:]).sub
-        data = sorted(values, key=lambda x: (x.type, x.name))
-        if not args.long:
-            self.status.console.print("     ".join(str(x) for x in data))
+        tree = self.status.lookup(self.status.path)
+        if not self.status.can(tree, READ):
+            self.error("permission denied.")
             return
-        for x in data:
-            self.status.console.print(
-                f"{x.type:<5}\t{x:<20}{len(x.data) if data else 0:<10}"
-                f"{x.readable and 'r' or '-'}{x.writable and 'w' or '-'}{x.executable and 'x' or '-'}"
-            )
+        # 子节点在加入时已经排好序, 只显示可以看到的
+        data = self.status.listdir(tree)
+        count, write = self.lines(data, args.long)
+        if args.page:
+            def line(i):
+                r = TextBuilder()
+                write(i, r)
+                r.append("\n")
+                return r.build()
+            await Pager(count, line, title="/" + "/".join(self.status.path)).run()
+            return
+        for i in range(0, count, self.batch_size):
+            batch = TextBuilder()
+            for j in range(i, min(i + self.batch_size, count)):
+                write(j, batch)
+                batch.append("\n")
+            self.status.console.print(batch.build())
 
 
 class CdCommand(Command):
@@ -106,7 +182,7 @@ class CdCommand(Command):
 
         def get_completions(self, document, complete_event):
             self.words = ["~", ".."] + [
-                x.name for x in Command.status.file_sys.find(Command.status.path[1:]).sub if x.type == FileType.dir
+                x.name for x in Command.status.listdir() if x.type == FileType.dir and Command.status.can(x, EXEC)
             ]
             return super().get_completions(document, complete_event)
 
@@ -118,29 +194,13 @@ class CdCommand(Command):
 
     async def run(self, args: argparse.Namespace):
 
-        if args.path == "~":
-            self.status.path = self.status.path[:1]
-            return
-
-        result = self.status.path[:]
-
-        path_list = args.path.strip().split("/")
-
-        if args.path.startswith("/"):
-            result = path_list
-        else:
-            for path in path_list:
-                if path == "..":
-                    if len(result) <= 1:
-                        continue
-                    result.pop()
-                elif path == ".":
-                    pass
-                else:
-                    result.append(path)
-        t = self.status.file_sys.find(result[1:])
+        result = self.status.abspath(args.path)
+        t = self.status.lookup(result)
         if t is None or t.type != FileType.dir:
-            self.status.console.print("[red]ERR[/] directory not found.")
+            self.error("directory not found.")
+            return
+        if not self.status.can(t, EXEC):
+            self.error(f"{args.path} permission denied.")
             return
         self.status.path = result
 
@@ -158,10 +218,13 @@ class MkdirCommand(Command):
         n = args.path
 
         if n in cur.index:
-            self.status.console.print("[red]ERR[/] directory already exists.")
+            self.error("directory already exists.")
+            return
+        if not self.status.can(cur, WRITE):
+            self.error("permission denied.")
             return
 
-        cur.add(TreeSystem(n, FileType.dir))
+        cur.add(self.status.adopt(cur, TreeSystem(n, FileType.dir)))
         self.status.game.save()
 
 
@@ -170,26 +233,30 @@ class OpenCommand(Command):
 
         def get_completions(self, document, complete_event):
             self.words = [
-                x.name for x in Command.status.file_sys.find(Command.status.path[1:]).sub if x.type != FileType.dir
+                x.name for x in Command.status.listdir() if x.type != FileType.dir and Command.status.can(x, READ)
             ]
             return super().get_completions(document, complete_event)
 
     name = "open"
     words = {"open": FileCompleter([])}
 
-    args = ArgumentParser(prog="open", usage="open xxx.txt", description="打开一个文件", epilog="")
-    args.add_argument("file", help="文件路径")
+    args = ArgumentParser(prog="open", usage="open xxx.txt, open lib/*.sh", description="打开文件", epilog="")
+    args.add_argument("files", help="文件路径", nargs="+")
 
     async def run(self, args: argparse.Namespace):
-        p: TreeSystem = self.status.file_sys.find(self.status.path[1:]).index.get(args.file)
-        if p is None or p.type == FileType.dir:
-            self.status.console.print(f"[red]ERR[/] {args.file} not can open.")
-            return
+        for file in args.files:
+            p: TreeSystem = self.status.lookup(self.status.abspath(file))
+            if p is None or p.type == FileType.dir:
+                self.error(f"{file} not can open.")
+                continue
+            if not self.status.can(p, READ):
+                self.error(f"{file} permission denied.")
+                continue
 
-        if p.type == FileType.bin:
-            self.status.console.print(json.loads(p.data))
-            return
-        self.status.console.print(p.data)
+            if p.type == FileType.bin:
+                self.status.console.print(json.loads(p.data))
+                continue
+            self.status.console.print(p.data)
 
 
 class SaveCommand(Command):
@@ -211,6 +278,8 @@ class LoadCommand(Command):
 class PlayCommand(Command):
     name = "play"
     words = {"play": WordCompleter(["awake"])}
+    load = 20
+    memory = 16
 
     args = ArgumentParser(prog="play", usage="play awake", description="播放动画", epilog="")
     args.add_argument("name", help="动画名称")
@@ -227,13 +296,13 @@ class PlayCommand(Command):
         asyncio.create_task(self.stop(args.time))
         i = 0
         while self.is_run:
-            print('\033c' + res[i])
+            print('\033c' + res[i], file=self.status.console.file)
             i += 1
             if i >= len(res):
                 await asyncio.sleep(0.5)
                 i = 0
             await asyncio.sleep(0.1)
-        print("\033c", end="")
+        print("\033c", end="", file=self.status.console.file)
 
     async def stop(self, t):
         await asyncio.sleep(t)
@@ -249,60 +318,93 @@ class HostnameCommand(Command):
 
     async def run(self, args: argparse.Namespace):
         if args.name in self.status.game.hosts:
-            self.status.console.print("[red]ERR[/] hostname already exists.")
+            self.error("hostname already exists.")
             return
-        self.status.host = args.name
+        self.status.game.hosts.rename(self.status.host, args.name)
         self.status.game.save()
 
 
 class VimOpenError(Exception):
     def __init__(self, msg):
+        super().__init__(msg)
         self.msg = msg
 
 
 class VFileIO(EditorIO):
     """
-    虚拟文件接口
+    虚拟文件接口, 每个编辑会话一个. 打开过的文件缓存在 buffers 中, 不需要每次重新查找;
+    保存时只把内容有变化的文件写入增量存档, 不重写整个存档
     """
 
     def __init__(self, status: HostNode):
         self.status = status
+        # 路径 (相对于当前目录或绝对路径) -> 文件
+        self.buffers: dict[str, TreeSystem] = {}
+        # 本次会话修改过的文件
+        self.dirty: dict[int, TreeSystem] = {}
 
     def can_open_location(self, location):
         return True
 
+    def resolve(self, location) -> Union[None, TreeSystem]:
+        f = self.buffers.get(location)
+        if f is not None:
+            # 文件或者所在的目录可能已经被删除
+            root = f
+            while root.parent is not None:
+                root = root.parent
+            if root is self.status.file_sys:
+                return f
+            self.buffers.pop(location)
+        f = self.status.lookup(self.status.abspath(location))
+        if f is not None:
+            self.buffers[location] = f
+        return f
+
     def exists(self, location):
-        self.status.console.print("exists", location)
-        p: TreeSystem = self.status.file_sys.find(self.status.path[1:]).index.get(location)
-        if p is None:
+        f = self.resolve(location)
+        if f is None:
             return False
-
-        self.status.console.print("exists", p)
-
-        if p.type != FileType.txt:
+        if f.type != FileType.txt:
             raise VimOpenError("文件不是文本类型")
-
         return True
 
     def read(self, location):
-        p: TreeSystem = self.status.file_sys.find(self.status.path[1:]).index.get(location)
-        if p is None:
+        f = self.resolve(location)
+        if f is None:
             return "", "utf-8"
-        if p.type == FileType.txt:
-            return p.data, "utf-8"
+        if not self.status.can(f, READ):
+            raise VimOpenError("没有读取权限")
+        if f.type == FileType.txt:
+            return f.data or "", "utf-8"
         raise VimOpenError("读取文件失败")
 
     def write(self, location, data, encoding='utf-8'):
-        d = self.status.file_sys.find(self.status.path[1:])
-        if location in d.index:
-            f = d.index.get(location)
-            if f.type != FileType.txt:
-                raise VimOpenError("文件不是文本类型")
-            f.data = data
-            f.type = FileType.txt
-        else:
-            d.add(TreeSystem(location, FileType.txt, data))
-        self.status.game.save()
+        f = self.resolve(location)
+        if f is None:
+            path = self.status.abspath(location)
+            parent = self.status.lookup(path[:-1])
+            if len(path) < 2 or parent is None or parent.type != FileType.dir:
+                raise VimOpenError(f"{location} 所在的目录不存在")
+            if not self.status.can(parent, WRITE):
+                raise VimOpenError("没有写入权限")
+            f = self.status.adopt(parent, TreeSystem(path[-1], FileType.txt, data))
+            parent.add(f)
+            self.buffers[location] = f
+        elif f.type != FileType.txt:
+            raise VimOpenError("文件不是文本类型")
+        elif not self.status.can(f, WRITE):
+            raise VimOpenError("没有写入权限")
+        elif not f.update(data):
+            return
+        self.dirty[id(f)] = f
+        self.status.save_file(f)
+
+    def close(self):
+        """退出编辑器时把还没有写入磁盘的修改立即写入"""
+        if self.dirty:
+            self.status.game.journal.flush()
+            self.dirty.clear()
 
 
 class VimCommand(Command):
@@ -310,20 +412,22 @@ class VimCommand(Command):
 
         def get_completions(self, document, complete_event):
             self.words = [
-                x.name for x in Command.status.file_sys.find(Command.status.path[1:]).sub if x.type == FileType.txt
+                x.name for x in Command.status.listdir() if x.type == FileType.txt and Command.status.can(x, READ)
             ]
             return super().get_completions(document, complete_event)
 
     name = "vim"
     words = {"vim": FileCompleter([])}
+    interactive = True
 
     args = ArgumentParser(prog="vim", usage="vim file.txt", description="编辑文件", epilog="")
     args.add_argument("-f", "--file", help="文件名", default=None, required=False)
 
     async def run(self, args: argparse.Namespace):
         editor = Editor()
-        editor.load_initial_files([args.file], in_tab_pages=True)
-        editor.io_backends = [VFileIO(self.status)]
+        io = VFileIO(self.status)
+        # 先替换读写接口, 打开文件时就会读取
+        editor.io_backends = [io]
 
         def handle_action(buff):
             """ When enter is pressed in the Vi command line. """
@@ -338,35 +442,40 @@ class VimCommand(Command):
 
         editor.command_buffer.accept_handler = handle_action
         try:
+            editor.load_initial_files([args.file], in_tab_pages=True)
             await editor.application.run_async()
         except VimOpenError as e:
-            self.status.console.print(f"[red]ERR[/] open file err: {e.msg}")
+            self.error(f"open file err: {e.msg}")
+        finally:
+            io.close()
 
 
 class RmCommand(Command):
     name = "rm"
     words = "rm"
 
-    args = ArgumentParser(prog="rm", usage="rm file.txt", description="删除文件", epilog="")
-    args.add_argument("file", help="文件名")
+    args = ArgumentParser(prog="rm", usage="rm file.txt, rm *.txt", description="删除文件", epilog="")
+    args.add_argument("files", help="文件名", nargs="+")
     args.add_argument("-r", "--recursive", help="递归删除", action="store_true")
 
     async def run(self, args: argparse.Namespace):
-        ps = args.file.split("/")
-        if args.file.startswith("/"):
-            tree = self.status.file_sys.find(ps)
-        else:
-            tree = self.status.file_sys.find(self.status.path[1:]).find(ps)
-        if tree is None:
-            self.status.console.print(f"[red]ERR[/] file {args.file} not exists.")
-            return
-        if tree.type == FileType.dir:
-            if not args.recursive:
-                self.status.console.print(f"[red]ERR[/] {args.file} is dir.")
-                return
-        tree.parent.sub.remove(tree)
-        tree.parent.index.pop(tree.name)
-        self.status.game.save()
+        removed = False
+        for file in args.files:
+            path = self.status.abspath(file)
+            tree = self.status.lookup(path)
+            if tree is None or len(path) < 2:
+                self.error(f"file {file} not exists.")
+                continue
+            if tree.type == FileType.dir and not args.recursive:
+                self.error(f"{file} is dir.")
+                continue
+            if not self.status.can(tree.parent, WRITE):
+                self.error(f"{file} permission denied.")
+                continue
+            tree.parent.remove(tree)
+            removed = True
+        if removed:
+            self.status.game.save()
 
 
 class PyEvalCommand(Command):
@@ -381,27 +490,40 @@ class PyEvalCommand(Command):
 
     async def run(self, args: argparse.Namespace):
         try:
-            result = eval(args.exp, self.status.env)
+            result = await engine.evaluate(args.exp, self.status.env)
             self.status.console.print(f'{result}')
+        except ExpressionError as e:
+            self.error(f"{e}")
+            return
         except Exception as e:
-            self.status.console.print(f"error: {e}")
+            self.error(f"error: {e}")
             return
         if args.out:
             self.status.env[args.out] = result
         if args.file:
             d = self.status.file_sys.find(self.status.path[1:])
-            if args.file in d.index:
-                f = d.index.get(args.file)
-                f.data = json.dumps(result)
+            f = d.index.get(args.file)
+            if not self.status.can(d if f is None else f, WRITE):
+                self.error(f"{args.file} permission denied.")
+                return
+            if f is not None and f.type == FileType.dir:
+                self.error(f"{args.file} is a directory.")
+                return
+            if f is not None:
+                # 类型是父目录排序键的一部分, 先移除再加回, 同时更新统计和缓存
+                d.remove(f)
                 f.type = FileType.bin
+                f.data = json.dumps(result)
+                d.add(f)
             else:
-                d.add(TreeSystem(args.file, FileType.bin, json.dumps(result)))
+                d.add(self.status.adopt(d, TreeSystem(args.file, FileType.bin, json.dumps(result))))
             self.status.game.save()
 
 
 class SelectCommand(Command):
     name = "select"
     words = "select"
+    interactive = True
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -462,6 +584,7 @@ class SshCommand(Command):
 
     name = "ssh"
     words = {"ssh": HostCompleter([])}
+    interactive = True
 
     args = ArgumentParser(prog="ssh", usage="ssh 192.168.0.1", description="登录远程节点", epilog="")
     args.add_argument("host", help="远程地址")
@@ -469,7 +592,7 @@ class SshCommand(Command):
 
     async def run(self, args: argparse.Namespace):
         if args.host not in self.status.game.hosts and args.create == "":
-            self.status.console.print(f"[red]ERR[/] host [steel_blue]{args.host}[/] not exists.")
+            self.error(f"host [steel_blue]{args.host}[/] not exists.")
             return
 
         if args.create:
@@ -482,8 +605,12 @@ class SshCommand(Command):
         session = PromptSession(f"ssh {args.host}")
         status = self.status.game.hosts.get(args.host)
         if status is None:
-            self.status.console.print(f"[red]ERR[/] host [steel_blue]{args.host}[/] not exists.")
+            self.error(f"host [steel_blue]{args.host}[/] not exists.")
             return
+        # 模拟建立连接的网络延迟
+        route = self.status.game.route(self.status.host, args.host)
+        if route is not None:
+            await asyncio.sleep(2 * route.latency / 1000)
         from . import shell
         await shell(session, status)
 
@@ -491,6 +618,7 @@ class SshCommand(Command):
 class GameCommand(Command):
     name = "game"
     words = {"game": WordCompleter(list(Game.games.keys()))}
+    interactive = True
 
     args = ArgumentParser(prog="game", usage="game fk", description="选择小游戏", epilog="")
     args.add_argument("name", help="小游戏名")
@@ -498,7 +626,7 @@ class GameCommand(Command):
     async def run(self, args: argparse.Namespace):
         game = Game.games.get(args.name)
         if game is None:
-            self.status.console.print(f"[red]ERR[/] game {args.name} not exists.")
+            self.error(f"game {args.name} not exists.")
             return
         await game(self.status).run()
 
@@ -0,0 +1,335 @@
+"""
+命令行展开
+
+一行命令先按空白拆成单词 (引号中的空白不拆分), 每个单词依次:
+
+    大括号展开  a{1,2}.txt -> a1.txt a2.txt, v{1..3} -> v1 v2 v3
+    ~ 展开      开头的 ~ 换成 env 中的 HOME, 没有设置时是根目录 /
+    变量展开    $NAME ${NAME}, 从主机的 env 读取, 不在引号中的结果按空白拆成多个单词
+    路径展开    * ? [...] 匹配虚拟文件系统中的文件, 没有匹配时保持原样
+    去掉引号
+
+引号中的内容不做大括号和路径展开, 单引号中的内容也不做变量展开, \\ 转义下一个字符.
+通配符编译成的正则表达式按模式缓存; 大括号和路径展开都是生成器, 逐个目录匹配, 按需返回结果,
+不会先把整个目录或整个序列展开成列表
+"""
+import functools
+import re
+from collections.abc import Mapping
+from typing import Iterator, Optional, Union
+
+from nkgame.commands.status import HostNode, READ, VISIBLE
+from nkgame.pb.game_status_pb2 import FileType
+
+word_regex = re.compile(r"""(?:[^\s'"\\]|\\.?|'[^']*'|"(?:[^"\\]|\\.)*")+|(['"])""", re.S)
+var_regex = re.compile(r"\$(?:\{(\w+|[#?@])\}|(\w+|[#?@]))")
+plain_regex = re.compile(r"""[^\\'"$]+|\$""")
+sequence_regex = re.compile(r"^(-?\d+)\.\.(-?\d+)(?:\.\.(-?\d+))?$|^([a-zA-Z])\.\.([a-zA-Z])$")
+magic_regex = re.compile(r"[*?\[]")
+
+# 一个单词展开后的片段: (文本, 是否按字面匹配), 引号中和转义的内容按字面匹配, 不做路径展开
+Piece = tuple[str, bool]
+
+
+def split(line: str) -> list[str]:
+    """按空白拆成单词, 保留引号和转义, 引号没有闭合时抛出 ValueError"""
+    result = []
+    for m in word_regex.finditer(line):
+        if m.group(1):
+            raise ValueError("No closing quotation")
+        result.append(m.group())
+    return result
+
+
+def _unquoted(word: str) -> Iterator[tuple[int, str]]:
+    """单词中不在引号中, 没有转义的字符和位置, ${NAME} 整个跳过"""
+    i = 0
+    while i < len(word):
+        c = word[i]
+        if c == "\\":
+            i += 2
+        elif c == "'":
+            i = word.index("'", i + 1) + 1
+        elif c == '"':
+            i += 1
+            while word[i] != '"':
+                i += 2 if word[i] == "\\" else 1
+            i += 1
+        elif c == "$" and word.startswith("{", i + 1) and "}" in word[i:]:
+            i = word.index("}", i) + 1
+        else:
+            yield i, c
+            i += 1
+
+
+def _sequence(body: str) -> Optional[Iterator[str]]:
+    """{1..10} {10..1..2} {01..10} {a..e}"""
+    m = sequence_regex.match(body)
+    if m is None:
+        return None
+    if m.group(4):
+        a, b = ord(m.group(4)), ord(m.group(5))
+        step = 1 if a <= b else -1
+        return (chr(x) for x in range(a, b + step, step))
+    first, last = m.group(1), m.group(2)
+    a, b = int(first), int(last)
+    step = abs(int(m.group(3) or 1)) or 1
+    if a > b:
+        step = -step
+    # 以 0 开头时补齐到相同的宽度
+    width = max(len(first), len(last)) if first.lstrip("-").startswith("0") or last.lstrip("-").startswith("0") else 0
+    return (str(x).zfill(width) for x in range(a, b + (1 if step > 0 else -1), step))
+
+
+def _brace(word: str) -> Optional[tuple[int, int, Iterator[str]]]:
+    """找到第一个可以展开的大括号, 返回起止位置和展开的内容"""
+    chars = list(_unquoted(word))
+    for k, (i, c) in enumerate(chars):
+        if c != "{":
+            continue
+        depth = 0
+        commas = []
+        for j, d in chars[k:]:
+            if d == "{":
+                depth += 1
+            elif d == "," and depth == 1:
+                commas.append(j)
+            elif d == "}":
+                depth -= 1
+                if depth > 0:
+                    continue
+                if commas:
+                    bounds = [i, *commas, j]
+                    return i, j + 1, (word[a + 1:b] for a, b in zip(bounds, bounds[1:]))
+                items = _sequence(word[i + 1:j])
+                if items is not None:
+                    return i, j + 1, items
+                break
+    return None
+
+
+def braces(word: str) -> Iterator[str]:
+    """大括号展开, 按从左到右的顺序逐个返回"""
+    found = _brace(word)
+    if found is None:
+        yield word
+        return
+    start, stop, items = found
+    head, tail = word[:start], word[stop:]
+    for item in items:
+        yield from braces(head + item + tail)
+
+
+def fields(word: str, env: Mapping) -> list[list[Piece]]:
+    """
+    ~ 和变量展开, 去掉引号, 返回展开后的各个单词.
+    env 中的值是列表时 (脚本的 $@) 每一项作为一个单词
+    """
+    if word in ('"$@"', '"${@}"') and isinstance(env.get("@"), list):
+        return [[(x, True)] for x in env["@"]]
+    result: list[list[Piece]] = [[]]
+
+    def value(m: re.Match) -> Union[str, list]:
+        v = env.get(m.group(1) or m.group(2), "")
+        return v if isinstance(v, list) else str(v)
+
+    i = 0
+    if word.startswith("~") and (len(word) == 1 or word[1] == "/"):
+        home = str(env.get("HOME") or "/")
+        result[-1].append((home.rstrip("/") if len(word) > 1 else home, True))
+        i = 1
+    while i < len(word):
+        c = word[i]
+        if c == "\\":
+            result[-1].append((word[i + 1:i + 2], True))
+            i += 2
+        elif c == "'":
+            j = word.index("'", i + 1)
+            result[-1].append((word[i + 1:j], True))
+            i = j + 1
+        elif c == '"':
+            i += 1
+            buf = []
+            while word[i] != '"':
+                m = var_regex.match(word, i)
+                if m:
+                    v = value(m)
+                    if isinstance(v, list):
+                        # "$@": 每个参数是一个单词
+                        for k, x in enumerate(v):
+                            if k:
+                                result[-1].append(("".join(buf), True))
+                                result.append([])
+                                buf = []
+                            buf.append(x)
+                    else:
+                        buf.append(v)
+                    i = m.end()
+                elif word[i] == "\\" and word[i + 1] in '$"\\`':
+                    buf.append(word[i + 1])
+                    i += 2
+                else:
+                    buf.append(word[i])
+                    i += 1
+            result[-1].append(("".join(buf), True))
+            i += 1
+        elif c == "$" and var_regex.match(word, i):
+            m = var_regex.match(word, i)
+            v = value(m)
+            # 不在引号中的结果按空白拆分
+            for k, part in enumerate(v if isinstance(v, list) else re.split(r"\s+", v) if v else []):
+                if k:
+                    result.append([])
+                if part:
+                    result[-1].append((part, False))
+            i = m.end()
+        else:
+            m = plain_regex.match(word, i)
+            result[-1].append((m.group(), False))
+            i = m.end()
+    return [x for x in result if x]
+
+
+@functools.lru_cache(maxsize=512)
+def compile_pattern(pattern: str) -> Optional[re.Pattern]:
+    """
+    把路径中的一段通配符编译成正则表达式, \\ 转义的字符按字面匹配.
+    没有通配符时返回 None
+    """
+    out = []
+    magic = False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        if c == "\\":
+            out.append(re.escape(pattern[i:i + 1]))
+            i += 1
+        elif c == "*":
+            out.append(".*")
+            magic = True
+        elif c == "?":
+            out.append(".")
+            magic = True
+        elif c == "[":
+            j = i
+            if j < len(pattern) and pattern[j] in "!^":
+                j += 1
+            if j < len(pattern) and pattern[j] == "]":
+                j += 1
+            while j < len(pattern) and pattern[j] != "]":
+                j += 1
+            if j >= len(pattern):
+                out.append(re.escape(c))
+                continue
+            body, i = pattern[i:j], j + 1
+            negate = body[:1] in ("!", "^")
+            if negate:
+                body = body[1:]
+            body = re.sub(r"([\\\[\]&~|^])", r"\\\1", body)
+            out.append(f"[{'^' if negate else ''}{body}]")
+            magic = True
+        else:
+            out.append(re.escape(c))
+    if not magic:
+        return None
+    return re.compile("".join(out) + r"\Z", re.S)
+
+
+def escape(s: str) -> str:
+    return re.sub(r"([\\*?\[])", r"\\\1", s)
+
+
+def unescape(s: str) -> str:
+    return re.sub(r"\\(.)", r"\1", s)
+
+
+def glob(status: HostNode, pattern: str) -> Iterator[str]:
+    """
+    在主机的文件系统中匹配路径, 相对路径从当前目录开始, 返回的路径保持输入的写法, 如 lib/v1.sh.
+    每层目录只匹配需要的部分, 按名称排序, 以 . 开头的文件只有模式也以 . 开头时才匹配, 看不到的文件不匹配
+    """
+    if pattern.startswith("/"):
+        return _glob(status, status.path[:1], "/", pattern.lstrip("/").split("/"))
+    return _glob(status, status.path[:], "", pattern.split("/"))
+
+
+def _glob(status: HostNode, path: list[str], shown: str, parts: list[str]) -> Iterator[str]:
+    part, rest = parts[0], parts[1:]
+    rx = compile_pattern(part)
+    if rx is None:
+        name = unescape(part)
+        if name == "..":
+            path = path[:-1] if len(path) > 1 else path
+        elif name not in ("", "."):
+            path = path + [name]
+        shown = shown + name
+        if rest:
+            yield from _glob(status, path, shown + "/", rest)
+        elif status.lookup(path) is not None:
+            yield shown
+        return
+
+    tree = status.lookup(path)
+    if tree is None or tree.type != FileType.dir or not status.can(tree, READ):
+        return
+    hidden = part.startswith(".")
+    user = status.name
+    names = sorted(
+        name for name, x in tree.index.items()
+        if rx.match(name) and (hidden or not name.startswith(".")) and x.access(user) & VISIBLE
+    )
+    for name in names:
+        if rest:
+            yield from _glob(status, path + [name], f"{shown}{name}/", rest)
+        else:
+            yield shown + name
+
+
+def _pathnames(status: HostNode, pieces: list[Piece], pathnames: bool) -> Iterator[str]:
+    text = "".join(x for x, _ in pieces)
+    if pathnames and any(not literal and magic_regex.search(x) for x, literal in pieces):
+        pattern = "".join(escape(x) if literal else x for x, literal in pieces)
+        matched = False
+        for path in glob(status, pattern):
+            matched = True
+            yield path
+        if matched:
+            return
+    yield text
+
+
+def snapshot(words: list[str], env: Mapping) -> dict:
+    """单词中用到的变量的当前值, 之后修改变量不影响还没有返回的结果"""
+    names = {m.group(1) or m.group(2) for word in words for m in var_regex.finditer(word)}
+    if any(word.startswith("~") for word in words):
+        names.add("HOME")
+    result = {}
+    for name in names:
+        if name in env:
+            v = env[name]
+            result[name] = list(v) if isinstance(v, list) else v
+    return result
+
+
+def expand(
+    status: HostNode, line: str, env: Mapping = None, pathnames: bool = True, frozen: bool = False
+) -> Iterator[str]:
+    """
+    展开一行命令, 返回参数的生成器. 拆分单词在调用时完成, 引号没有闭合时直接抛出 ValueError.
+    env 默认是主机的 env, pathnames 为 False 时不做路径展开.
+    frozen 为 True 时变量在调用时读取 (for 循环), 只有大括号序列和路径匹配按需进行
+    """
+    words = split(line)
+    if env is None:
+        env = status.env
+    if frozen:
+        env = snapshot(words, env)
+    return _expand(status, words, env, pathnames)
+
+
+def _expand(status: HostNode, words: list[str], env: Mapping, pathnames: bool) -> Iterator[str]:
+    for word in words:
+        for item in braces(word):
+            for pieces in fields(item, env):
+                yield from _pathnames(status, pieces, pathnames)
@@ -0,0 +1,205 @@
+"""
+exp 命令使用的表达式引擎
+
+表达式先经过 ast 白名单检查再编译, 编译结果按源码缓存;
+求值放在独立的进程池中, 并限制 cpu 时间和内存, 死循环或超大运算不会卡住整个游戏
+"""
+import ast
+import asyncio
+import functools
+import math
+import multiprocessing
+import os
+import signal
+from collections.abc import Iterator, KeysView, ValuesView, ItemsView
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import resource
+except ImportError:
+    # windows 下没有 resource, 只能依靠超时结束进程
+    resource = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ExpressionError(Exception):
+    pass
+
+
+# 允许出现的语法节点, 不包含属性访问, lambda, 赋值表达式等
+allowed_nodes = (
+    ast.Expression, ast.Constant, ast.Name, ast.Load, ast.Store,
+    ast.List, ast.Tuple, ast.Set, ast.Dict, ast.Starred,
+    ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+    ast.Subscript, ast.Slice, ast.Call, ast.keyword,
+    ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.comprehension,
+    ast.operator, ast.unaryop, ast.boolop, ast.cmpop,
+)
+
+functions = {
+    f.__name__: f for f in (
+        abs, all, any, bool, dict, divmod, enumerate, float, int, len, list, max, min,
+        range, reversed, round, set, sorted, str, sum, tuple, zip,
+        math.sqrt, math.log, math.floor, math.ceil,
+    )
+}
+functions.update(pi=math.pi, e=math.e)
+
+if numpy is not None:
+    # 基于 numpy 的向量运算, 可以直接作用在 env 中的列表上
+    functions.update(
+        vec=numpy.asarray,
+        arange=numpy.arange,
+        mean=numpy.mean,
+        std=numpy.std,
+        median=numpy.median,
+        dot=numpy.dot,
+        cumsum=numpy.cumsum,
+        where=numpy.where,
+        clip=numpy.clip,
+        unique=numpy.unique,
+        argsort=numpy.argsort,
+        sqrt=numpy.sqrt,
+        log=numpy.log,
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(source: str):
+    """
+    检查并编译表达式
+    返回 编译后的代码 和 表达式中引用的变量名
+    """
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"syntax error: {e.msg}")
+
+    names = set()
+    bound = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, allowed_nodes):
+            raise ExpressionError(f"not allowed: {type(node).__name__}")
+        if isinstance(node, ast.Name):
+            if node.id.startswith("_"):
+                raise ExpressionError(f"not allowed name: {node.id}")
+            if isinstance(node.ctx, ast.Store):
+                bound.add(node.id)
+            else:
+                names.add(node.id)
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in functions:
+                raise ExpressionError(f"not allowed call: {ast.unparse(node.func)}")
+    return compile(tree, "<exp>", "eval"), frozenset(names - bound)
+
+
+class ExpressionEngine:
+    """
+    在进程池中执行表达式求值
+    worker 进程使用 spawn 启动, 内存上限通过 RLIMIT_AS 限制, cpu 时间通过 RLIMIT_CPU 限制,
+    超出墙钟时间的 worker 会被直接结束并重建进程池
+    """
+
+    def __init__(self, workers: int = 2, cpu_limit: float = 2, memory_limit: int = 256 * 1024 * 1024):
+        self.workers = workers
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit
+        self._pool = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.memory_limit,)
+            )
+        return self._pool
+
+    def reset(self):
+        if self._pool is None:
+            return
+        # ProcessPoolExecutor 没有提供结束正在执行任务的接口
+        for p in list(self._pool._processes.values()):
+            p.terminate()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+    async def evaluate(self, source: str, env: dict):
+        _, names = compile_expression(source)
+        scope = {k: env[k] for k in names if k in env}
+        future = asyncio.get_running_loop().run_in_executor(
+            self.pool, _evaluate, source, scope, self.cpu_limit
+        )
+        try:
+            return await asyncio.wait_for(future, self.cpu_limit * 2 + 1)
+        except asyncio.TimeoutError:
+            self.reset()
+            raise ExpressionError("time limit exceeded")
+        except BrokenProcessPool:
+            self.reset()
+            raise ExpressionError("worker exited, memory limit exceeded?")
+
+
+class CpuLimitExceeded(ExpressionError):
+    pass
+
+
+def _on_cpu_limit(signum, frame):
+    raise CpuLimitExceeded("cpu time limit exceeded")
+
+
+def _init_worker(memory_limit):
+    if resource is None:
+        return
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    if memory_limit:
+        # 在已经占用的虚拟内存之上再给出 memory_limit
+        try:
+            with open("/proc/self/statm") as f:
+                used = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            used = 0
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = used + memory_limit
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _evaluate(source, scope, cpu_limit):
+    code, _ = compile_expression(source)
+    if resource is None:
+        return _plain(eval(code, {**functions, **scope, "__builtins__": {}}))
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    limit = math.ceil(usage.ru_utime + usage.ru_stime + cpu_limit)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+    try:
+        return _plain(eval(code, {**functions, **scope, "__builtins__": {}}))
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _plain(value):
+    """转换为可以序列化的普通 python 对象"""
+    if numpy is not None:
+        if isinstance(value, numpy.ndarray):
+            return value.tolist()
+        if isinstance(value, numpy.generic):
+            return value.item()
+    if isinstance(value, (Iterator, KeysView, ValuesView, ItemsView)):
+        return [_plain(x) for x in value]
+    return value
+
+
+engine = ExpressionEngine()
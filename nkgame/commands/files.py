@@ -0,0 +1,339 @@
+import argparse
+import re
+from typing import Callable
+
+from rich.table import Table
+
+from nkgame.commands.status import TreeSystem, ROOT, READ, WRITE, EXEC, VISIBLE
+from nkgame.pb.game_status_pb2 import FileType
+
+from .base import Command, ArgumentParser
+from .console import CdCommand, TextBuilder
+
+
+def human(size: int) -> str:
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024 or unit == "G":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+
+
+class DuCommand(Command):
+    name = "du"
+    words = {"du": CdCommand.DirCompleter([])}
+
+    args = ArgumentParser(prog="du", usage="du -d 2 lib", description="统计目录占用的空间", epilog="")
+    args.add_argument("path", help="路径", nargs="?", default=".")
+    args.add_argument("-d", "--max-depth", dest="depth", help="显示的目录层数", type=int, default=1)
+    args.add_argument("-s", "--summarize", dest="summarize", help="只显示总计", action="store_true")
+    args.add_argument("-t", "--types", dest="types", help="按文件类型统计数量", action="store_true")
+
+    def hidden(self, tree: TreeSystem, name: str) -> dict[int, list[int]]:
+        """
+        当前用户不能读取的子目录, 内容不计入统计, 返回 id(目录) -> 需要从目录的统计中扣除的部分.
+        只遍历目录, root 不受限制, 直接使用现成的统计
+        """
+        user = self.status.name
+        hidden: dict[int, list[int]] = {}
+        if user == ROOT:
+            return hidden
+        stack = [(tree, name)]
+        while stack:
+            x, p = stack.pop()
+            for sub in x.sub:
+                if sub.type != FileType.dir:
+                    continue
+                if sub.allows(user, READ | EXEC):
+                    stack.append((sub, f"{p}/{sub.name}"))
+                    continue
+                self.error(f"cannot read directory {p}/{sub.name}.")
+                # 目录自身仍然计入, 只扣除其中的内容
+                delta = [a - b for a, b in zip(sub.totals, sub.contribution())]
+                y = sub
+                while y is not None:
+                    acc = hidden.setdefault(id(y), [0] * len(delta))
+                    for i, v in enumerate(delta):
+                        acc[i] += v
+                    y = None if y is tree else y.parent
+        return hidden
+
+    async def run(self, args: argparse.Namespace):
+        path = self.status.abspath(args.path)
+        tree = self.status.lookup(path)
+        if tree is None:
+            self.error(f"{args.path} not exists.")
+            return
+        # 目录需要读取和进入的权限, 文件只需要能看到
+        if not self.status.can(tree, READ | EXEC if tree.type == FileType.dir else VISIBLE):
+            self.error(f"{args.path} permission denied.")
+            return
+        name = "/" + "/".join(path)
+        hidden = self.hidden(tree, name) if tree.type == FileType.dir else {}
+
+        def totals(x: TreeSystem) -> list[int]:
+            h = hidden.get(id(x))
+            return x.totals if h is None else [a - b for a, b in zip(x.totals, h)]
+
+        if args.types:
+            t = totals(tree)
+            table = Table("type", "count", title=name)
+            for k, v in FileType.items():
+                n = t[v + 1] - (v == FileType.dir and tree.type == FileType.dir)
+                if n:
+                    table.add_row(k, f"{n}")
+            table.add_row("bytes", f"{t[0]}")
+            self.status.console.print(table)
+            return
+
+        # 每个目录的统计都是现成的, 只需要遍历要显示的目录
+        out = TextBuilder()
+        depth = 0 if args.summarize else args.depth
+        stack = [(tree, name, 0, False)]
+        while stack:
+            x, p, d, done = stack.pop()
+            if done or d >= depth:
+                out.append(f"{human(totals(x)[0]):<10}")
+                out.append(p, x.color)
+                out.append("\n")
+                continue
+            # 子目录先输出, 自身最后输出
+            stack.append((x, p, d, True))
+            for sub in reversed(self.status.listdir(x)):
+                if sub.type == FileType.dir:
+                    stack.append((sub, f"{p}/{sub.name}", d + 1, False))
+        self.status.console.print(out.build())
+
+
+class TreeCommand(Command):
+    name = "tree"
+    words = {"tree": CdCommand.DirCompleter([])}
+
+    args = ArgumentParser(prog="tree", usage="tree -L 2 lib", description="以树状显示目录", epilog="")
+    args.add_argument("path", help="路径", nargs="?", default=".")
+    args.add_argument("-L", "--level", dest="level", help="显示的层数", type=int, default=None)
+    args.add_argument("-a", "--all", dest="all", help="显示以 . 开头的文件", action="store_true")
+    args.add_argument("-s", "--size", dest="size", help="显示大小", action="store_true")
+
+    batch_size = 1000
+
+    def walk(self, tree: TreeSystem, level: int, show_all: bool):
+        """深度优先遍历, 逐行返回 (前缀, 节点)"""
+        stack = [(iter(self.children(tree, show_all)), "")]
+        while stack:
+            it, prefix = stack[-1]
+            item = next(it, None)
+            if item is None:
+                stack.pop()
+                continue
+            x, last = item
+            yield prefix + ("└── " if last else "├── "), x
+            if x.type == FileType.dir and (level is None or len(stack) < level):
+                stack.append((iter(self.children(x, show_all)), prefix + ("    " if last else "│   ")))
+
+    def children(self, tree: TreeSystem, show_all: bool):
+        sub = self.status.listdir(tree)
+        if not show_all:
+            sub = [x for x in sub if not x.name.startswith(".")]
+        return ((x, i == len(sub) - 1) for i, x in enumerate(sub))
+
+    async def run(self, args: argparse.Namespace):
+        tree = self.status.lookup(self.status.abspath(args.path))
+        if tree is None or tree.type != FileType.dir:
+            self.error(f"directory {args.path} not exists.")
+            return
+        dirs = files = 0
+        out = TextBuilder()
+        out.append(args.path, tree.color)
+        out.append("\n")
+        for i, (prefix, x) in enumerate(self.walk(tree, args.level, args.all)):
+            if x.type == FileType.dir:
+                dirs += 1
+            else:
+                files += 1
+            out.append(prefix)
+            if args.size:
+                out.append(f"[{human(x.size):>7}]  ")
+            out.append(x.name, x.color)
+            out.append("\n")
+            # 分批输出, 大目录不需要等待全部生成
+            if (i + 1) % self.batch_size == 0:
+                self.status.console.print(out.build())
+                out = TextBuilder()
+        out.append(f"\n{dirs} directories, {files} files\n")
+        self.status.console.print(out.build())
+
+
+class EchoCommand(Command):
+    name = "echo"
+    words = "echo"
+
+    args = ArgumentParser(prog="echo", usage="echo hello >> log.txt", description="输出文字, 或者写入 (>) 追加 (>>) 到文件", epilog="")
+    args.add_argument("text", help="文字", nargs="*")
+    args.add_argument("-n", dest="newline", help="末尾不换行", action="store_false")
+
+    async def run(self, args: argparse.Namespace):
+        words = args.text
+        mode = target = None
+        for i, x in enumerate(words):
+            if x in (">", ">>"):
+                if i != len(words) - 2:
+                    self.error(f"usage: {self.args.usage}")
+                    return
+                mode, target = x, words[-1]
+                words = words[:i]
+                break
+        text = " ".join(words) + ("\n" if args.newline else "")
+        if target is None:
+            self.status.console.print(text, end="", markup=False, highlight=False)
+            return
+
+        path = self.status.abspath(target)
+        parent = self.status.lookup(path[:-1])
+        # 根目录本身不能作为写入的文件
+        if len(path) < 2 or parent is None or parent.type != FileType.dir:
+            self.error(f"{target} not exists.")
+            return
+        f = parent.index.get(path[-1])
+        if not self.status.can(parent if f is None else f, WRITE):
+            self.error(f"{target} permission denied.")
+            return
+        if f is None:
+            f = self.status.adopt(parent, TreeSystem(path[-1], FileType.txt, data=text))
+            parent.add(f)
+        elif f.type != FileType.txt:
+            self.error(f"{target} is not a text file.")
+            return
+        elif mode == ">>":
+            # 只复制最后一块, 日志再大追加也很快
+            f.append(text)
+        else:
+            f.data = text
+        # 只把这个文件写入增量存档, 不重写整个世界
+        self.status.save_file(f)
+
+
+mode_regex = re.compile(r"([ugoa]*)((?:[-+=][rwx]*)+)")
+op_regex = re.compile(r"([-+=])([rwx]*)")
+who_bits = {"u": 0o700, "g": 0o070, "o": 0o007, "a": 0o777}
+perm_bits = {"r": 0o444, "w": 0o222, "x": 0o111}
+
+
+def parse_mode(spec: str) -> Callable[[int], int]:
+    """
+    解析八进制 (755) 或符号 (u+x,go-w) 的权限, 返回按原来的权限计算新权限的函数, 格式错误时抛出 ValueError.
+    -R 时只解析一次, 每个节点按自己的权限计算
+    """
+    if re.fullmatch(r"[0-7]{1,3}", spec):
+        value = int(spec, 8)
+        return lambda mode: value
+    ops = []
+    for clause in spec.split(","):
+        m = mode_regex.fullmatch(clause)
+        if m is None:
+            raise ValueError(f"invalid mode {spec}")
+        mask = 0
+        for c in m.group(1) or "a":
+            mask |= who_bits[c]
+        for op, perms in op_regex.findall(m.group(2)):
+            bits = 0
+            for c in perms:
+                bits |= perm_bits[c]
+            ops.append((op, mask, bits & mask))
+
+    def apply(mode: int) -> int:
+        for op, mask, bits in ops:
+            if op == "+":
+                mode |= bits
+            elif op == "-":
+                mode &= ~bits
+            else:
+                mode = mode & ~mask | bits
+        return mode
+
+    return apply
+
+
+def walk(tree: TreeSystem, recursive: bool):
+    yield tree
+    if recursive:
+        stack = list(tree.sub)
+        while stack:
+            x = stack.pop()
+            yield x
+            stack.extend(x.sub)
+
+
+class ChmodCommand(Command):
+    name = "chmod"
+    words = "chmod"
+
+    args = ArgumentParser(prog="chmod", usage="chmod 755 run.sh, chmod u+x,o-w lib/*", description="修改权限", epilog="")
+    args.add_argument("mode", help="八进制或符号表示的权限")
+    args.add_argument("paths", help="路径", nargs="+")
+    args.add_argument("-R", "--recursive", dest="recursive", help="修改整个目录", action="store_true")
+
+    async def run(self, args: argparse.Namespace):
+        try:
+            apply = parse_mode(args.mode)
+        except ValueError as e:
+            self.error(f"{e}.")
+            return
+        user = self.status.name
+        changed = False
+        for p in args.paths:
+            tree = self.status.lookup(self.status.abspath(p))
+            if tree is None:
+                self.error(f"{p} not exists.")
+                continue
+            # 只有所有者和 root 可以修改权限, 修改之前检查完所有节点, 不会只改了一部分
+            nodes = list(walk(tree, args.recursive))
+            if user != ROOT and any(x.effective_owner not in ("", user) for x in nodes):
+                self.error(f"{p}: operation not permitted.")
+                continue
+            for x in nodes:
+                mode = apply(x.mode)
+                if mode != x.mode:
+                    # 只清除这个节点子树中的权限缓存
+                    x.mode = mode
+                    changed = True
+        if changed:
+            self.status.game.save()
+
+
+class ChownCommand(Command):
+    name = "chown"
+    words = "chown"
+
+    args = ArgumentParser(prog="chown", usage="chown guest lib", description="修改所有者", epilog="")
+    args.add_argument("owner", help="用户名")
+    args.add_argument("paths", help="路径", nargs="+")
+    args.add_argument("-R", "--recursive", dest="recursive", help="修改整个目录", action="store_true")
+
+    async def run(self, args: argparse.Namespace):
+        user = self.status.name
+        changed = False
+        for p in args.paths:
+            tree = self.status.lookup(self.status.abspath(p))
+            if tree is None:
+                self.error(f"{p} not exists.")
+                continue
+            # -R 会清除子孙各自的所有者, 每个节点都要检查, 修改之前检查完, 不会只改了一部分
+            nodes = list(walk(tree, args.recursive))
+            if user != ROOT and any(x.effective_owner not in ("", user) for x in nodes):
+                self.error(f"{p}: operation not permitted.")
+                continue
+            # 没有单独设置所有者的子节点和上级目录相同, 不加 -R 时也一起改变
+            for x in nodes:
+                owner = args.owner if x is tree else ""
+                if x.owner != owner:
+                    x.owner = owner
+                    changed = True
+        if changed:
+            self.status.game.save()
+
+
+name = "files"
+
+__all__ = [
+    "name"
+]
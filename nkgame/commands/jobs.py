@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import time
+from collections import deque
+
+from rich.console import Console
+
+from nkgame.commands.status import HostNode
+from nkgame.game.player import Process
+
+from .base import Command, ArgumentParser, ShellContinue, ShellBreak
+
+
+class JobOutput:
+    """
+    后台任务的输出缓冲, 只保留最后 max_size 个字符
+    """
+
+    def __init__(self, max_size=64 * 1024):
+        self.max_size = max_size
+        self.chunks = deque()
+        self.size = 0
+
+    def write(self, s: str):
+        self.chunks.append(s)
+        self.size += len(s)
+        while self.size > self.max_size and len(self.chunks) > 1:
+            self.size -= len(self.chunks.popleft())
+        return len(s)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return True
+
+    def drain(self) -> str:
+        s = "".join(self.chunks)
+        self.chunks.clear()
+        self.size = 0
+        return s
+
+
+class JobStatus:
+    """
+    后台任务使用的 HostNode 代理, 除了 console 外都转发到真正的主机
+    """
+
+    def __init__(self, host: HostNode, console: Console):
+        object.__setattr__(self, "_host", host)
+        object.__setattr__(self, "console", console)
+
+    def __getattr__(self, item):
+        return getattr(self._host, item)
+
+    def __setattr__(self, key, value):
+        setattr(self._host, key, value)
+
+
+class Job:
+
+    def __init__(
+            self, jid: int, host: HostNode, line: str, command: type[Command], args: argparse.Namespace,
+            process: Process
+    ):
+        self.id = jid
+        self.host = host
+        self.line = line
+        self.command = command
+        self.process = process
+        self.output = JobOutput()
+        self.status = JobStatus(host, Console(file=self.output, width=host.console.width, force_terminal=True))
+        self.started = time.monotonic()
+        self.finished = None
+        self.state = "Running"
+        self.task = asyncio.create_task(self.run(args))
+        self.task.add_done_callback(self.done)
+
+    @classmethod
+    def start(cls, host: HostNode, line: str, command: type[Command], args: argparse.Namespace):
+        if command.is_interactive(args):
+            host.console.print(f"[red]ERR[/] {command.name} can not run in background.")
+            return None
+        process = host.player.spawn(command.name, command.load, command.memory)
+        if process is None:
+            host.console.print(
+                f"[red]ERR[/] host resource exhausted, "
+                f"load {host.player.load_value}/{host.player.max_load_value} "
+                f"memory {host.player.memory_value}/{host.player.max_memory_value}"
+            )
+            return None
+        jid = max(host.jobs, default=0) + 1
+        job = host.jobs[jid] = cls(jid, host, line, command, args, process)
+        host.console.print(f"[{jid}] {line}", markup=False)
+        return job
+
+    async def run(self, args: argparse.Namespace):
+        try:
+            code = await self.command.execute(self.status, args, self.process)
+            self.state = "Done" if code == 0 else "Failed"
+        except (ShellContinue, ShellBreak):
+            self.state = "Done"
+        except asyncio.CancelledError:
+            self.state = "Killed"
+        except Exception as e:
+            self.state = "Failed"
+            self.status.console.print(f"[red]ERR[/] error: {e}")
+
+    def done(self, task: asyncio.Task):
+        # 任务可能在开始执行前就被取消, 所以在回调中释放资源
+        if task.cancelled():
+            self.state = "Killed"
+        self.finished = time.monotonic()
+        self.process.exit()
+
+    @property
+    def runtime(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def attach(self, console: Console):
+        """输出缓冲中的内容, 之后的输出直接写到 console"""
+        buffered = self.output.drain()
+        if buffered:
+            console.file.write(buffered)
+            console.file.flush()
+        object.__setattr__(self.status, "console", console)
+
+    @classmethod
+    def reap(cls, host: HostNode):
+        """报告并清理已经结束的任务"""
+        for jid, job in list(host.jobs.items()):
+            if job.task.done():
+                host.console.print(f"[{jid}] {job.state:<8} {job.line}", markup=False)
+                host.jobs.pop(jid)
+
+
+class JobsCommand(Command):
+    name = "jobs"
+    words = "jobs"
+
+    args = ArgumentParser(prog="jobs", usage="jobs", description="显示后台任务", epilog="")
+
+    async def run(self, args: argparse.Namespace):
+        for jid, job in self.status.jobs.items():
+            self.status.console.print(f"[{jid}] {job.state:<8} {job.runtime:>8.1f}s  {job.line}", markup=False)
+        p = self.status.player
+        self.status.console.print(
+            f"load {p.max_load_value - p.load_value}/{p.max_load_value}  "
+            f"memory {p.max_memory_value - p.memory_value}/{p.max_memory_value}"
+        )
+
+
+class FgCommand(Command):
+    name = "fg"
+    words = "fg"
+    interactive = True
+
+    args = ArgumentParser(prog="fg", usage="fg 1", description="切换后台任务到前台", epilog="")
+    args.add_argument("id", help="任务编号", nargs="?", type=int, default=None)
+
+    async def run(self, args: argparse.Namespace):
+        jid = args.id if args.id is not None else max(self.status.jobs, default=None)
+        if jid is None:
+            self.error("no current job.")
+            return
+        job: Job = self.status.jobs.get(jid)
+        if job is None:
+            self.error(f"job {jid} not exists.")
+            return
+        self.status.console.print(job.line, markup=False)
+        job.attach(self.status.console)
+        await asyncio.shield(job.task)
+        self.status.jobs.pop(jid, None)
+
+
+class KillCommand(Command):
+    name = "kill"
+    words = "kill"
+
+    args = ArgumentParser(prog="kill", usage="kill 1", description="结束后台任务", epilog="")
+    args.add_argument("id", help="任务编号", type=int)
+
+    async def run(self, args: argparse.Namespace):
+        job: Job = self.status.jobs.get(args.id)
+        if job is None:
+            self.error(f"job {args.id} not exists.")
+            return
+        job.task.cancel()
+        await asyncio.wait([job.task])
+
+
+name = "jobs"
+
+__all__ = [
+    "name"
+]
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import ipaddress
+import random
+import time
+
+from nkgame.game.world import WorldGenerator
+
+from .base import Command, ArgumentParser
+from .console import SshCommand
+
+
+class WorldCommand(Command):
+    name = "world"
+    words = "world"
+
+    args = ArgumentParser(prog="world", usage="world -s 42 -n 5000", description="生成或查看网络世界", epilog="")
+    args.add_argument("-s", "--seed", dest="seed", help="世界种子", type=int, default=None)
+    args.add_argument("-n", "--size", dest="size", help="主机数量", type=int, default=1000)
+
+    async def run(self, args: argparse.Namespace):
+        hosts = self.status.game.hosts
+        if args.seed is not None:
+            # 存档中种子是 uint64, 先检查, 否则设置之后每次存档都会失败
+            if not 0 <= args.seed < 2 ** 64:
+                self.error("seed must be between 0 and 2^64-1.")
+                return
+            if args.size <= 0:
+                self.error("size must be positive.")
+                return
+            self.status.game.set_generator(WorldGenerator(args.seed, args.size))
+            self.status.game.save()
+        generator = hosts.generator
+        if generator is None:
+            self.status.console.print("没有生成的世界, 使用 world -s <seed> 创建")
+            return
+        loaded = sum(1 for x in hosts.values() if x.generated is not None)
+        self.status.console.print(
+            f"seed: {generator.seed}  hosts: {generator.size}  "
+            f"network: {generator.network}  loaded: {loaded}"
+        )
+
+
+class PingCommand(Command):
+    name = "ping"
+    words = {"ping": SshCommand.HostCompleter([])}
+
+    args = ArgumentParser(prog="ping", usage="ping 10.0.1.1", description="测试主机连通和延迟", epilog="")
+    args.add_argument("host", help="远程地址")
+    args.add_argument("-c", "--count", dest="count", help="发送次数", type=int, default=4)
+    args.add_argument("-i", "--interval", dest="interval", help="发送间隔 (秒)", type=float, default=1.0)
+
+    async def run(self, args: argparse.Namespace):
+        if args.count < 1:
+            self.error("count must be at least 1.")
+            return
+        route = self.status.game.route(self.status.host, args.host)
+        if route is None:
+            self.error(f"host [steel_blue]{args.host}[/] unreachable.")
+            return
+        times = []
+        for i in range(args.count):
+            if i:
+                await asyncio.sleep(args.interval)
+            rtt = 2 * route.latency * random.uniform(1.0, 1.1)
+            await asyncio.sleep(rtt / 1000)
+            times.append(rtt)
+            self.status.console.print(
+                f"64 bytes from {args.host}: icmp_seq={i + 1} ttl={64 - len(route.links)} time={rtt:.2f} ms"
+            )
+        self.status.console.print(
+            f"--- {args.host} ping statistics ---\n"
+            f"{args.count} packets transmitted, {len(times)} received, "
+            f"rtt min/avg/max = {min(times):.2f}/{sum(times) / len(times):.2f}/{max(times):.2f} ms"
+        )
+
+
+class TracerouteCommand(Command):
+    name = "traceroute"
+    words = {"traceroute": SshCommand.HostCompleter([])}
+
+    args = ArgumentParser(prog="traceroute", usage="traceroute 10.0.1.1", description="显示到主机的路由", epilog="")
+    args.add_argument("host", help="远程地址")
+
+    async def run(self, args: argparse.Namespace):
+        route = self.status.game.route(self.status.host, args.host)
+        if route is None:
+            self.error(f"host [steel_blue]{args.host}[/] unreachable.")
+            return
+        latency = 0.0
+        for i, (hop, link) in enumerate(zip(route.hops[1:], route.links)):
+            latency += link.latency
+            probes = [2 * latency * random.uniform(1.0, 1.1) for _ in range(3)]
+            await asyncio.sleep(max(probes) / 1000)
+            self.status.console.print(f"{i + 1:>2}  {hop:<16}" + "  ".join(f"{x:.2f} ms" for x in probes))
+
+
+class ScanCommand(Command):
+    name = "scan"
+    words = "scan"
+
+    args = ArgumentParser(prog="scan", usage="scan 10.0.0.0/16", description="扫描网段内的主机", epilog="")
+    args.add_argument("network", help="网段, 如 10.0.1.0/24")
+    args.add_argument("-c", "--concurrency", dest="concurrency", help="同时探测的主机数", type=int, default=1024)
+    args.add_argument("-t", "--timeout", dest="timeout", help="单个主机的超时 (毫秒)", type=float, default=1000)
+
+    async def probe(self, semaphore: asyncio.Semaphore, ip: str, timeout: float):
+        async with semaphore:
+            route = self.status.game.route(self.status.host, ip)
+            if route is None:
+                await asyncio.sleep(timeout / 1000)
+                return None
+            rtt = 2 * route.latency
+            if rtt > timeout:
+                await asyncio.sleep(timeout / 1000)
+                return None
+            await asyncio.sleep(rtt / 1000)
+            return rtt
+
+    async def run(self, args: argparse.Namespace):
+        try:
+            network = ipaddress.ip_network(args.network, strict=False)
+        except ValueError:
+            self.error(f"invalid network [steel_blue]{args.network}[/].")
+            return
+        hosts = self.status.game.hosts
+        # 按 ip 索引只取出网段内存在的主机, 不逐个地址探测
+        targets = list(hosts.ip_range(network))
+        semaphore = asyncio.Semaphore(max(args.concurrency, 1))
+        st = time.perf_counter()
+        rtts = await asyncio.gather(*(self.probe(semaphore, ip, args.timeout) for ip, _ in targets))
+        lines = [
+            f"{ip:<16}{rtt:>9.2f} ms  {name if name != ip else ''}"
+            for (ip, name), rtt in zip(targets, rtts) if rtt is not None
+        ]
+        if lines:
+            self.status.console.print("\n".join(lines), markup=False, highlight=False)
+        self.status.console.print(
+            f"scan {network}: {network.num_addresses} addresses, {len(targets)} hosts, "
+            f"{len(lines)} up, {time.perf_counter() - st:.2f}s"
+        )
+
+
+name = "network"
+
+__all__ = [
+    "name"
+]
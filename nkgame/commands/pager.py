@@ -0,0 +1,93 @@
+"""
+分页显示
+
+只渲染当前窗口中的行, 行数再多也不需要一次生成全部输出
+"""
+import io
+from typing import Callable
+
+from prompt_toolkit.application import Application
+from prompt_toolkit.formatted_text import ANSI
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.layout import Layout, HSplit, Window
+from prompt_toolkit.layout.controls import FormattedTextControl
+from rich.console import Console, RenderableType
+
+
+class Pager:
+
+    def __init__(self, count: int, line: Callable[[int], RenderableType], title: str = ""):
+        self.count = count
+        self.line = line
+        self.title = title
+        self.top = 0
+        self.console = Console(file=io.StringIO(), force_terminal=True, width=1000)
+        self.app = Application(
+            layout=Layout(HSplit([
+                Window(FormattedTextControl(self.render), wrap_lines=False),
+                Window(FormattedTextControl(self.status_line), height=1, style="reverse"),
+            ])),
+            key_bindings=self.bindings(),
+            full_screen=True,
+        )
+
+    @property
+    def height(self) -> int:
+        return max(self.app.output.get_size().rows - 1, 1)
+
+    def scroll(self, n: int):
+        self.top = max(min(self.top + n, self.count - self.height), 0)
+
+    def render(self):
+        file = self.console.file
+        file.seek(0)
+        file.truncate()
+        for i in range(self.top, min(self.top + self.height, self.count)):
+            self.console.print(self.line(i))
+        return ANSI(file.getvalue().rstrip("\n"))
+
+    def status_line(self):
+        end = min(self.top + self.height, self.count)
+        return f" {self.title}  {self.top + 1}-{end}/{self.count}  (q 退出, 空格/b 翻页, j/k 滚动, g/G 首尾)"
+
+    def bindings(self) -> KeyBindings:
+        kb = KeyBindings()
+
+        @kb.add("q")
+        @kb.add("c-c")
+        def _(event):
+            event.app.exit()
+
+        @kb.add("space")
+        @kb.add("pagedown")
+        def _(event):
+            self.scroll(self.height)
+
+        @kb.add("b")
+        @kb.add("pageup")
+        def _(event):
+            self.scroll(-self.height)
+
+        @kb.add("j")
+        @kb.add("down")
+        @kb.add("enter")
+        def _(event):
+            self.scroll(1)
+
+        @kb.add("k")
+        @kb.add("up")
+        def _(event):
+            self.scroll(-1)
+
+        @kb.add("g")
+        def _(event):
+            self.top = 0
+
+        @kb.add("G")
+        def _(event):
+            self.scroll(self.count)
+
+        return kb
+
+    async def run(self):
+        await self.app.run_async()
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+
+from rich.console import Group
+from rich.live import Live
+from rich.table import Table
+from rich.text import Text
+
+from nkgame.game.scheduler import scheduler
+
+from .base import Command, ArgumentParser
+
+
+def process_table(status, sort: str, limit: int = None) -> Table:
+    player = status.player
+    keys = {
+        "cpu": lambda x: (-x.load, x.pid),
+        "mem": lambda x: (-x.memory, x.pid),
+        "time": lambda x: (-x.cpu_time, x.pid),
+        "pid": lambda x: x.pid,
+    }
+    processes = sorted(player.processes.values(), key=keys[sort])
+    table = Table("PID", "COMMAND", "%CPU", "MEM", "TIME", box=None, header_style="reverse")
+    for x in processes[:limit]:
+        m, s = divmod(x.cpu_time, 60)
+        table.add_row(
+            f"{x.pid}", x.name, f"{x.load * 100 / player.max_load_value:.1f}",
+            f"{x.memory}M", f"{m:.0f}:{s:05.2f}",
+        )
+    return table
+
+
+def summary(status) -> Text:
+    player = status.player
+    load = player.max_load_value - player.load_value
+    memory = player.max_memory_value - player.memory_value
+    return Text(
+        f"{status.host}  load average: {', '.join(f'{x:.2f}' for x in player.load_avg)}\n"
+        f"Tasks: {len(player.processes)}  "
+        f"%Cpu: {load * 100 / player.max_load_value:.1f} used  "
+        f"Mem: {player.max_memory_value}M total, {memory}M used, {player.max_memory_value - memory}M free\n"
+    )
+
+
+class PsCommand(Command):
+    name = "ps"
+    words = "ps"
+
+    args = ArgumentParser(prog="ps", usage="ps -s mem", description="显示主机上的进程", epilog="")
+    args.add_argument(
+        "-s", "--sort", dest="sort", help="排序方式", choices=["pid", "cpu", "mem", "time"], default="pid"
+    )
+
+    async def run(self, args: argparse.Namespace):
+        scheduler.run_pending()
+        self.status.console.print(process_table(self.status, args.sort))
+
+
+class TopCommand(Command):
+    name = "top"
+    words = "top"
+    interactive = True
+
+    args = ArgumentParser(prog="top", usage="top -n 10", description="实时显示主机负载和进程", epilog="")
+    args.add_argument("-d", "--delay", dest="delay", help="刷新间隔 (秒)", type=float, default=1.0)
+    args.add_argument("-n", "--iterations", dest="iterations", help="刷新次数", type=int, default=10)
+    args.add_argument(
+        "-s", "--sort", dest="sort", help="排序方式", choices=["pid", "cpu", "mem", "time"], default="cpu"
+    )
+
+    def render(self, sort: str):
+        scheduler.run_pending()
+        limit = max(self.status.console.height - 6, 5)
+        return Group(summary(self.status), process_table(self.status, sort, limit))
+
+    async def run(self, args: argparse.Namespace):
+        with Live(self.render(args.sort), console=self.status.console, auto_refresh=False) as live:
+            for _ in range(args.iterations - 1):
+                await asyncio.sleep(args.delay)
+                live.update(self.render(args.sort), refresh=True)
+
+
+name = "process"
+
+__all__ = [
+    "name"
+]
@@ -0,0 +1,69 @@
+import argparse
+import time
+
+from prompt_toolkit.completion import WordCompleter
+from rich.table import Table
+
+from nkgame.game.game_base import Game
+from nkgame.game.scores import Board
+
+from .base import Command, ArgumentParser
+
+
+def when(t: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
+
+
+class ScoresCommand(Command):
+    name = "scores"
+    words = {"scores": WordCompleter(list(Game.games.keys()))}
+
+    args = ArgumentParser(prog="scores", usage="scores, scores tetris -n 20", description="显示小游戏排行榜", epilog="")
+    args.add_argument("game", help="小游戏名, 不填时显示所有小游戏的概况", nargs="?", default=None)
+    args.add_argument("-u", "--user", dest="user", help="玩家, 默认是当前用户", default=None)
+    args.add_argument("-n", dest="n", help="显示的名次数", type=int, default=10)
+
+    async def run(self, args: argparse.Namespace):
+        scores = self.status.game.scores
+        user = args.user or self.status.name
+        if args.game is None:
+            scores.load()
+            self.summary(scores.boards.values(), user)
+            return
+        if args.game not in scores.boards and args.game not in Game.games:
+            self.error(f"game {args.game} not exists.")
+            return
+        board = scores.board(args.game)
+        top = Table("#", "player", "score", "time", title=f"{args.game} 排行榜 ({board.total} 局)")
+        for i, (score, t, player) in enumerate(board.top.entries()[:args.n], 1):
+            top.add_row(f"{i}", player, f"{score}", when(-t), style="green" if player == user else None)
+        self.status.console.print(top)
+
+        mine = board.players.get(user)
+        if not mine:
+            self.status.console.print(f"{user} has no score in {args.game}.")
+            return
+        table = Table("rank", "score", "time", title=f"{user} 的成绩")
+        for score, t, _ in mine.entries():
+            table.add_row(f"{board.rank(score)}", f"{score}", when(-t))
+        self.status.console.print(table)
+
+    def summary(self, boards: list[Board], user: str):
+        table = Table("game", "games", "top", "player", f"{user} best", "rank", title="排行榜")
+        for board in sorted(boards, key=lambda x: x.game):
+            if not board.total:
+                continue
+            best, t, player = board.top.entries()[0]
+            mine = board.best(user)
+            table.add_row(
+                board.game, f"{board.total}", f"{best}", player,
+                f"{mine[0]}" if mine else "-", f"{board.rank(mine[0])}" if mine else "-",
+            )
+        self.status.console.print(table)
+
+
+name = "scores"
+
+__all__ = [
+    "name"
+]
@@ -0,0 +1,506 @@
+"""
+脚本
+
+可执行文件按 shell 脚本执行, 每一行交给普通的命令处理, 支持的语法:
+
+    # 注释
+    NAME=value                              变量, 引用时写 $NAME 或 ${NAME}, $1.. $# $@ $? 是参数和上一条命令的结果
+    命令 && 命令 || 命令
+    if 条件; then ...; elif 条件; then ...; else ...; fi
+    while 条件; do ...; done
+    for x in a b c; do ...; done
+    break, continue, exit [n], sleep 秒
+
+条件是一条命令, 执行成功为真, 可以使用 [ ... ] (test), true, false; 命令输出 ERR 时为失败 (见 Command.error), sh 的结果是脚本的退出码.
+命令的展开 (通配符, 大括号, 变量) 和交互输入相同, 见 nkgame.commands.expansion, for 的列表中的变量在循环开始时读取, 大括号序列和通配符在循环中逐个展开.
+脚本先编译成指令列表, 按内容的摘要缓存, 同样的脚本再次执行时不需要重新解析.
+脚本有自己的当前目录和变量, 执行 cd 和赋值不影响调用者, 可以读取主机的 env
+"""
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import inspect
+import re
+from collections import ChainMap, OrderedDict, deque
+from collections.abc import Mapping
+
+from prompt_toolkit.completion import WordCompleter
+
+from nkgame import metrics
+from nkgame.commands.status import HostNode, TreeSystem, READ, WRITE, EXEC
+from nkgame.pb.game_status_pb2 import FileType
+
+from . import expansion
+from .base import Command, ArgumentParser, ShellContinue, ShellBreak, parse_argv
+
+# 脚本调用脚本的最大深度
+MAX_DEPTH = 16
+# 一次执行最多的指令数, 防止死循环
+MAX_STEPS = 100_000
+
+depth = contextvars.ContextVar("script_depth", default=0)
+
+
+class ScriptError(Exception):
+
+    def __init__(self, line: int, msg: str):
+        super().__init__(f"line {line}: {msg}")
+        self.line = line
+        self.msg = msg
+
+
+class ScriptExit(Exception):
+
+    def __init__(self, code: int):
+        self.code = code
+
+
+# 指令: (操作, 行号, 参数...)
+# run 执行命令, set 赋值, jf / jt 上一条命令失败 / 成功时跳转, jmp 跳转, iter 开始 for 循环, next 取下一个值, 取完时跳转
+Program = tuple[tuple, ...]
+
+statement_regex = re.compile(r"""(?:\$\{?[#?@]|[^;'"#\\]|\\.|'[^']*'|"(?:[^"\\]|\\.)*")+|#.*|;""")
+chain_regex = re.compile(r"""(?:\$\{?[#?@]|[^'"&|\\]|\\.|'[^']*'|"(?:[^"\\]|\\.)*"|&(?!&)|\|(?!\|))+|&&|\|\|""")
+assign_regex = re.compile(r"^([A-Za-z_]\w*)=(.*)$")
+for_regex = re.compile(r"^for\s+([A-Za-z_]\w*)\s+in(?:\s+(.*))?$")
+keywords = ("if", "elif", "else", "fi", "then", "while", "do", "done", "for", "break", "continue")
+
+
+def statements(source: str):
+    """按行和分号拆分语句, 引号中的分号和 # 不拆分, 返回 (行号, 语句)"""
+    for no, line in enumerate(source.splitlines(), 1):
+        for m in statement_regex.finditer(line):
+            s = m.group().strip()
+            if s and s != ";" and not s.startswith("#"):
+                yield no, s
+
+
+def compile_script(source: str) -> Program:
+    code: list[list] = []
+    # 没有结束的 if / 循环
+    blocks: list[dict] = []
+
+    def loop(no: int) -> dict:
+        for b in reversed(blocks):
+            if b["kind"] != "if":
+                return b
+        raise ScriptError(no, "break/continue outside loop")
+
+    def expect(no: int, kind: str, state: str, word: str):
+        if not blocks or blocks[-1]["kind"] != kind or blocks[-1]["state"] != state:
+            raise ScriptError(no, f"unexpected {word}")
+
+    def command(no: int, s: str):
+        """a && b || c: 根据上一条命令的结果跳过后面的命令, 结果保持不变"""
+        parts = [x.group().strip() for x in chain_regex.finditer(s)]
+        jumps = []
+        for i, part in enumerate(parts):
+            if part in ("&&", "||"):
+                jumps.append(len(code))
+                code.append(["jf" if part == "&&" else "jt", no, None])
+                continue
+            m = assign_regex.match(part)
+            code.append(["set", no, m.group(1), m.group(2)] if m else ["run", no, part])
+            if jumps:
+                code[jumps.pop()][2] = len(code)
+
+    pending = deque(statements(source))
+    while pending:
+        no, s = pending.popleft()
+        word, _, rest = s.partition(" ")
+        rest = rest.strip()
+        if word not in keywords:
+            command(no, s)
+            continue
+
+        if word in ("if", "elif"):
+            if word == "elif":
+                expect(no, "if", "body", word)
+                b = blocks[-1]
+                b["ends"].append(len(code))
+                code.append(["jmp", no, None])
+                code[b["jf"]][2] = len(code)
+            else:
+                b = {"kind": "if", "ends": []}
+                blocks.append(b)
+            if not rest:
+                raise ScriptError(no, f"{word} without condition")
+            command(no, rest)
+            b["jf"] = len(code)
+            b["state"] = "cond"
+            code.append(["jf", no, None])
+        elif word == "then":
+            expect(no, "if", "cond", word)
+            blocks[-1]["state"] = "body"
+        elif word == "else":
+            expect(no, "if", "body", word)
+            b = blocks[-1]
+            b["ends"].append(len(code))
+            code.append(["jmp", no, None])
+            code[b["jf"]][2] = len(code)
+            b["jf"] = None
+            b["state"] = "else"
+        elif word == "fi":
+            if not blocks or blocks[-1]["kind"] != "if" or blocks[-1]["state"] not in ("body", "else"):
+                raise ScriptError(no, "unexpected fi")
+            b = blocks.pop()
+            if b["jf"] is not None:
+                code[b["jf"]][2] = len(code)
+            for i in b["ends"]:
+                code[i][2] = len(code)
+        elif word == "while":
+            if not rest:
+                raise ScriptError(no, "while without condition")
+            start = len(code)
+            command(no, rest)
+            blocks.append({"kind": "while", "state": "cond", "continue": start, "breaks": [len(code)]})
+            code.append(["jf", no, None])
+        elif word == "for":
+            m = for_regex.match(s)
+            if m is None:
+                raise ScriptError(no, "usage: for NAME in WORDS; do")
+            slot = len(code)
+            code.append(["iter", no, slot, m.group(2) or ""])
+            blocks.append({"kind": "for", "state": "cond", "continue": len(code), "breaks": [len(code)]})
+            code.append(["next", no, slot, m.group(1), None])
+        elif word == "do":
+            if not blocks or blocks[-1]["kind"] == "if" or blocks[-1]["state"] != "cond":
+                raise ScriptError(no, "unexpected do")
+            blocks[-1]["state"] = "body"
+        elif word == "done":
+            if not blocks or blocks[-1]["kind"] == "if" or blocks[-1]["state"] != "body":
+                raise ScriptError(no, "unexpected done")
+            b = blocks.pop()
+            code.append(["jmp", no, b["continue"]])
+            for i in b["breaks"]:
+                code[i][-1] = len(code)
+        elif word == "break":
+            b = loop(no)
+            b["breaks"].append(len(code))
+            code.append(["jmp", no, None])
+        elif word == "continue":
+            code.append(["jmp", no, loop(no)["continue"]])
+
+        # then / do / else 后面可以直接跟语句
+        if word in ("then", "do", "else") and rest:
+            pending.appendleft((no, rest))
+    if blocks:
+        raise ScriptError(len(source.splitlines()), f"{blocks[-1]['kind']} without end")
+    return tuple(tuple(x) for x in code)
+
+
+class ProgramCache:
+    """按脚本内容的摘要缓存编译结果, 最多保留 size 个"""
+
+    def __init__(self, size=256):
+        self.size = size
+        self.programs: OrderedDict[bytes, Program] = OrderedDict()
+
+    def get(self, tree: TreeSystem) -> Program:
+        h = hashlib.sha1()
+        for chunk in tree.text.chunks():
+            h.update(chunk.encode())
+        key = h.digest()
+        program = self.programs.get(key)
+        if program is not None:
+            self.programs.move_to_end(key)
+            metrics.script_cache_hits.inc()
+            return program
+        metrics.script_cache_misses.inc()
+        program = self.programs[key] = compile_script(tree.data or "")
+        if len(self.programs) > self.size:
+            self.programs.popitem(last=False)
+        return program
+
+
+cache = ProgramCache()
+
+
+class ScriptStatus:
+    """
+    脚本使用的主机代理, 有自己的当前目录和变量, 其他属性转发到真正的主机.
+    HostNode 的方法绑定到代理上, 所以 abspath 等方法使用脚本的当前目录
+    """
+
+    def __init__(self, status: HostNode, env: ChainMap):
+        object.__setattr__(self, "_status", status)
+        object.__setattr__(self, "path", status.path[:])
+        object.__setattr__(self, "env", env)
+
+    def __getattr__(self, item):
+        attr = getattr(HostNode, item, None)
+        if inspect.isfunction(attr):
+            return attr.__get__(self)
+        return getattr(self._status, item)
+
+    def __setattr__(self, key, value):
+        if key in ("path", "env"):
+            object.__setattr__(self, key, value)
+        else:
+            setattr(self._status, key, value)
+
+
+class Variables(Mapping):
+    """展开时使用的变量, 除了脚本的变量还有参数 $1.. $# $@ 和上一条命令的结果 $?"""
+
+    def __init__(self, interpreter: 'Interpreter'):
+        self.interpreter = interpreter
+
+    def __getitem__(self, name: str):
+        it = self.interpreter
+        if name == "#":
+            return str(len(it.argv) - 1)
+        if name == "?":
+            return str(it.code)
+        if name == "@":
+            return it.argv[1:]
+        if name.isdigit():
+            i = int(name)
+            return it.argv[i] if i < len(it.argv) else ""
+        return it.scope[name]
+
+    def __iter__(self):
+        return iter(self.interpreter.scope)
+
+    def __len__(self):
+        return len(self.interpreter.scope)
+
+
+class Interpreter:
+
+    def __init__(self, status: HostNode, program: Program, argv: list[str]):
+        self.program = program
+        # 脚本中的赋值只在脚本内有效, 读取时找不到再读主机的 env
+        self.scope = ChainMap({}, status.env)
+        self.status = ScriptStatus(status, self.scope)
+        self.variables = Variables(self)
+        self.argv = argv
+        self.code = 0
+
+    def expand(self, no: int, s: str, pathnames: bool = True, frozen: bool = False):
+        try:
+            return expansion.expand(self.status, s, self.variables, pathnames, frozen)
+        except ValueError as e:
+            raise ScriptError(no, str(e))
+
+    async def run(self) -> int:
+        iters: dict[int, list] = {}
+        pc = 0
+        steps = 0
+        try:
+            while pc < len(self.program):
+                op, no, *a = self.program[pc]
+                pc += 1
+                steps += 1
+                if steps > MAX_STEPS:
+                    raise ScriptError(no, f"more than {MAX_STEPS} steps")
+                if steps % 1000 == 0:
+                    # 长时间的循环让出事件循环
+                    await asyncio.sleep(0)
+                if op == "run":
+                    self.code = await self.execute(no, a[0])
+                elif op == "set":
+                    self.scope[a[0]] = " ".join(self.expand(no, a[1], pathnames=False))
+                elif op == "jf":
+                    if self.code != 0:
+                        pc = a[0]
+                elif op == "jt":
+                    if self.code == 0:
+                        pc = a[0]
+                elif op == "jmp":
+                    pc = a[0]
+                elif op == "iter":
+                    # 变量 (包括 $?) 在循环开始时读取, 循环中的赋值不影响;
+                    # 大括号序列和路径匹配按需展开, 匹配很多文件时不需要先生成整个列表
+                    iters[a[0]] = self.expand(no, a[1], frozen=True)
+                elif op == "next":
+                    word = next(iters[a[0]], None)
+                    if word is not None:
+                        self.scope[a[1]] = word
+                    else:
+                        pc = a[2]
+        except ScriptExit as e:
+            self.code = e.code
+        return self.code
+
+    async def execute(self, no: int, line: str) -> int:
+        """执行一条命令, 返回结果, 0 是成功"""
+        words = list(self.expand(no, line))
+        if not words:
+            return 0
+        builtin = builtins.get(words[0])
+        if builtin is not None:
+            return await builtin(self, no, words[1:])
+        try:
+            # 参数错误和 --help 时 argparse 抛出 ShellContinue
+            parsed = parse_argv(self.status, words)
+        except ShellContinue:
+            return 1
+        if parsed is None:
+            return 1
+        c, nargs = parsed
+        if c.is_interactive(nargs):
+            self.status.console.print(f"[red]ERR[/] {c.name} can not run in script.")
+            return 1
+        try:
+            return await c.execute(self.status, nargs)
+        except ShellContinue:
+            return 1
+        except ShellBreak:
+            raise ScriptExit(0)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.status.console.print(f"[red]ERR[/] error: {e}")
+            return 1
+
+
+async def builtin_exit(self: Interpreter, no: int, args: list[str]) -> int:
+    raise ScriptExit(int(args[0]) if args and args[0].isdigit() else self.code)
+
+
+async def builtin_sleep(self: Interpreter, no: int, args: list[str]) -> int:
+    try:
+        await asyncio.sleep(float(args[0]) if args else 0)
+    except ValueError:
+        raise ScriptError(no, f"invalid sleep time {args[0]}")
+    return 0
+
+
+async def builtin_true(self: Interpreter, no: int, args: list[str]) -> int:
+    return 0
+
+
+async def builtin_false(self: Interpreter, no: int, args: list[str]) -> int:
+    return 1
+
+
+def number(no: int, s: str) -> float:
+    try:
+        return float(s)
+    except ValueError:
+        raise ScriptError(no, f"{s} is not a number")
+
+
+numeric = {
+    "-eq": lambda a, b: a == b, "-ne": lambda a, b: a != b,
+    "-lt": lambda a, b: a < b, "-le": lambda a, b: a <= b,
+    "-gt": lambda a, b: a > b, "-ge": lambda a, b: a >= b,
+}
+
+
+files_tests = {
+    "-e": lambda status, f: True,
+    "-f": lambda status, f: f.type != FileType.dir,
+    "-d": lambda status, f: f.type == FileType.dir,
+    "-r": lambda status, f: status.can(f, READ),
+    "-w": lambda status, f: status.can(f, WRITE),
+    "-x": lambda status, f: status.can(f, EXEC),
+}
+
+
+async def builtin_test(self: Interpreter, no: int, args: list[str]) -> int:
+    if args and args[-1] == "]":
+        args = args[:-1]
+    negate = bool(args) and args[0] == "!"
+    if negate:
+        args = args[1:]
+    if not args:
+        result = False
+    elif len(args) == 1:
+        result = args[0] != ""
+    elif len(args) == 2:
+        flag, value = args
+        if flag == "-n":
+            result = value != ""
+        elif flag == "-z":
+            result = value == ""
+        elif flag in files_tests:
+            f = self.status.lookup(self.status.abspath(value))
+            result = f is not None and files_tests[flag](self.status, f)
+        else:
+            raise ScriptError(no, f"unknown test {flag}")
+    elif len(args) == 3:
+        a, op, b = args
+        if op in ("=", "=="):
+            result = a == b
+        elif op == "!=":
+            result = a != b
+        elif op in numeric:
+            result = numeric[op](number(no, a), number(no, b))
+        else:
+            raise ScriptError(no, f"unknown test {op}")
+    else:
+        raise ScriptError(no, "too many arguments for test")
+    return 0 if result != negate else 1
+
+
+builtins = {
+    "exit": builtin_exit,
+    "sleep": builtin_sleep,
+    "true": builtin_true,
+    "false": builtin_false,
+    "test": builtin_test,
+    "[": builtin_test,
+}
+
+
+class ShCommand(Command):
+    class ScriptCompleter(WordCompleter):
+
+        def get_completions(self, document, complete_event):
+            self.words = [
+                x.name for x in Command.status.listdir()
+                if x.type in (FileType.exe, FileType.txt) and Command.status.can(x, READ)
+            ]
+            return super().get_completions(document, complete_event)
+
+    name = "sh"
+    words = {"sh": ScriptCompleter([])}
+    # 脚本本身占用的负载和内存, 其中的命令另外计算
+    load = 10
+    memory = 8
+
+    args = ArgumentParser(prog="sh", usage="sh lib/v1.sh arg1, ./v1.sh &", description="执行脚本", epilog="")
+    args.add_argument("file", help="脚本路径")
+    args.add_argument("argv", help="脚本参数", nargs=argparse.REMAINDER)
+    # 直接用路径执行时需要是可执行文件
+    args.add_argument("--exec", dest="exec", help=argparse.SUPPRESS, action="store_true")
+
+    async def run(self, args: argparse.Namespace):
+        f = self.status.lookup(self.status.abspath(args.file))
+        if f is None or f.type == FileType.dir:
+            self.error(f"{args.file} not exists.")
+            return
+        # 直接用路径执行时还需要执行权限
+        need = READ | EXEC if args.exec else READ
+        if not self.status.can(f, need) or (args.exec and f.type != FileType.exe):
+            self.error(f"{args.file} permission denied.")
+            return
+        if f.type not in (FileType.exe, FileType.txt):
+            self.error(f"{args.file} is not a script.")
+            return
+        if depth.get() >= MAX_DEPTH:
+            self.error("script nesting too deep.")
+            return
+        token = depth.set(depth.get() + 1)
+        try:
+            program = cache.get(f)
+            code = await Interpreter(self.status, program, [args.file, *args.argv]).run()
+        except ScriptError as e:
+            self.error(f"{args.file}: {e}")
+            return
+        finally:
+            depth.reset(token)
+        if code:
+            self.error(f"{args.file} exited with {code}.")
+            # 结果是脚本的退出码
+            self.code = code
+
+
+name = "script"
+
+__all__ = [
+    "name"
+]
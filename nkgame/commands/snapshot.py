@@ -0,0 +1,98 @@
+import argparse
+import datetime
+
+from rich.table import Table
+
+from nkgame.commands.status import ROOT
+
+from .base import Command, ArgumentParser
+from .files import walk
+
+
+class SnapshotCommand(Command):
+    name = "snapshot"
+    words = "snapshot"
+
+    args = ArgumentParser(prog="snapshot", usage="snapshot before-rm", description="保存所有主机的快照", epilog="")
+    args.add_argument("name", help="快照名称", nargs="?", default="")
+
+    async def run(self, args: argparse.Namespace):
+        game = self.status.game
+        # 没有修改过的子树直接使用缓存的不可变版本
+        snapshot = game.snapshots.take(args.name, {x.ip: x.file_sys for x in list(game.hosts.values())})
+        self.status.console.print(f"snapshot [bold]{snapshot.id}[/] saved, {len(snapshot.hosts)} hosts.")
+
+
+class SnapshotsCommand(Command):
+    name = "snapshots"
+    words = "snapshots"
+
+    args = ArgumentParser(prog="snapshots", usage="snapshots", description="显示快照列表", epilog="")
+    args.add_argument("-d", "--delete", dest="delete", help="删除快照", type=int, default=None)
+
+    async def run(self, args: argparse.Namespace):
+        store = self.status.game.snapshots
+        if args.delete is not None:
+            if not store.delete(args.delete):
+                self.error(f"snapshot {args.delete} not exists.")
+            return
+        store.load()
+        table = Table("id", "name", "time", "hosts", title="快照")
+        for x in store.snapshots.values():
+            created = datetime.datetime.fromtimestamp(x.created).strftime("%Y-%m-%d %H:%M:%S")
+            table.add_row(f"{x.id}", x.name, created, f"{len(x.hosts)}")
+        self.status.console.print(table)
+
+
+class RestoreCommand(Command):
+    name = "restore"
+    words = "restore"
+
+    args = ArgumentParser(prog="restore", usage="restore 1", description="恢复到快照", epilog="")
+    args.add_argument("id", help="快照编号", type=int)
+    args.add_argument("-c", "--current", dest="current", help="只恢复当前主机", action="store_true")
+
+    async def run(self, args: argparse.Namespace):
+        game = self.status.game
+        snapshot = game.snapshots.get(args.id)
+        if snapshot is None:
+            self.error(f"snapshot {args.id} not exists.")
+            return
+        hosts = snapshot.hosts
+        if args.current:
+            if self.status.ip not in hosts:
+                self.error(f"snapshot {args.id} does not contain this host.")
+                return
+            hosts = {self.status.ip: hosts[self.status.ip]}
+        # 恢复会替换整个文件树, 当前和快照中的每个节点都必须属于这个用户, 全部检查完才修改, 不会只恢复一部分主机
+        user = self.status.name
+        restore, denied = [], []
+        for ip, root in hosts.items():
+            node = game.hosts.get(ip)
+            if node is None:
+                continue
+            tree = root.thaw()
+            if user != ROOT and any(
+                x.effective_owner not in ("", user) for t in (node.file_sys, tree) for x in walk(t, True)
+            ):
+                denied.append(node.host)
+                continue
+            restore.append((node, tree))
+        if denied:
+            more = f" and {len(denied) - 1} more hosts" if len(denied) > 1 else ""
+            self.error(f"{denied[0]}{more}: operation not permitted.")
+            return
+        for node, tree in restore:
+            node.file_sys = tree
+            if node.lookup(node.path) is None:
+                node.path = node.path[:1]
+        restored = len(restore)
+        game.save()
+        self.status.console.print(f"restored {restored} hosts to snapshot [bold]{snapshot.id}[/].")
+
+
+name = "snapshot"
+
+__all__ = [
+    "name"
+]
@@ -0,0 +1,110 @@
+import argparse
+import cProfile
+import io
+import pstats
+import tracemalloc
+from pathlib import Path
+
+from rich.table import Table
+
+import nkgame
+from nkgame import metrics
+
+from .base import Command, ArgumentParser, MissCommand
+
+
+class StatsCommand(Command):
+    name = "stats"
+    words = "stats"
+
+    args = ArgumentParser(prog="stats", usage="stats", description="显示运行指标", epilog="")
+    args.add_argument(
+        "-e", "--export", dest="export", nargs="?", const=str(Path(nkgame.__file__).parent / "metrics.prom"),
+        default=None, help="导出 prometheus 文本到文件"
+    )
+
+    async def run(self, args: argparse.Namespace):
+        if args.export:
+            Path(args.export).write_text(metrics.registry.to_prometheus(), encoding="utf-8")
+            self.status.console.print(f"metrics exported to {args.export}")
+            return
+
+        h = metrics.command_seconds
+        table = Table("command", "count", "errors", "avg ms", "p50 ms", "p99 ms", "max ms", title="命令耗时")
+        for labels, v in sorted(h.values.items(), key=lambda x: -x[1].sum):
+            command = dict(labels)["command"]
+            table.add_row(
+                command, f"{v.count}", f"{metrics.command_errors.get(command=command):.0f}",
+                f"{v.sum / v.count * 1000:.2f}",
+                f"{h.quantile(0.5, labels) * 1000:.2f}", f"{h.quantile(0.99, labels) * 1000:.2f}",
+                f"{v.max * 1000:.2f}",
+            )
+        self.status.console.print(table)
+
+        cache = self.status.game.cache
+        self.status.console.print(
+            f"host cache: {len(cache.lru)} 台主机在内存中, {cache.used / 1024 ** 2:.1f}/{cache.budget / 1024 ** 2:.1f} MB, "
+            f"命中 {metrics.host_cache_hits.get():.0f}, 未命中 {metrics.host_cache_misses.get():.0f}, "
+            f"换出 {metrics.host_cache_evictions.get():.0f}"
+        )
+
+        s = metrics.save_seconds.values.get(())
+        if s is not None:
+            self.status.console.print(
+                f"save: {s.count} 次, 平均 {s.sum / s.count * 1000:.2f} ms, 最大 {s.max * 1000:.2f} ms, "
+                f"写入 {metrics.save_bytes.get():.0f} bytes"
+            )
+
+
+class ProfileCommand(Command):
+    name = "profile"
+    words = "profile"
+
+    args = ArgumentParser(prog="profile", usage="profile ls -l", description="分析命令的耗时或内存", epilog="")
+    args.add_argument("-m", "--memory", dest="memory", help="使用 tracemalloc 分析内存", action="store_true")
+    args.add_argument("-n", "--top", dest="top", help="显示条数", default=15, type=int)
+    args.add_argument("command", help="要分析的命令", nargs=argparse.REMAINDER)
+
+    async def run(self, args: argparse.Namespace):
+        if not args.command:
+            self.error("missing command.")
+            return
+        cmd, *rest = args.command
+        c = Command.commands.get(cmd, MissCommand)
+        if c.args is None:
+            c.args = ArgumentParser()
+        nargs, v = c.args.parse_known_args(rest)
+        if v:
+            self.error(f"args error: [red]{''.join(v)}[/]")
+            return
+
+        out = io.StringIO()
+        if args.memory:
+            started = tracemalloc.is_tracing()
+            if not started:
+                tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            try:
+                await c.execute(self.status, nargs)
+            finally:
+                after = tracemalloc.take_snapshot()
+                if not started:
+                    tracemalloc.stop()
+            for stat in after.compare_to(before, "lineno")[:args.top]:
+                print(stat, file=out)
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await c.execute(self.status, nargs)
+            finally:
+                profiler.disable()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(args.top)
+        self.status.console.print(out.getvalue(), markup=False, highlight=False)
+
+
+name = "stats"
+
+__all__ = [
+    "name"
+]
@@ -1,5 +1,14 @@
+import os
 import re
 import json
+import time
+import contextlib
+import tempfile
+import bisect
+import hashlib
+import ipaddress
+import socket
+from collections import OrderedDict
 from pathlib import Path
 from rich.console import Console
 from enum import Enum
@@ -12,35 +21,292 @@ from nkgame.pb.game_status_pb2 import (
     FileType
 )
 import nkgame
+from nkgame import metrics
+from nkgame.game import savefile
+from nkgame.game.text import Text, nbytes
+from nkgame.game.player import Player
+from nkgame.game.topology import Topology, Route, ipv4
 
 
 class NodeType(Enum):
     pass
 
 
+# 权限位, 和 unix 的 rwx 相同
+READ, WRITE, EXEC = 4, 2, 1
+# TreeSystem.access 返回的掩码中表示可以看到这个节点
+VISIBLE = 8
+# 不受权限限制的用户
+ROOT = "root"
+
+
+def byte_size(data: Union[None, str, Text]) -> int:
+    """内容编码后的字节数, du 和传输统计的大小都是字节数"""
+    if not data:
+        return 0
+    return data.nbytes if isinstance(data, Text) else nbytes(data)
+
+
+def legacy_mode(readable: bool, writable: bool, executable: bool) -> int:
+    """旧存档只有其他用户的权限标记, 所有者可以读写执行"""
+    return 0o700 | (readable and 0o044) | (writable and 0o022) | (executable and 0o011)
+
+
 class TreeSystem:
 
     def __init__(self, name, ex: int, data=None):
         self.name = name
-        self.sub = []
+        # 子节点按 (类型, 名称) 排序, _keys 是对应的排序键, 插入时二分查找位置
+        self.sub: list[TreeSystem] = []
+        self._keys: list[tuple] = []
+        self._width: Union[None, int] = None
         self.index: dict[str, TreeSystem] = {}
         self.type = ex
-        self.data = data
+        self._data = data
+        # 内容的字节数, 修改内容时更新, 不需要每次重新编码
+        self._size = byte_size(data)
         self.parent: Union[None, TreeSystem] = None
+        # 目录保存整个子树的统计, [字节数, 各类型的数量...], 文件在需要时直接计算
+        self._totals: Union[None, list[int]] = self.contribution() if ex == FileType.dir else None
+        # 对应的不可变版本, 子树有修改时清空, 见 nkgame.game.snapshot
+        self._frozen = None
+
+        # 所有者和权限位, 见 access, readable 等标记是其他用户的权限
+        self._owner = ""
+        self._mode = 0o700
+        self._visible = False
+        # 有效权限的缓存, 用户名 -> 掩码, 有缓存的节点的祖先一定也有缓存
+        self._access: Union[None, dict[str, int]] = None
+        self._effective_owner = ""
+
+    def _bit(mask: int):
+        def get(self) -> bool:
+            return bool(self._mode & mask & 0o007)
 
-        self.readable = False
-        self.writable = False
-        self.executable = False
-        self.visible = False
+        def set(self, value: bool):
+            self.mode = self._mode | mask if value else self._mode & ~mask
+
+        return property(get, set)
+
+    readable = _bit(0o044)
+    writable = _bit(0o022)
+    executable = _bit(0o011)
+    del _bit
+
+    @property
+    def visible(self) -> bool:
+        """其他用户能否看到, 所有者总是可以看到"""
+        return self._visible
+
+    @visible.setter
+    def visible(self, value: bool):
+        if self._visible != value:
+            self._visible = value
+            self._permission_changed()
+
+    @property
+    def owner(self) -> str:
+        """设置的所有者, 空表示和上级目录相同, 实际的所有者见 effective_owner"""
+        return self._owner
+
+    @owner.setter
+    def owner(self, value: str):
+        if self._owner != value:
+            self._owner = value
+            self._permission_changed()
+
+    @property
+    def mode(self) -> int:
+        return self._mode
+
+    @mode.setter
+    def mode(self, value: int):
+        value &= 0o777
+        if self._mode != value:
+            self._mode = value
+            self._permission_changed()
+
+    def _permission_changed(self):
+        self._invalidate()
+        self._invalidate_access()
+
+    def _invalidate_access(self):
+        """清除子树中缓存的有效权限, 节点没有缓存时子孙也没有, 不需要继续向下"""
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree._access is not None:
+                tree._access = None
+                stack.extend(tree.sub)
+
+    @property
+    def effective_owner(self) -> str:
+        """实际的所有者, 向上找到第一个设置了所有者的节点, 结果和有效权限一起缓存"""
+        if self._access is None:
+            self._access = {}
+            owner = self._owner
+            if not owner and self.parent is not None:
+                owner = self.parent.effective_owner
+            self._effective_owner = owner
+        return self._effective_owner
+
+    def access(self, user: str) -> int:
+        """
+        用户的有效权限, READ | WRITE | EXEC | VISIBLE 的组合, 第一次查询时计算, 之后直接读取缓存.
+        所有者使用所有者的权限位, 其他用户使用其他用户的权限位 (没有用户组);
+        没有所有者 (旧存档和新建的主机) 时所有人都是所有者, root 不受限制;
+        上级目录没有 EXEC 权限时子树中的节点都不能访问
+        """
+        owner = self.effective_owner
+        mask = self._access.get(user)
+        if mask is not None:
+            return mask
+        if user == ROOT:
+            mask = READ | WRITE | EXEC | VISIBLE
+        elif owner in ("", user):
+            mask = self._mode >> 6 & 0o7 | VISIBLE
+        else:
+            mask = self._mode & 0o7 | (VISIBLE if self._visible else 0)
+        if self.parent is not None and not self.parent.access(user) & EXEC:
+            mask = 0
+        self._access[user] = mask
+        return mask
+
+    def allows(self, user: str, bits: int) -> bool:
+        return self.access(user) & bits == bits
+
+    @property
+    def mode_string(self) -> str:
+        """ls -l 中显示的权限, 如 rwxr-xr-x"""
+        return "".join(c if self._mode & (1 << (8 - i)) else "-" for i, c in enumerate("rwx" * 3))
+
+    def _invalidate(self):
+        """子树修改后清除自身和祖先缓存的不可变版本, 有缓存的节点的子孙一定也有缓存"""
+        tree = self
+        while tree is not None and tree._frozen is not None:
+            tree._frozen = None
+            tree = tree.parent
 
     def add(self, obj: 'TreeSystem'):
-        self.sub.append(obj)
+        key = (obj.type, obj.name)
+        if not self._keys or key >= self._keys[-1]:
+            # 从存档读取时子节点已经有序
+            self._keys.append(key)
+            self.sub.append(obj)
+        else:
+            i = bisect.bisect_right(self._keys, key)
+            self._keys.insert(i, key)
+            self.sub.insert(i, obj)
         obj.parent = self
         self.index[obj.name] = obj
+        if obj._access is not None:
+            obj._invalidate_access()
+        self._update_totals(obj.totals, 1)
         if obj.type == FileType.dir:
             return obj
         return self
 
+    def remove(self, obj: 'TreeSystem'):
+        i = bisect.bisect_left(self._keys, (obj.type, obj.name))
+        while self.sub[i] is not obj:
+            i += 1
+        del self._keys[i]
+        del self.sub[i]
+        if self.index.get(obj.name) is obj:
+            self.index.pop(obj.name)
+        obj.parent = None
+        if obj._access is not None:
+            obj._invalidate_access()
+        self._update_totals(obj.totals, -1)
+
+    type_count = max(FileType.values()) + 1
+
+    def contribution(self) -> list[int]:
+        """节点自身的统计, 不包括子节点"""
+        r = [0] * (self.type_count + 1)
+        r[0] = self._size
+        r[self.type + 1] = 1
+        return r
+
+    @property
+    def totals(self) -> list[int]:
+        return self._totals if self._totals is not None else self.contribution()
+
+    @property
+    def size(self) -> int:
+        """整个子树的字节数"""
+        return self.totals[0]
+
+    def count(self, ex: int) -> int:
+        """子树中某种类型的节点数量, 目录包括自身"""
+        return self.totals[ex + 1]
+
+    def _update_totals(self, delta: list[int], sign: int):
+        """把子树统计的变化沿父节点向上累加, 查询时不需要遍历"""
+        self._invalidate()
+        tree = self
+        while tree is not None:
+            totals = tree._totals
+            for i, v in enumerate(delta):
+                if v:
+                    totals[i] += sign * v
+            tree = tree.parent
+
+    @property
+    def data(self):
+        """文本内容, 按块保存的内容在这里拼接成 str, 需要按块处理时使用 text"""
+        if isinstance(self._data, Text):
+            return str(self._data)
+        return self._data
+
+    @property
+    def text(self) -> Text:
+        if isinstance(self._data, Text):
+            return self._data
+        if not self._data:
+            return Text()
+        # 内容不变, 不需要清除缓存
+        self._data = Text.of(self._data)
+        return self._data
+
+    def append(self, s: str):
+        """追加内容, 不复制整个文件"""
+        self.data = self.text.append(s)
+
+    def update(self, s: str) -> bool:
+        """替换为新内容, 只有修改过的部分重新分块, 没有修改的块和之前的版本共享, 返回内容是否有变化"""
+        current = self.text
+        text = current.update(s)
+        if text is current:
+            return False
+        self.data = text
+        return True
+
+    @data.setter
+    def data(self, value):
+        size = byte_size(value)
+        delta = size - self._size
+        if value is not self._data:
+            self._invalidate()
+        self._data = value
+        self._size = size
+        if delta:
+            tree = self if self._totals is not None else self.parent
+            while tree is not None:
+                tree._totals[0] += delta
+                tree = tree.parent
+
+    @property
+    def width(self) -> int:
+        """名称的显示宽度"""
+        if self._width is None:
+            self._width = max(wcswidth(self.name), len(self.name))
+        return self._width
+
+    @property
+    def color(self) -> str:
+        return self.color_map.get(self.type, ('white', 0))[0]
+
     def set_data(self, obj):
         self.data = obj
         return self
@@ -65,16 +331,17 @@ class TreeSystem:
             readable=self.readable,
             writable=self.writable,
             executable=self.executable,
-            visible=self.visible
+            visible=self.visible,
+            owner=self.owner,
+            mode=self.mode,
         )
 
     @classmethod
     def load_proto(cls, pb: TreeSystemData) -> 'TreeSystem':
         tree = cls(pb.name, ex=pb.type, data=pb.data)
-        tree.readable = pb.readable
-        tree.writable = pb.writable
-        tree.executable = pb.executable
-        tree.visible = pb.visible
+        tree._owner = pb.owner
+        tree._mode = pb.mode if pb.HasField("mode") else legacy_mode(pb.readable, pb.writable, pb.executable)
+        tree._visible = pb.visible
         [tree.add(cls.load_proto(x)) for x in pb.sub]
         return tree
 
@@ -96,7 +363,7 @@ class TreeSystem:
 
     def __format__(self, format_spec):
         n = len(str(self)) - len(self.name)
-        m = wcswidth(self.name) - len(self.name)
+        m = self.width - len(self.name)
         f = self.format_spec_regex.match(format_spec)
         if f is None:
             return str(self)
@@ -108,47 +375,512 @@ class TreeSystem:
 
 class HostNode:
 
-    def __init__(self, name="admin", host="localhost", file=None, game=None):
+    def __init__(self, name="admin", host="localhost", file=None, game=None, ip=None):
         self.console = Console()
         self.name = name
         self.host = host
+        # ip 地址在加入主机表时分配, 修改主机名不会改变
+        self.ip: Union[None, str] = ip
         self.path: list[str] = ["root"]
         self.env: dict[str: any] = {}
-        self.file_sys: TreeSystem = file
         self.game: GameStatus = game
+        # 文件系统可能被换出到磁盘, 通过 file_sys 属性访问时再读回来, 见 HostCache
+        self._file_sys: Union[None, TreeSystem] = file
+        self._segment: Union[None, Path] = None
+        self.tree_size = 0
+        # 大于 0 时不会被换出, 有会话或传输正在使用
+        self.pins = 0
+        self.player = Player()
+        # 后台任务, 见 nkgame.commands.jobs
+        self.jobs: dict[int, any] = {}
+        # 由世界生成器生成的主机, 记录生成时的摘要, 没有改动时不需要存档
+        self.generated: Union[None, bytes] = None
+
+        self.config = self.load_config()
 
+    def load_config(self) -> dict:
         config = self.file_sys.index.get(".config")
         if config is None:
             config = TreeSystem(".config", FileType.bin, data="{}")
             self.file_sys.add(config)
-        self.config = json.loads(config.data)
+        return json.loads(config.data)
+
+    @property
+    def file_sys(self) -> TreeSystem:
+        if self.game is not None:
+            self.game.cache.touch(self)
+        return self._file_sys
+
+    @file_sys.setter
+    def file_sys(self, tree: TreeSystem):
+        if self.game is not None:
+            self.game.cache.discard(self)
+        self._file_sys = tree
+        self._segment = None
+
+    @property
+    def resident(self) -> bool:
+        return self._file_sys is not None
+
+    @contextlib.contextmanager
+    def pinned(self):
+        if self.pins == 0 and self.game is not None:
+            self.game.cache.lookup(self)
+        self.pins += 1
+        try:
+            yield self
+        finally:
+            self.pins -= 1
+
+    def to_proto(self):
+        if self._file_sys is None:
+            # 已经换出的主机直接使用磁盘上的数据, 不需要重建文件树
+            files = TreeSystemData.FromString(self._segment.read_bytes())
+        else:
+            files = self._file_sys.to_proto()
+        return HostNodeData(name=self.name, host=self.host, ip=self.ip, files=files)
+
+    @staticmethod
+    def digest(pb: HostNodeData) -> bytes:
+        return hashlib.sha1(pb.SerializeToString(deterministic=True)).digest()
+
+    def abspath(self, path: str) -> list[str]:
+        """
+        把相对当前目录或以 / 开头的路径转换为和 self.path 相同格式的列表, 如 ["root", "lib"]
+        """
+        path = path.strip()
+        if path == "~" or path.startswith("~/"):
+            result, path = self.path[:1], path[1:]
+        elif path.startswith("/"):
+            result = self.path[:1]
+        else:
+            result = self.path[:]
+        for x in path.split("/"):
+            if x == "..":
+                if len(result) > 1:
+                    result.pop()
+            elif x and x != ".":
+                result.append(x)
+        return result
+
+    def lookup(self, path: list[str]) -> Union[None, TreeSystem]:
+        """按 abspath 返回的路径查找文件或目录, 不存在时返回 None"""
+        tree = self.file_sys
+        for x in path[1:]:
+            if tree.type != FileType.dir:
+                return None
+            tree = tree.index.get(x)
+            if tree is None:
+                return None
+        return tree
+
+    def can(self, tree: TreeSystem, bits: int) -> bool:
+        """当前登录的用户 (self.name) 对节点是否有这些权限, 见 TreeSystem.access"""
+        return tree.allows(self.name, bits)
+
+    def listdir(self, tree: TreeSystem = None) -> list[TreeSystem]:
+        """目录 (默认是当前目录) 中当前用户可以看到的子节点, 没有读取权限时为空"""
+        if tree is None:
+            tree = self.lookup(self.path)
+        if tree is None or not tree.allows(self.name, READ):
+            return []
+        user = self.name
+        return [x for x in tree.sub if x.access(user) & VISIBLE]
+
+    def adopt(self, parent: TreeSystem, tree: TreeSystem) -> TreeSystem:
+        """新建的节点属于当前用户, 上级目录属于其他用户时记录所有者, 否则和上级目录相同"""
+        if parent.effective_owner not in ("", self.name):
+            tree.owner = self.name
+        return tree
+
+    def save_file(self, tree: TreeSystem):
+        """只保存修改过的文件, 写入增量存档, 不重写整个存档"""
+        path = []
+        x = tree
+        while x is not None:
+            path.append(x.name)
+            x = x.parent
+        if self.game.shard is not None:
+            self.game.shard.sync()
+            return
+        self.game.journal.record(self.ip, path[::-1], tree)
+
+
+class HostTable(dict):
+    """
+    主机表
+    以主机名为 key, 同时维护 ip 地址到主机名的索引和所有 ip 地址的有序列表, 主机名和 ip 地址都可以用来查找主机.
+    设置了世界生成器时, 生成的主机在第一次访问时才创建, values() 只包含已经创建的主机
+    """
+
+    # 不是 ip 地址的主机名从这里开始分配地址
+    allocate_network = ipaddress.ip_network("172.16.0.0/12")
+
+    def __init__(self, game: 'GameStatus'):
+        super().__init__()
+        self.game = game
+        self.generator = None
+        # 已经创建的主机, ip -> 主机名
+        self.by_ip: dict[int, str] = {}
+        # 所有主机 (包括还没有生成的) 的 ip, 有序
+        self._ips: list[int] = []
+
+    def set_generator(self, generator):
+        self.generator = generator
+        ips = set(self.by_ip)
+        if generator is not None:
+            ips.update(ipv4(x) for x in generator.names)
+        self._ips = sorted(ips)
+
+    def resolve(self, key: str) -> Union[None, str]:
+        """主机名或 ip 地址 -> 主机名, 不存在时返回 None"""
+        if dict.__contains__(self, key):
+            return key
+        ip = ipv4(key)
+        if ip is None:
+            return None
+        if ip in self.by_ip:
+            return self.by_ip[ip]
+        if self.generator is not None and key in self.generator:
+            return key
+        return None
+
+    def ip_of(self, key: str) -> Union[None, str]:
+        name = self.resolve(key)
+        if name is None:
+            return None
+        if dict.__contains__(self, name):
+            return dict.__getitem__(self, name).ip
+        return name
+
+    def __setitem__(self, key, node: HostNode):
+        if not dict.__contains__(self, key):
+            if node.ip is None:
+                node.ip = self.allocate(key)
+            ip = ipv4(node.ip)
+            if self.by_ip.get(ip, key) != key:
+                raise KeyError(f"ip {node.ip} already used by {self.by_ip[ip]}")
+            self.by_ip[ip] = key
+            i = bisect.bisect_left(self._ips, ip)
+            if i == len(self._ips) or self._ips[i] != ip:
+                self._ips.insert(i, ip)
+                topology = self.game._topology
+                if topology is not None:
+                    topology.add_host(node.ip)
+        super().__setitem__(key, node)
+
+    def __missing__(self, key):
+        name = self.resolve(key)
+        if name is None:
+            raise KeyError(key)
+        if name != key:
+            return self[name]
+        node = self[key] = self.generator.generate(key, self.game)
+        return node
+
+    def __contains__(self, key):
+        return self.resolve(key) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        if self.generator is None:
+            return dict.keys(self)
+        return dict.keys(self) | self.generator.hosts.keys()
+
+    def drop(self, key: str):
+        """移除已经创建的主机并停止它的进程和定时任务, 生成的主机再次访问时重新生成"""
+        node: HostNode = dict.pop(self, key)
+        ip = ipv4(node.ip)
+        if self.by_ip.get(ip) == key:
+            del self.by_ip[ip]
+        node.player.stop()
+        self.game.cache.discard(node)
+        self.set_generator(self.generator)
+        self.game._topology = None
+
+    def rename(self, old: str, new: str):
+        # 保持原来的顺序, 存档中的第一台主机是玩家的初始主机
+        items = [(new if k == old else k, v) for k, v in dict.items(self)]
+        node: HostNode = dict.__getitem__(self, old)
+        node.host = new
+        dict.clear(self)
+        dict.update(self, items)
+        self.by_ip[ipv4(node.ip)] = new
+
+    def allocate(self, host: str) -> str:
+        if ipv4(host) is not None:
+            return host
+        if host == "localhost":
+            return "127.0.0.1"
+        for address in self.allocate_network.hosts():
+            if int(address) not in self.by_ip:
+                return str(address)
+        raise KeyError("no ip address available")
+
+    def ips(self) -> list[str]:
+        return [socket.inet_ntoa(x.to_bytes(4, "big")) for x in self._ips]
+
+    def ip_range(self, network: Union[ipaddress.IPv4Network, str]):
+        """
+        按 ip 地址范围查询, 返回 (ip, 主机名)
+        """
+        network = ipaddress.ip_network(network, strict=False)
+        lo = bisect.bisect_left(self._ips, int(network.network_address))
+        hi = bisect.bisect_right(self._ips, int(network.broadcast_address))
+        for ip in self._ips[lo:hi]:
+            address = socket.inet_ntoa(ip.to_bytes(4, "big"))
+            yield address, self.by_ip.get(ip, address)
+
+
+def tree_size(tree: TreeSystem) -> int:
+    """估算文件树占用的内存"""
+    totals = tree.totals
+    return 200 * sum(totals[1:]) + totals[0]
+
+
+class HostCache:
+    """
+    主机文件系统的 LRU 缓存
+    内存中的文件系统超过 budget 时, 把最久没有访问的主机写到单独的文件并释放文件树, 再次访问时读回
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.used = 0
+        self.lru: OrderedDict[int, HostNode] = OrderedDict()
+        self._dir: Union[None, tempfile.TemporaryDirectory] = None
+
+    def lookup(self, node: HostNode):
+        """命令或会话开始使用主机, 命中次数按这里统计, 访问 file_sys 属性只调用 touch"""
+        if id(node) in self.lru:
+            metrics.host_cache_hits.inc()
+        self.touch(node)
+
+    def touch(self, node: HostNode):
+        key = id(node)
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            self.resize(node)
+            return
+        if node._file_sys is None:
+            if node._segment is None:
+                return
+            metrics.host_cache_misses.inc()
+            node._file_sys = TreeSystem.load_proto(TreeSystemData.FromString(node._segment.read_bytes()))
+        node.tree_size = tree_size(node._file_sys)
+        self.lru[key] = node
+        self.used += node.tree_size
+        self.evict(keep=node)
+
+    def resize(self, node: HostNode):
+        """文件树的统计随修改增量维护, 这里按根目录的统计更新占用, 超过上限时换出其他主机"""
+        size = tree_size(node._file_sys)
+        delta = size - node.tree_size
+        if not delta:
+            return
+        node.tree_size = size
+        self.used += delta
+        if delta > 0 and self.used > self.budget:
+            self.evict(keep=node)
+        else:
+            metrics.host_cache_bytes.set(self.used)
+
+    def discard(self, node: HostNode):
+        if self.lru.pop(id(node), None) is not None:
+            self.used -= node.tree_size
+            metrics.host_cache_bytes.set(self.used)
+
+    def evict(self, keep: HostNode = None):
+        for key, node in list(self.lru.items()):
+            if self.used <= self.budget:
+                break
+            if node is keep or node.pins > 0 or node.jobs:
+                continue
+            if self._dir is None:
+                self._dir = tempfile.TemporaryDirectory(prefix="nkgame-hosts-")
+            path = Path(self._dir.name) / f"{node.ip or key}.seg"
+            path.write_bytes(node._file_sys.to_proto().SerializeToString())
+            node._segment = path
+            node._file_sys = None
+            self.lru.pop(key)
+            self.used -= node.tree_size
+            metrics.host_cache_evictions.inc()
+        metrics.host_cache_bytes.set(self.used)
 
 
 class GameStatus:
 
+    # 内存中主机文件系统的上限, 可以用环境变量 NKGAME_CACHE_MB 设置
+    cache_budget = int(os.getenv("NKGAME_CACHE_MB", "64")) * 1024 ** 2
+
     def __init__(self):
-        self.hosts: dict[str, HostNode] = {}
+        self._topology = None
+        self.cache = HostCache(self.cache_budget)
+        self.hosts: HostTable[str, HostNode] = HostTable(self)
         self._path = Path(nkgame.__file__).parent / '001.save'
         self._user0 = None
+        self._snapshots = None
+        self._journal = None
+        self._scores = None
+        # 作为分片进程运行时, 修改交给协调进程保存, 见 nkgame.game.shard
+        self.shard = None
+
+    @property
+    def snapshots(self):
+        """快照保存在存档旁边的 .snap 文件, 第一次使用时读取"""
+        if self._snapshots is None:
+            from nkgame.game.snapshot import SnapshotStore
+            self._snapshots = SnapshotStore(self._path.with_suffix(".snap"))
+        return self._snapshots
+
+    @property
+    def journal(self):
+        """增量存档保存在存档旁边的 .journal 文件"""
+        if self._journal is None:
+            from nkgame.game.journal import Journal
+            self._journal = Journal(self._path.with_suffix(".journal"))
+        return self._journal
+
+    @property
+    def scores(self):
+        """小游戏的排行榜保存在存档旁边的 .scores 文件, 第一次使用时读取"""
+        if self._scores is None:
+            from nkgame.game.scores import Scores
+            self._scores = Scores(self._path.with_suffix(".scores"))
+        return self._scores
+
+    def close(self):
+        """退出前把延迟写入的增量存档和成绩立即写入"""
+        if self._journal is not None:
+            self._journal.flush()
+        if self._scores is not None:
+            self._scores.flush()
+
+    def set_generator(self, generator):
+        # 旧世界中生成后没有改动的主机不会存档, 不属于新的世界, 先移除, 避免它们的定时任务一直运行
+        for key, node in list(dict.items(self.hosts)):
+            if node.generated is not None and node.generated == node.digest(node.to_proto()):
+                self.hosts.drop(key)
+        self.hosts.set_generator(generator)
+        self._topology = None
+
+    @property
+    def topology(self) -> Topology:
+        """网络拓扑, 以 ip 地址为节点, 第一次使用时按当前的主机列表创建"""
+        if self._topology is None:
+            generator = self.hosts.generator
+            self._topology = Topology.build(self.hosts.ips(), seed=generator.seed if generator else 0)
+        return self._topology
+
+    def route(self, source: str, target: str) -> Union[None, Route]:
+        a, b = self.hosts.ip_of(source), self.hosts.ip_of(target)
+        if a is None or b is None:
+            return None
+        return self.topology.route(a, b)
 
     def save(self):
-        r = GameStatusData(
+        if self.shard is not None:
+            self.shard.sync()
+            return
+        st = time.perf_counter()
+        nodes = []
+        for x in self.hosts.values():
+            pb = x.to_proto()
+            if x.generated is not None and x.generated == x.digest(pb):
+                continue
+            nodes.append(pb)
+        generator = self.hosts.generator
+        header = GameStatusData(
             name="001",
-            nones=[HostNodeData(name=x.name, host=x.host, files=x.file_sys.to_proto()) for x in self.hosts.values()]
-        ).SerializeToString()
-
-        with open(self._path, "wb") as f:
-            f.write(r)
+            seed=generator.seed if generator else 0,
+            world_size=generator.size if generator else 0,
+        )
+        size = savefile.write(self._path, header, nodes)
+        self.journal.clear()
+        metrics.save_bytes.inc(size)
+        metrics.save_seconds.observe(time.perf_counter() - st)
 
     def load(self):
-        r = GameStatusData()
-
-        with open(self._path, "rb") as f:
-            r.ParseFromString(f.read())
-        for node in r.nones:
-            n = HostNode(node.name, node.host, file=TreeSystem.load_proto(node.files), game=self)
-            self.hosts[node.host] = n
-        self._user0 = r.nones[0].host
+        # 已经保存但还没有写入磁盘的修改先写入增量存档, 读取后重放
+        self.journal.flush()
+        # 边读取边创建主机, 旧格式的存档读取后转换为新格式
+        reader = savefile.SaveReader(self._path)
+        r = reader.header
+
+        # 新的主机表先在局部变量中创建, 全部读取成功后才替换, 存档损坏时内存中的世界保持不变.
+        # 已经存在的主机对象 (可能有正在使用的会话) 保留, 替换时才修改内容
+        old = self.hosts
+        cache = HostCache(self.cache_budget)
+        hosts = HostTable(self)
+        # 拓扑只是缓存, 清除后按当前的主机表重新创建, 不会在读取时修改
+        self._topology = None
+        if r.world_size:
+            from nkgame.game.world import WorldGenerator
+            hosts.set_generator(WorldGenerator(r.seed, r.world_size))
+        else:
+            hosts.set_generator(None)
+        created, updated = [], []
+        user0 = None
+        for node in reader:
+            ip = node.ip or None
+            tree = TreeSystem.load_proto(node.files)
+            n = dict.get(old, old.by_ip.get(ipv4(ip)) if ip else node.host)
+            if n is None:
+                # 还没有加入游戏, 读取时由新的缓存管理, 超过上限时换出
+                n = HostNode(node.name, node.host, file=tree, ip=ip)
+                cache.touch(n)
+                created.append(n)
+            else:
+                updated.append((n, node, tree))
+            hosts[node.host] = n
+            if user0 is None:
+                user0 = n.ip
+
+        # 没有保留的旧主机不再被引用, 停止它们的进程和定时任务, 生成的主机再次访问时重新生成
+        kept = {id(n) for n, _, _ in updated}
+        for n in dict.values(old):
+            if id(n) not in kept:
+                n.player.stop()
+        self.cache = cache
+        self.hosts = hosts
+        self._topology = None
+        for n in created:
+            n.game = self
+        for n, node, tree in updated:
+            n.name, n.host, n.file_sys, n.generated = node.name, node.host, tree, None
+            n.config = n.load_config()
+            if n.lookup(n.path) is None:
+                n.path = n.path[:1]
+        # 用 ip 记录初始主机, 修改主机名后仍然可以找到
+        self._user0 = user0
+        replayed = self.replay()
+        if reader.legacy or replayed:
+            self.save()
+
+    def replay(self) -> int:
+        """
+        重放增量存档, 返回记录的数量. 路径的第一项是根目录, 不参与查找;
+        目录的记录只在不存在时创建, 已经存在的目录保留原来的内容
+        """
+        n = 0
+        for entry in self.journal.read():
+            node = self.hosts.get(entry.ip)
+            parent = node.lookup(list(entry.path[:-1])) if node is not None else None
+            if parent is None or parent.type != FileType.dir:
+                continue
+            old = parent.index.get(entry.file.name)
+            if old is not None:
+                if old.type == FileType.dir and entry.file.type == FileType.dir:
+                    continue
+                parent.remove(old)
+            parent.add(TreeSystem.load_proto(entry.file))
+            n += 1
+        return n
 
     @property
     def user0(self):
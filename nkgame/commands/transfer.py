@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import contextlib
+import time
+import weakref
+from typing import Union
+
+from rich.progress import Progress, BarColumn, DownloadColumn, TransferSpeedColumn, TimeRemainingColumn
+
+from nkgame.commands.status import HostNode, TreeSystem, READ, WRITE
+from nkgame.pb.game_status_pb2 import FileType
+
+from .base import Command, ArgumentParser
+from .console import OpenCommand
+
+
+class TokenBucket:
+    """
+    按带宽分配发送时间, 共用同一条链路的传输依次排队, 总速度不超过带宽
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.next_time = 0.0
+
+    async def consume(self, n: int):
+        now = time.monotonic()
+        start = max(now, self.next_time)
+        self.next_time = start + n / self.rate
+        await asyncio.sleep(self.next_time - now)
+
+
+class Transfer:
+    """
+    两个位置之间的一次复制, 文件内容按块发送, 发送完成后目标直接引用源文件的数据, 不复制字符串
+    """
+
+    chunk_size = 16 * 1024
+    # 同一台主机内复制的速度, 字节/秒
+    local_bandwidth = 64 * 1024 ** 2
+    # 以瓶颈链路为 key, 正在进行的传输共用一个令牌桶
+    buckets: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+    def __init__(self, src: HostNode, dst: HostNode):
+        self.src = src
+        self.dst = dst
+        self.latency = 0.0
+        if src is dst:
+            key, rate = (src.ip,), self.local_bandwidth
+        else:
+            route = src.game.route(src.host, dst.host)
+            if route is None:
+                raise ConnectionError(f"host {dst.host} unreachable")
+            i = min(range(len(route.links)), key=lambda x: route.links[x].bandwidth)
+            key, rate = tuple(sorted(route.hops[i:i + 2])), route.links[i].bandwidth
+            self.latency = route.latency / 1000
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(rate)
+        self.bucket = bucket
+        self.files: list[tuple[TreeSystem, TreeSystem, str]] = []
+        self.total = 0
+        self.shared = 0
+
+    def check(self, source: TreeSystem, parent: Union[None, TreeSystem], name: str,
+              shown: str) -> Union[None, str]:
+        """
+        在 plan 之前检查整个复制过程, 不修改任何节点, 返回错误信息, 没有问题时返回 None.
+        每一层的文件和目录都不能互相覆盖; 源要有读权限, 覆盖的文件和要加入新节点的目录要有写权限.
+        parent 是 None 表示上级目录是新建的, 其中没有已经存在的节点
+        """
+        if not self.src.can(source, READ):
+            return f"{shown} permission denied"
+        target = parent.index.get(name) if parent is not None else None
+        if target is None:
+            if parent is not None and not self.dst.can(parent, WRITE):
+                return f"{shown} permission denied"
+        elif (target.type == FileType.dir) != (source.type == FileType.dir):
+            return f"{shown} already exists"
+        elif target.type != FileType.dir and not self.dst.can(target, WRITE):
+            return f"{shown} permission denied"
+        if source.type == FileType.dir:
+            for x in source.sub:
+                error = self.check(x, target, x.name, f"{shown}/{x.name}")
+                if error is not None:
+                    return error
+        return None
+
+    def plan(self, source: TreeSystem, parent: TreeSystem, name: str):
+        """
+        在目标目录下创建目录结构, 记录需要发送的文件, 内容相同的文件不再发送, 调用之前先用 check 检查
+        """
+        target = parent.index.get(name)
+        if source.type == FileType.dir:
+            if target is None:
+                target = self.dst.adopt(parent, copy_node(source, name))
+                parent.add(target)
+            for x in source.sub:
+                self.plan(x, target, x.name)
+            return
+        if target is not None and target.text == source.text:
+            target.data = source.text
+            self.shared += 1
+            return
+        self.files.append((source, parent, name))
+        self.total += source.size
+
+    async def run(self, progress: Progress, task):
+        if self.latency:
+            await asyncio.sleep(2 * self.latency)
+        for source, parent, name in self.files:
+            for data in source.text.chunks():
+                for i in range(0, len(data), self.chunk_size):
+                    n = len(data[i:i + self.chunk_size].encode())
+                    await self.bucket.consume(n)
+                    progress.advance(task, n)
+            # 文件发送完成后才出现在目标目录, 中途取消不会留下不完整的文件
+            target = parent.index.get(name)
+            if target is None:
+                parent.add(self.dst.adopt(parent, copy_node(source, name)))
+            elif target.type != FileType.dir:
+                # 发送期间同名的目录可能已经被其他会话创建, 不覆盖
+                target.data = source.text
+
+
+def copy_node(tree: TreeSystem, name: str) -> TreeSystem:
+    """复制内容和权限, 所有者不复制, 和目标目录相同"""
+    node = TreeSystem(name, tree.type, data=tree.text)
+    node.mode = tree.mode
+    node.visible = tree.visible
+    return node
+
+
+class CpCommand(Command):
+    name = "cp"
+    words = {"cp": OpenCommand.FileCompleter([])}
+
+    args = ArgumentParser(prog="cp", usage="cp -r lib backup", description="复制文件或目录", epilog="")
+    args.add_argument("paths", help="源路径 ... 目标路径", nargs="+")
+    args.add_argument("-r", "--recursive", dest="recursive", help="复制目录", action="store_true")
+
+    async def run(self, args: argparse.Namespace):
+        if len(args.paths) < 2:
+            self.error("missing destination.")
+            return
+        # 传输期间用到的主机不会被换出
+        with contextlib.ExitStack() as self.pins:
+            await self.copy(args)
+
+    def location(self, path: str) -> tuple[HostNode, str]:
+        return self.pins.enter_context(self.status.pinned()), path
+
+    async def copy(self, args: argparse.Namespace):
+        *sources, destination = args.paths
+        try:
+            dst, dst_path = self.location(destination)
+        except KeyError as e:
+            self.error(f"host [steel_blue]{e.args[0]}[/] not exists.")
+            return
+        path = dst.abspath(dst_path)
+        target = dst.lookup(path)
+        into = target is not None and target.type == FileType.dir
+        if not into and len(sources) > 1:
+            self.error(f"{destination} is not a directory.")
+            return
+
+        transfers = []
+        for x in sources:
+            try:
+                src, src_path = self.location(x)
+            except KeyError as e:
+                self.error(f"host [steel_blue]{e.args[0]}[/] not exists.")
+                continue
+            source = src.lookup(src.abspath(src_path))
+            if source is None or source.parent is None:
+                self.error(f"{x} not exists.")
+                continue
+            if source.type == FileType.dir and not args.recursive:
+                self.error(f"{x} is a directory, use -r.")
+                continue
+            if not src.can(source, READ):
+                self.error(f"{x} permission denied.")
+                continue
+            if into:
+                parent, name = target, source.name
+            else:
+                parent, name = dst.lookup(path[:-1]), path[-1]
+                if parent is None or parent.type != FileType.dir:
+                    self.error(f"{destination} not exists.")
+                    return
+            if src is dst and is_inside(parent, source):
+                self.error(f"can not copy {x} into itself.")
+                continue
+            try:
+                transfer = Transfer(src, dst)
+            except ConnectionError as e:
+                self.error(f"{e}.")
+                continue
+            error = transfer.check(source, parent, name, f"{destination.rstrip('/')}/{name}" if into else destination)
+            if error is not None:
+                self.error(f"{error}.")
+                continue
+            transfer.plan(source, parent, name)
+            transfers.append((x, transfer))
+        if not transfers:
+            return
+
+        with Progress(
+            "{task.description}", BarColumn(), DownloadColumn(), TransferSpeedColumn(), TimeRemainingColumn(),
+            console=self.status.console,
+        ) as progress:
+            await asyncio.gather(*(
+                t.run(progress, progress.add_task(name, total=t.total or 1, completed=0 if t.total else 1))
+                for name, t in transfers
+            ))
+        shared = sum(t.shared for _, t in transfers)
+        if shared:
+            self.status.console.print(f"{shared} unchanged files skipped.")
+        self.status.game.save()
+
+
+def is_inside(tree: TreeSystem, root: TreeSystem) -> bool:
+    while tree is not None:
+        if tree is root:
+            return True
+        tree = tree.parent
+    return False
+
+
+class ScpCommand(CpCommand):
+    name = "scp"
+    words = "scp"
+
+    args = ArgumentParser(
+        prog="scp", usage="scp 10.0.1.1:/etc/motd.txt .", description="在主机之间复制文件", epilog=""
+    )
+    args.add_argument("paths", help="[主机:]源路径 ... [主机:]目标路径", nargs="+")
+    args.add_argument("-r", "--recursive", dest="recursive", help="复制目录", action="store_true")
+
+    def location(self, path: str) -> tuple[HostNode, str]:
+        host, sep, rest = path.partition(":")
+        if not sep:
+            return super().location(path)
+        node: Union[None, HostNode] = self.status.game.hosts.get(host)
+        if node is None:
+            raise KeyError(host)
+        self.pins.enter_context(node.pinned())
+        # 远程路径从根目录开始
+        return node, rest if rest.startswith(("/", "~")) else "/" + rest
+
+
+name = "transfer"
+
+__all__ = [
+    "name"
+]
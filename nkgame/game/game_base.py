@@ -50,9 +50,22 @@ class Game(metaclass=abc.ABCMeta):
                     live.update(await self.next_frame(c))
                     await sleep(1 / self.refresh_per - ((time.time_ns() - st) / 1e9))
         except BreakGame:
-            return
+            pass
         finally:
             self.close()
+        self.submit_score()
+
+    def final_score(self) -> Optional[int]:
+        """结束时的得分, 中途退出等不计入排行榜时返回 None"""
+        return None
+
+    def submit_score(self):
+        """把得分记入排行榜, 见 nkgame.game.scores"""
+        score = self.final_score()
+        if score is None:
+            return
+        rank = self.status.game.scores.submit(self.name, self.status.name, score)
+        self.status.console.print(f"{self.name} score [green]{score}[/], rank #{rank}.")
 
     @abc.abstractmethod
     async def next_frame(self, c: bytes) -> Optional[RenderableType]:
@@ -93,6 +106,10 @@ class TetrisGame(Game):
         self.state = self.State()
         self.generate_tetris()
 
+    def final_score(self) -> Optional[int]:
+        # 只记录结束的游戏, 中途按 q 退出的不算
+        return self.state.score if self.state.game_over else None
+
     async def next_frame(self, c: bytes):
         # 退出
         if c == b'q':
@@ -0,0 +1,80 @@
+"""
+增量存档
+
+编辑文件后不需要重写整个存档, 只把修改过的文件追加到存档旁边的 .journal 文件.
+同一个文件在写入磁盘前的多次修改只保留最后一次, 写入会延迟一小段时间, 多个会话同时保存时合并为一次追加.
+读取存档后按顺序重放记录, 完整保存存档时清空记录.
+数据块的格式和存档相同 (见 nkgame.game.savefile), 但是没有结束块, 最后一块写到一半时读取到前一块为止
+"""
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+from nkgame import metrics
+from nkgame.game import savefile
+from nkgame.game.scheduler import scheduler, Timer
+from nkgame.pb.game_status_pb2 import Journal as JournalData, JournalEntry as JournalEntryData
+
+
+class Journal:
+    # 记录后等待多久写入磁盘, 秒
+    delay = 1.0
+
+    def __init__(self, path: Path):
+        self.path = path
+        # (ip, 路径) -> 文件节点, 写入时才序列化
+        self.pending: dict[tuple[str, tuple[str, ...]], object] = {}
+        self._timer: Optional[Timer] = None
+
+    def record(self, ip: str, path: list[str], tree):
+        self.pending[(ip, tuple(path))] = tree
+        if self._timer is None:
+            self._timer = scheduler.call_later(self.delay, self.flush)
+
+    def flush(self):
+        if self._timer is not None:
+            scheduler.cancel(self._timer)
+            self._timer = None
+        if not self.pending:
+            return
+        entries = []
+        for (ip, path), tree in self.pending.items():
+            # 已经删除的文件不再记录, 删除时会完整保存存档
+            if tree.parent is None:
+                continue
+            entries.append(JournalEntryData(ip=ip, path=path, file=tree.to_proto()))
+        self.pending.clear()
+        if entries:
+            self.append(entries)
+
+    def append(self, entries: list[JournalEntryData]):
+        """把一批记录作为一个数据块写入磁盘"""
+        with open(self.path, "ab") as f:
+            n = savefile.write_chunk(f, savefile.default_codec(), JournalData(entries=entries).SerializeToString())
+            f.flush()
+            os.fsync(f.fileno())
+        metrics.journal_bytes.inc(n)
+
+    def clear(self):
+        """完整保存存档之后调用, 存档已经包含了全部修改"""
+        if self._timer is not None:
+            scheduler.cancel(self._timer)
+            self._timer = None
+        self.pending.clear()
+        self.path.unlink(missing_ok=True)
+
+    def read(self) -> Iterator[JournalEntryData]:
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as f:
+            i = 0
+            while True:
+                try:
+                    raw = savefile.read_chunk(f, i)
+                except (EOFError, savefile.SaveFileError):
+                    # 最后一次追加没有写完
+                    return
+                if raw is None:
+                    return
+                yield from JournalData.FromString(raw).entries
+                i += 1
@@ -1,15 +1,124 @@
+import math
+import itertools
+from typing import Optional
+
 import rich
 
+from nkgame.game.scheduler import scheduler, Timer
+
 
 class Node:
     pass
 
 
+class Process:
+    """
+    主机上运行的进程, 占用固定的负载和内存, cpu 时间在读取时按运行时长计算
+    """
+
+    __slots__ = ("pid", "name", "load", "memory", "started", "player", "timer")
+
+    def __init__(self, pid: int, name: str, load: int, memory: int, player: 'Player'):
+        self.pid = pid
+        self.name = name
+        self.load = load
+        self.memory = memory
+        self.started = scheduler.clock()
+        self.player = player
+        # 有运行时长的进程到期时由调度器结束
+        self.timer: Optional[Timer] = None
+
+    @property
+    def runtime(self) -> float:
+        return scheduler.clock() - self.started
+
+    @property
+    def cpu_time(self) -> float:
+        return self.runtime * self.load / self.player.max_load_value
+
+    def exit(self):
+        self.player.exit(self)
+
+
 class Player:
     max_load_value = 100
     max_memory_value = 128
+    # 平均负载的时间常数, 秒, 同 1/5/15 分钟的 loadavg
+    load_periods = (60, 300, 900)
 
     def __init__(self):
         self.lv = 0
         self.load_value = self.max_load_value
         self.memory_value = self.max_memory_value
+        self.processes: dict[int, Process] = {}
+        # 定时任务下一次执行的事件, 任务名 -> 事件, 见 nkgame.game.world.cron
+        self.crons: dict[str, Timer] = {}
+        self._pids = itertools.count(1)
+        self._load_avg = [0.0] * len(self.load_periods)
+        self._load_time = scheduler.clock()
+
+    def acquire(self, load: int, memory: int) -> bool:
+        """占用负载和内存, 剩余不足时返回 False"""
+        if load > self.load_value or memory > self.memory_value:
+            return False
+        self._update_load()
+        self.load_value -= load
+        self.memory_value -= memory
+        return True
+
+    def release(self, load: int, memory: int):
+        self._update_load()
+        self.load_value = min(self.load_value + load, self.max_load_value)
+        self.memory_value = min(self.memory_value + memory, self.max_memory_value)
+
+    def spawn(self, name: str, load: int, memory: int, duration: float = None, force=False) -> Optional[Process]:
+        """
+        启动进程, 资源不足时返回 None, force 为 True 时不检查剩余资源 (前台命令总是可以执行)
+        duration 不为 None 时进程在到期后自动结束
+        """
+        if not self.acquire(load, memory):
+            if not force:
+                return None
+            self._update_load()
+            self.load_value -= load
+            self.memory_value -= memory
+        process = Process(next(self._pids), name, load, memory, self)
+        self.processes[process.pid] = process
+        if duration is not None:
+            process.timer = scheduler.call_later(duration, self.exit, process)
+        return process
+
+    def exit(self, process: Process):
+        if self.processes.pop(process.pid, None) is None:
+            return
+        if process.timer is not None:
+            scheduler.cancel(process.timer)
+        self.release(process.load, process.memory)
+
+    def stop(self):
+        """主机被替换或丢弃时取消所有定时任务并结束所有进程, 之后调度器不会再引用这个主机"""
+        for timer in self.crons.values():
+            scheduler.cancel(timer)
+        self.crons.clear()
+        for process in list(self.processes.values()):
+            self.exit(process)
+
+    def _update_load(self):
+        """
+        负载只在进程启动和结束时变化, 两次变化之间的指数平均可以直接算出来, 不需要定时采样
+        """
+        now = scheduler.clock()
+        dt = now - self._load_time
+        if dt <= 0:
+            return
+        running = (self.max_load_value - self.load_value) / self.max_load_value
+        self._load_avg = [
+            running + (avg - running) * math.exp(-dt / period)
+            for avg, period in zip(self._load_avg, self.load_periods)
+        ]
+        self._load_time = now
+
+    @property
+    def load_avg(self) -> tuple[float, ...]:
+        self._update_load()
+        return tuple(self._load_avg)
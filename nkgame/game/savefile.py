@@ -0,0 +1,229 @@
+"""
+存档文件格式
+
+    文件头: b"NKSV" 版本(1 字节) 保留(3 字节)
+    数据块: 压缩方式(1 字节) 保留(3 字节) 压缩后长度(4) 原始长度(4) crc32(4) 压缩后的数据
+    结束块: 压缩方式为 0xff, 原始长度字段是数据块的数量
+
+每个数据块是一条独立的 GameStatus 消息, 第一块保存名称和世界参数, 之后每块保存若干主机,
+protobuf 合并消息时 repeated 字段依次追加, 所以全部数据块合并起来就是完整的存档.
+crc 校验的是压缩后的数据, 读取时不需要解压就可以发现损坏. 读取线程负责读文件, 校验和解压,
+主线程同时解析前面的数据块, 解压和解析可以并行.
+没有文件头的文件是旧版本的存档 (一条完整的 GameStatus 消息), 按旧格式读取
+"""
+import os
+import queue
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from nkgame.pb.game_status_pb2 import GameStatus as GameStatusData, HostNode as HostNodeData
+
+MAGIC = b"NKSV"
+VERSION = 1
+HEADER = struct.Struct("<4sB3x")
+CHUNK = struct.Struct("<B3xIII")
+
+RAW, ZLIB, ZSTD, END = 0, 1, 2, 0xff
+
+# 每个数据块的原始数据大约的大小
+CHUNK_SIZE = 1024 ** 2
+
+
+class SaveFileError(ValueError):
+    pass
+
+
+def default_codec() -> int:
+    """可以用环境变量 NKGAME_SAVE_CODEC (raw, zlib, zstd) 选择压缩方式, 默认有 zstandard 时使用 zstd"""
+    name = os.getenv("NKGAME_SAVE_CODEC")
+    if name is None:
+        return ZSTD if zstandard is not None else ZLIB
+    codec = {"raw": RAW, "zlib": ZLIB, "zstd": ZSTD}.get(name)
+    if codec is None:
+        raise SaveFileError(f"unknown save codec {name}")
+    if codec == ZSTD and zstandard is None:
+        return ZLIB
+    return codec
+
+
+def compress(codec: int, data: bytes) -> bytes:
+    if codec == ZLIB:
+        return zlib.compress(data, 6)
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def decompress(codec: int, data: bytes, size: int) -> bytes:
+    if codec == ZLIB:
+        return zlib.decompress(data, bufsize=size)
+    if codec == ZSTD:
+        if zstandard is None:
+            raise SaveFileError("save file is compressed with zstd, install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+    if codec == RAW:
+        return data
+    raise SaveFileError(f"unknown chunk codec {codec}")
+
+
+def chunks(status: GameStatusData, nodes: list[HostNodeData]) -> Iterator[bytes]:
+    """按大小把主机分到多个数据块"""
+    yield status.SerializeToString()
+    batch = []
+    size = 0
+    for node in nodes:
+        batch.append(node)
+        size += node.ByteSize()
+        if size >= CHUNK_SIZE:
+            yield GameStatusData(nones=batch).SerializeToString()
+            batch = []
+            size = 0
+    if batch:
+        yield GameStatusData(nones=batch).SerializeToString()
+
+
+def write_chunk(f, codec: int, raw: bytes) -> int:
+    data = compress(codec, raw)
+    return f.write(CHUNK.pack(codec, len(data), len(raw), zlib.crc32(data))) + f.write(data)
+
+
+def read_chunk(f, index: int) -> Optional[bytes]:
+    """
+    读取第 index 个数据块, 读到结束块时返回 None, 文件正好在数据块之间结束时抛出 EOFError
+    """
+    head = f.read(CHUNK.size)
+    if not head:
+        raise EOFError
+    if len(head) < CHUNK.size:
+        raise SaveFileError("save file is truncated")
+    codec, length, size, crc = CHUNK.unpack(head)
+    if codec == END:
+        if size != index:
+            raise SaveFileError(f"save file has {index} chunks, expected {size}")
+        return None
+    data = f.read(length)
+    if len(data) < length:
+        raise SaveFileError("save file is truncated")
+    if zlib.crc32(data) != crc:
+        raise SaveFileError(f"save file chunk {index} is corrupted")
+    raw = decompress(codec, data, size)
+    if len(raw) != size:
+        raise SaveFileError(f"save file chunk {index} has wrong size")
+    return raw
+
+
+def write(path: Path, status: GameStatusData, nodes: list[HostNodeData], codec: int = None) -> int:
+    """
+    写入存档, 先写临时文件再替换, 写到一半退出不会损坏原来的存档, 返回写入的字节数
+    """
+    if codec is None:
+        codec = default_codec()
+    tmp = path.with_name(path.name + ".tmp")
+    written = 0
+    with open(tmp, "wb") as f:
+        written += f.write(HEADER.pack(MAGIC, VERSION))
+        count = 0
+        for raw in chunks(status, nodes):
+            written += write_chunk(f, codec, raw)
+            count += 1
+        written += f.write(CHUNK.pack(END, 0, count, 0))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return written
+
+
+def _read_chunks(f, out: queue.Queue):
+    """读取线程: 读文件, 校验, 解压, 结果按顺序放入队列, 出错时放入异常"""
+    try:
+        count = 0
+        while True:
+            try:
+                raw = read_chunk(f, count)
+            except EOFError:
+                raise SaveFileError("save file is truncated")
+            if raw is None:
+                break
+            out.put(raw)
+            count += 1
+        out.put(None)
+    except BaseException as e:
+        out.put(e)
+
+
+class SaveReader:
+    """
+    读取存档, header 是不含主机的 GameStatus, 迭代时依次返回每个主机, 在读到所有数据之前就开始返回.
+    legacy 为 True 表示是旧格式的存档, 读取之后应当重新保存一次, 转换为新格式
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.legacy = False
+        self._file = open(path, "rb")
+        head = self._file.read(HEADER.size)
+        if len(head) < HEADER.size or head[:4] != MAGIC:
+            self.legacy = True
+            self.header = GameStatusData.FromString(head + self._file.read())
+            self._file.close()
+            self._nodes = list(self.header.nones)
+            del self.header.nones[:]
+            return
+        _, version = HEADER.unpack(head)
+        if version > VERSION:
+            self._file.close()
+            raise SaveFileError(f"save file version {version} is newer than {VERSION}")
+
+        # 最多预读几个数据块, 内存占用不会随存档大小增长
+        self._queue: queue.Queue = queue.Queue(maxsize=4)
+        self._reader = threading.Thread(target=_read_chunks, args=(self._file, self._queue), daemon=True)
+        self._reader.start()
+        first = self._next()
+        if first is None:
+            self.close()
+            raise SaveFileError("save file is empty")
+        self.header = first
+        self._nodes = list(self.header.nones)
+        del self.header.nones[:]
+
+    def _next(self) -> Optional[GameStatusData]:
+        item = self._queue.get()
+        if item is None:
+            return None
+        if isinstance(item, BaseException):
+            self.close()
+            raise item
+        return GameStatusData.FromString(item)
+
+    def __iter__(self) -> Iterator[HostNodeData]:
+        try:
+            yield from self._nodes
+            if self.legacy:
+                return
+            while True:
+                status = self._next()
+                if status is None:
+                    break
+                yield from status.nones
+        finally:
+            self.close()
+
+    def close(self):
+        if self._file.closed:
+            return
+        if not self.legacy:
+            # 提前结束时让读取线程退出
+            while self._reader.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        self._file.close()
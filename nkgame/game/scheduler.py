@@ -0,0 +1,102 @@
+"""
+事件调度
+
+所有主机的定时事件 (进程结束, 定时任务) 都放在同一个最小堆里, 事件循环上只挂一个定时器指向最早的事件,
+没有到期的事件时不占用任何 cpu, 主机再多也不会增加 asyncio 任务
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Callable, Optional
+
+
+class Timer:
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(self, when: float, callback: Callable, args: tuple):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._heap: list[tuple[float, int, Timer]] = []
+        self._seq = itertools.count()
+        self._cancelled = 0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._handle_when = float("inf")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    def call_at(self, when: float, callback: Callable, *args) -> Timer:
+        timer = Timer(when, callback, args)
+        heapq.heappush(self._heap, (when, next(self._seq), timer))
+        self._arm()
+        return timer
+
+    def call_later(self, delay: float, callback: Callable, *args) -> Timer:
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def cancel(self, timer: Timer):
+        if timer.cancelled:
+            return
+        timer.cancel()
+        self._cancelled += 1
+        # 取消的事件太多时重建堆, 避免堆里堆满无效的事件
+        if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+            self._heap = [x for x in self._heap if not x[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def run_pending(self) -> int:
+        """执行所有到期的事件, 返回执行的数量"""
+        now = self.clock()
+        n = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, _, timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                self._cancelled -= 1
+                continue
+            timer.cancelled = True
+            timer.callback(*timer.args)
+            n += 1
+        return n
+
+    def _arm(self):
+        """让事件循环在最早的事件到期时唤醒调度器, 没有运行中的事件循环时等到下次调用"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+        if not self._heap:
+            return
+        when = self._heap[0][0]
+        if loop is self._loop and self._handle is not None and self._handle_when <= when:
+            return
+        if self._handle is not None:
+            self._handle.cancel()
+        self._loop = loop
+        self._handle_when = when
+        self._handle = loop.call_later(max(when - self.clock(), 0), self._wakeup)
+
+    def _wakeup(self):
+        self._handle = None
+        self._handle_when = float("inf")
+        self.run_pending()
+        self._arm()
+
+
+scheduler = Scheduler()
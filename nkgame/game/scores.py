@@ -0,0 +1,343 @@
+"""
+排行榜
+
+每个小游戏一个排行榜, 保存全局的前 K 名, 每个玩家自己的前几名, 以及每个分数出现的局数.
+前几名用大小固定的最小堆保存, 堆顶是入榜的最低成绩, 新成绩不如堆顶时直接丢弃, 否则替换堆顶;
+按分数分块统计局数, 任意分数的排名只需要二分查找和累加少量的块. 内存只和玩家数量, 不同分数的数量有关, 和记录的局数无关,
+记录了几百万局之后显示排行榜也不需要任何计算.
+
+成绩提交后立即更新内存中的排行榜, 写入磁盘和增量存档 (见 nkgame.game.journal) 一样延迟合并,
+多个会话同时提交时合并为一个数据块, 用一次 O_APPEND 的 write 追加.
+文件是存档旁边的 .scores (不在增量存档中), 由若干数据块 (格式见 nkgame.game.savefile) 组成, 每块是一条 ScoreLog,
+读取时依次重放, 数据块太多时重写为一块完整的排行榜.
+多个游戏进程可以共用一个文件: 追加和重写时持有 flock 排他锁, 先读入其他进程追加的数据块再写;
+每次查询排行榜时检查文件, 读入其他进程新追加的数据块, 文件被重写过时从头读取
+"""
+import bisect
+import contextlib
+import heapq
+import io
+import os
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # windows 下没有 fcntl, 不加锁, 读到不完整的数据块时不重写文件
+    fcntl = None
+
+from nkgame import metrics
+from nkgame.game import savefile
+from nkgame.game.scheduler import scheduler, Timer
+from nkgame.pb.game_status_pb2 import (
+    Score as ScoreData,
+    ScoreBoard as ScoreBoardData,
+    ScoreCount as ScoreCountData,
+    ScoreLog as ScoreLogData,
+)
+
+# 全局排行榜和每个玩家保存的名次
+TOP_K = 100
+PLAYER_K = 10
+# 统计局数时每块的分数个数
+BLOCK = 256
+
+# (分数, -时间, 玩家), 分数相同时先达到的排在前面
+Entry = tuple[int, float, str]
+
+
+class TopK:
+    """大小固定的最小堆, 只保留最好的 k 个成绩"""
+
+    __slots__ = ("k", "heap", "_sorted")
+
+    def __init__(self, k: int):
+        self.k = k
+        self.heap: list[Entry] = []
+        # 从高到低排好序的结果, 有变化时清空
+        self._sorted: Optional[list[Entry]] = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, entry: Entry) -> bool:
+        """加入成绩, 返回是否入榜"""
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry > self.heap[0]:
+            heapq.heapreplace(self.heap, entry)
+        else:
+            return False
+        self._sorted = None
+        return True
+
+    def entries(self) -> list[Entry]:
+        if self._sorted is None:
+            self._sorted = sorted(self.heap, reverse=True)
+        return self._sorted
+
+
+class Board:
+    """一个小游戏的排行榜"""
+
+    def __init__(self, game: str):
+        self.game = game
+        self.top = TopK(TOP_K)
+        self.players: dict[str, TopK] = {}
+        # 分数 -> 局数. 不同的分数有序地分成若干块, 每块记录局数之和,
+        # 插入新分数只移动一块, 查询排名只需要累加后面的块和本块中更高的分数
+        self.counts: dict[int, int] = {}
+        self.blocks: list[list[int]] = []
+        self.heads: list[int] = []
+        self.sums: list[int] = []
+        self.total = 0
+
+    def submit(self, player: str, score: int, when: float, count: int = 1):
+        entry = (score, -when, player)
+        self.top.push(entry)
+        mine = self.players.get(player)
+        if mine is None:
+            mine = self.players[player] = TopK(PLAYER_K)
+        mine.push(entry)
+        self.add_count(score, count)
+
+    def add_count(self, score: int, count: int):
+        self.total += count
+        if not self.blocks:
+            self.blocks.append([score])
+            self.heads.append(score)
+            self.sums.append(count)
+            self.counts[score] = count
+            return
+        b = max(bisect.bisect_right(self.heads, score) - 1, 0)
+        self.sums[b] += count
+        if score in self.counts:
+            self.counts[score] += count
+            return
+        self.counts[score] = count
+        block = self.blocks[b]
+        bisect.insort(block, score)
+        self.heads[b] = block[0]
+        if len(block) > 2 * BLOCK:
+            # 拆成两块
+            right = block[BLOCK:]
+            del block[BLOCK:]
+            self.blocks.insert(b + 1, right)
+            self.heads.insert(b + 1, right[0])
+            moved = sum(self.counts[k] for k in right)
+            self.sums[b] -= moved
+            self.sums.insert(b + 1, moved)
+
+    def keys(self) -> Iterator[int]:
+        """从低到高的不同分数"""
+        for block in self.blocks:
+            yield from block
+
+    def rank(self, score: int) -> int:
+        """分数在所有记录的局数中的名次, 分数更高的局数加一"""
+        b = bisect.bisect_right(self.heads, score) - 1
+        if b < 0:
+            return self.total + 1
+        block = self.blocks[b]
+        above = sum(self.sums[b + 1:])
+        for k in block[bisect.bisect_right(block, score):]:
+            above += self.counts[k]
+        return above + 1
+
+    def best(self, player: str) -> Optional[Entry]:
+        mine = self.players.get(player)
+        return mine.entries()[0] if mine else None
+
+    def to_proto(self) -> ScoreBoardData:
+        def score(entry: Entry) -> ScoreData:
+            return ScoreData(game=self.game, player=entry[2], score=entry[0], time=-entry[1])
+
+        return ScoreBoardData(
+            game=self.game,
+            top=[score(x) for x in self.top.heap],
+            players=[score(x) for mine in self.players.values() for x in mine.heap],
+            counts=[ScoreCountData(score=k, count=self.counts[k]) for k in self.keys()],
+        )
+
+    def load_proto(self, pb: ScoreBoardData):
+        """合并完整的排行榜, 局数已经在 counts 中, 入榜的成绩不再计数"""
+        for x in pb.top:
+            self.top.push((x.score, -x.time, x.player))
+        for x in pb.players:
+            mine = self.players.get(x.player)
+            if mine is None:
+                mine = self.players[x.player] = TopK(PLAYER_K)
+            mine.push((x.score, -x.time, x.player))
+        for x in pb.counts:
+            self.add_count(x.score, x.count)
+
+
+class Scores:
+    # 提交后等待多久写入磁盘, 秒
+    delay = 1.0
+    # 数据块超过这个数量时重写为一块
+    compact_chunks = 256
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.boards: dict[str, Board] = {}
+        self.pending: list[ScoreData] = []
+        self.chunks = 0
+        # 已经读到的位置, 其他进程追加的数据块从这里继续读.
+        # 文件用 inode 和第一个数据块的头部识别, 重写后的文件可能用到刚释放的 inode, 这时从头读
+        self.offset = 0
+        self.file: Optional[tuple[int, bytes]] = None
+        # 最后一次读写之后文件的 (inode, 大小, 修改时间), 没有变化时不需要加锁读取
+        self.stat: Optional[tuple[int, int, int]] = None
+        self._timer: Optional[Timer] = None
+
+    def board(self, game: str) -> Board:
+        self.load()
+        return self._board(game)
+
+    def _board(self, game: str) -> Board:
+        board = self.boards.get(game)
+        if board is None:
+            board = self.boards[game] = Board(game)
+        return board
+
+    def submit(self, game: str, player: str, score: int) -> int:
+        """记录一局成绩, 返回这一局的名次"""
+        self.add(ScoreData(game=game, player=player, score=score, time=time.time()))
+        return self.board(game).rank(score)
+
+    def add(self, x: ScoreData):
+        """记录一局已经确定时间的成绩, 等待写入磁盘"""
+        self.board(x.game).submit(x.player, x.score, x.time)
+        self.pending.append(x)
+        metrics.scores_submitted.inc(game=x.game)
+        if self._timer is None:
+            self._timer = scheduler.call_later(self.delay, self.flush)
+
+    @contextlib.contextmanager
+    def locked(self, exclusive: bool) -> Iterator[int]:
+        """
+        打开并锁定文件, 追加和重写用排他锁, 读取用共享锁, 读到不完整的数据块时一定是写到一半退出了.
+        加锁之后发现文件已经被其他进程重写 (inode 不同) 时重新打开
+        """
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                    try:
+                        replaced = os.stat(self.path).st_ino != os.fstat(fd).st_ino
+                    except FileNotFoundError:
+                        replaced = True
+                    if replaced:
+                        continue
+                yield fd
+                return
+            finally:
+                # 关闭时释放锁
+                os.close(fd)
+
+    def flush(self):
+        if self._timer is not None:
+            scheduler.cancel(self._timer)
+            self._timer = None
+        if not self.pending:
+            return
+        with self.locked(exclusive=True) as fd:
+            # 先读入其他进程追加的数据块, 之后的位置才是这次追加的结尾
+            torn = self._read(fd)
+            if torn or self.chunks >= self.compact_chunks:
+                self._rewrite()
+            else:
+                self._append(fd, ScoreLogData(scores=self.pending))
+        self.pending = []
+
+    def _append(self, fd: int, log: ScoreLogData):
+        """整个数据块用一次 write 追加"""
+        buf = io.BytesIO()
+        savefile.write_chunk(buf, savefile.default_codec(), log.SerializeToString())
+        os.write(fd, buf.getvalue())
+        os.fsync(fd)
+        st = os.fstat(fd)
+        if self.offset == 0:
+            self.file = (st.st_ino, os.pread(fd, savefile.CHUNK.size, 0))
+        self.offset = st.st_size
+        self.stat = (st.st_ino, st.st_size, st.st_mtime_ns)
+        self.chunks += 1
+
+    def compact(self):
+        """把完整的排行榜写为一个数据块替换原来的文件, 其他进程追加的和还没有写入的成绩都包含在内"""
+        if self._timer is not None:
+            scheduler.cancel(self._timer)
+            self._timer = None
+        with self.locked(exclusive=True) as fd:
+            self._read(fd)
+            self._rewrite()
+        self.pending = []
+
+    def _rewrite(self):
+        """持有排他锁时调用, 内存中的排行榜已经包含文件中的全部数据块"""
+        log = ScoreLogData(boards=[x.to_proto() for x in self.boards.values()])
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        buf = io.BytesIO()
+        savefile.write_chunk(buf, savefile.default_codec(), log.SerializeToString())
+        data = buf.getvalue()
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        st = os.stat(self.path)
+        self.file = (st.st_ino, data[:savefile.CHUNK.size])
+        self.offset, self.chunks = st.st_size, 1
+        self.stat = (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def load(self):
+        """读取其他进程追加的数据块, 第一次调用时读取整个文件, 文件没有变化时只需要一次 stat"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if (st.st_ino, st.st_size, st.st_mtime_ns) == self.stat:
+            return
+        with self.locked(exclusive=False) as fd:
+            torn = self._read(fd)
+        # 最后一次追加没有写完, 重写文件去掉不完整的部分, 否则之后追加的数据块读不到
+        if torn or self.chunks > self.compact_chunks:
+            self.compact()
+
+    def _read(self, fd: int) -> bool:
+        """读取 offset 之后的数据块, 返回结尾是否有写到一半的数据块"""
+        st = os.fstat(fd)
+        file = (st.st_ino, os.pread(fd, savefile.CHUNK.size, 0))
+        if file != self.file:
+            # 文件被其他进程重写过, 重新读取全部数据块, 还没有写入的成绩再加回来
+            self.boards = {}
+            self.file, self.offset, self.chunks = file, 0, 0
+            for x in self.pending:
+                self._board(x.game).submit(x.player, x.score, x.time)
+        self.stat = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if st.st_size <= self.offset:
+            return False
+        with os.fdopen(os.dup(fd), "rb") as f:
+            f.seek(self.offset)
+            while True:
+                try:
+                    raw = savefile.read_chunk(f, self.chunks)
+                except EOFError:
+                    break
+                except savefile.SaveFileError:
+                    # 没有文件锁时可能是其他进程正在写入的数据块, 不能当作损坏
+                    return fcntl is not None
+                if raw is None:
+                    break
+                log = ScoreLogData.FromString(raw)
+                for x in log.boards:
+                    self._board(x.game).load_proto(x)
+                for x in log.scores:
+                    self._board(x.game).submit(x.player, x.score, x.time)
+                self.chunks += 1
+                self.offset = f.tell()
+        return False
\ No newline at end of file
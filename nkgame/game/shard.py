@@ -0,0 +1,369 @@
+"""
+多进程分片
+
+一个进程的事件循环只能用一个核, 文件树和渲染都是 cpu 密集的. 分片模式下会话按主机分到多个分片进程,
+每个分片进程读取同一个存档, 各自在内存中修改; 协调进程持有权威的主机和排行榜, 负责写入存档和成绩文件,
+分片进程之间的修改 (ssh, scp 到其他分片的主机, 排行榜) 都经过协调进程转发.
+
+进程之间用 unix socket 连接, 每条消息是 4 字节长度加一条 ShardMessage. 同步的单位是整台主机:
+分片进程在保存 (GameStatus.save, HostNode.save_file) 后等待一小段时间, 把这段时间内修改过的主机合并为一条消息.
+主机的内容用快照的不可变节点 (见 nkgame.game.snapshot) 表示, 没有修改的子树直接使用缓存的摘要,
+每个连接记住对方已经收到的节点, 只发送新节点, 修改一个文件只需要发送从文件到根目录的一条路径.
+
+同一台主机可能同时在两个进程中修改, 每次发送都带上修改前的版本, 收到的一方以它为共同祖先做三方合并 (见 merge),
+不同的文件各自保留, 同一个文件以后到的修改为准.
+分片进程中新的成绩先计入本地的排行榜并返回本地的名次, 再交给协调进程写入文件并转发给其他分片
+"""
+import asyncio
+import struct
+import sys
+import zlib
+from typing import Optional
+
+from nkgame.commands.status import GameStatus, HostNode
+from nkgame.game.scheduler import scheduler, Timer
+from nkgame.game.scores import Scores
+from nkgame.game.snapshot import FrozenTree, Interner, encode_nodes
+from nkgame.pb.game_status_pb2 import (
+    FileType,
+    Score as ScoreData,
+    ShardHost as ShardHostData,
+    ShardMessage as ShardMessageData,
+)
+
+header = struct.Struct("<I")
+
+
+def shard_of(host: str, workers: int) -> int:
+    """主机所在的分片, 和进程无关, 每个进程算出的结果相同"""
+    return zlib.crc32(host.encode()) % workers
+
+
+def _same(a: Optional[FrozenTree], b: Optional[FrozenTree]) -> bool:
+    return (a.digest if a is not None else None) == (b.digest if b is not None else None)
+
+
+def merge(interner: Interner, base: Optional[FrozenTree], current: FrozenTree, incoming: FrozenTree) -> FrozenTree:
+    """
+    三方合并, base 是 current 和 incoming 的共同祖先, 不知道时为 None.
+    只有一边修改过的部分取修改后的版本, 两边都修改过的目录逐项合并, 其他冲突以 incoming 为准
+    """
+    if _same(current, incoming) or _same(current, base):
+        return incoming
+    if _same(incoming, base):
+        return current
+    if current.type != FileType.dir or incoming.type != FileType.dir:
+        return incoming
+    old = {x.name: x for x in base.sub} if base is not None and base.type == FileType.dir else {}
+    mine = {x.name: x for x in current.sub}
+    theirs = {x.name: x for x in incoming.sub}
+    sub = []
+    for name in mine.keys() | theirs.keys():
+        b, c, i = old.get(name), mine.get(name), theirs.get(name)
+        if _same(c, i) or _same(c, b):
+            x = i
+        elif _same(i, b):
+            x = c
+        elif c is None or i is None:
+            # 一边删除一边修改
+            x = i
+        else:
+            x = merge(interner, b, c, i)
+        if x is not None:
+            sub.append(x)
+    sub.sort(key=lambda x: (x.type, x.name))
+    flags = current.flags if base is not None and incoming.flags == base.flags else incoming.flags
+    return interner.intern(incoming.name, incoming.type, incoming.data, flags, tuple(sub))
+
+
+class Channel:
+    """一个连接, 记住两个方向上已经传过的节点"""
+
+    # 发送过的节点超过这个数量时两边一起重新编号, 释放不再使用的旧版本
+    reset_nodes = 100_000
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, interner: Interner):
+        self.reader = reader
+        self.writer = writer
+        self.interner = interner
+        # 摘要 -> 对方收到的下标
+        self.sent: dict[bytes, int] = {}
+        self.received: list[FrozenTree] = []
+        # 等待发送的主机和成绩, 同一台主机只发送最后的版本
+        self.hosts: dict[str, tuple[ShardHostData, FrozenTree]] = {}
+        self.scores: list[ScoreData] = []
+
+    def send(self):
+        if not self.hosts and not self.scores:
+            return
+        msg = ShardMessageData(scores=self.scores)
+        if len(self.sent) > self.reset_nodes:
+            self.sent = {}
+            msg.reset = True
+        nodes = []
+        for h, root in self.hosts.values():
+            h.root = encode_nodes(root, self.sent, nodes)
+            msg.hosts.append(h)
+        msg.nodes.extend(nodes)
+        self.hosts = {}
+        self.scores = []
+        data = msg.SerializeToString()
+        self.writer.write(header.pack(len(data)) + data)
+
+    async def receive(self) -> Optional[ShardMessageData]:
+        """读取一条消息, 连接关闭时返回 None"""
+        try:
+            n, = header.unpack(await self.reader.readexactly(header.size))
+            msg = ShardMessageData.FromString(await self.reader.readexactly(n))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+        if msg.reset:
+            self.received = []
+        for x in msg.nodes:
+            self.received.append(self.interner.decode(x, self.received))
+        return msg
+
+    async def close(self):
+        self.send()
+        try:
+            await self.writer.drain()
+            self.writer.close()
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class Coordinator:
+    """协调进程, 持有权威的主机, 合并各个分片的修改并转发给其他分片"""
+
+    # 收到修改后等待多久完整保存存档, 秒
+    delay = 1.0
+    # 节点超过这个数量时只保留当前版本用到的节点
+    collect_nodes = 500_000
+
+    def __init__(self, game: GameStatus):
+        self.game = game
+        self.interner = Interner()
+        # 主机名 -> 当前版本
+        self.roots: dict[str, FrozenTree] = {}
+        # 分片进程中新建的主机, 主机名 -> (ip, 用户名)
+        self.created: dict[str, tuple[str, str]] = {}
+        self.peers: list[Channel] = []
+        # 还没有写入存档的主机
+        self.dirty: set[str] = set()
+        self._timer: Optional[Timer] = None
+        self._sending = False
+        self._server: Optional[asyncio.AbstractServer] = None
+        for node in game.hosts.values():
+            self.roots[node.host] = self.interner.freeze(node.file_sys)
+
+    async def serve(self, path: str):
+        self._server = await asyncio.start_unix_server(self.handle, path)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        channel = Channel(reader, writer, self.interner)
+        self.peers.append(channel)
+        try:
+            while (msg := await channel.receive()) is not None:
+                self.apply(channel, msg)
+        finally:
+            self.peers.remove(channel)
+            writer.close()
+
+    def current(self, h: ShardHostData) -> Optional[FrozenTree]:
+        root = self.roots.get(h.host)
+        if root is None:
+            # 生成的主机在第一次修改时才创建
+            node = self.game.hosts.get(h.host)
+            if node is not None:
+                root = self.roots[h.host] = self.interner.freeze(node.file_sys)
+        return root
+
+    def apply(self, channel: Channel, msg: ShardMessageData):
+        for h in msg.hosts:
+            incoming = channel.received[h.root]
+            current = self.current(h)
+            if current is None:
+                merged = incoming
+                self.created[h.host] = (h.ip, h.name)
+            else:
+                merged = merge(self.interner, self.interner.nodes.get(h.base), current, incoming)
+            self.roots[h.host] = merged
+            self.dirty.add(h.host)
+            for peer in self.peers:
+                # 合并后和发来的版本相同时不需要发回去
+                if peer is not channel or merged.digest != incoming.digest:
+                    peer.hosts[h.host] = (ShardHostData(ip=h.ip, host=h.host, name=h.name), merged)
+        for x in msg.scores:
+            self.game.scores.add(x)
+            for peer in self.peers:
+                if peer is not channel:
+                    peer.scores.append(x)
+        if not self._sending:
+            # 同一轮事件循环中收到的消息合并转发
+            self._sending = True
+            asyncio.get_running_loop().call_soon(self.send)
+        if self.dirty and self._timer is None:
+            self._timer = scheduler.call_later(self.delay, self.save)
+
+    def send(self):
+        self._sending = False
+        for peer in self.peers:
+            peer.send()
+
+    def save(self):
+        if self._timer is not None:
+            scheduler.cancel(self._timer)
+            self._timer = None
+        if not self.dirty:
+            return
+        for host in self.dirty:
+            root = self.roots[host]
+            node = self.game.hosts.get(host)
+            if node is None:
+                ip, name = self.created[host]
+                node = HostNode(name=name, host=host, file=root.thaw(), game=self.game, ip=ip or None)
+                if node.ip is not None and self.game.hosts.ip_of(node.ip) is not None:
+                    node.ip = None
+                self.game.hosts[host] = node
+            elif self.interner.freeze(node.file_sys).digest != root.digest:
+                node.file_sys = root.thaw()
+                node.config = node.load_config()
+        self.dirty.clear()
+        self.game.save()
+        if len(self.interner.nodes) > self.collect_nodes:
+            self.interner.collect(self.roots.values())
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for peer in list(self.peers):
+            await peer.close()
+        self.save()
+        self.game.close()
+
+
+class ShardScores(Scores):
+    """分片进程的排行榜, 读取协调进程写入的文件, 新的成绩交给协调进程写入"""
+
+    def __init__(self, path, client: 'ShardClient'):
+        super().__init__(path)
+        self.client = client
+        self.loaded = False
+
+    def load(self):
+        """只在启动时读取文件, 之后其他进程的成绩由协调进程转发, 再读文件会重复计算"""
+        if not self.loaded:
+            self.loaded = True
+            super().load()
+
+    def flush(self):
+        if self._timer is not None:
+            scheduler.cancel(self._timer)
+            self._timer = None
+        if self.pending:
+            self.client.send_scores(self.pending)
+            self.pending = []
+
+    def compact(self):
+        """只有协调进程重写文件"""
+
+
+class ShardClient:
+    """分片进程中和协调进程的连接, 设置为 GameStatus.shard 后保存时不写存档, 改为同步给协调进程"""
+
+    # 保存后等待多久发送, 合并这段时间内的修改, 秒
+    delay = 0.05
+
+    def __init__(self, game: GameStatus):
+        self.game = game
+        self.interner = Interner()
+        # 主机名 -> 协调进程已知的版本
+        self.known: dict[str, FrozenTree] = {}
+        self.channel: Optional[Channel] = None
+        self._timer: Optional[Timer] = None
+        self._receiver: Optional[asyncio.Task] = None
+
+    async def connect(self, path: str):
+        reader, writer = await asyncio.open_unix_connection(path)
+        self.channel = Channel(reader, writer, self.interner)
+        # 换出到磁盘的主机不会被扫描到, 分片进程中的主机都留在内存中
+        self.game.cache.budget = sys.maxsize
+        for node in self.game.hosts.values():
+            self.known[node.host] = self.interner.freeze(node.file_sys)
+        scores = ShardScores(self.game._path.with_suffix(".scores"), self)
+        # 之后收到的成绩都在读取的文件之后
+        scores.load()
+        self.game._scores = scores
+        self.game.shard = self
+        self._receiver = asyncio.ensure_future(self.receive())
+
+    def sync(self):
+        if self._timer is None:
+            self._timer = scheduler.call_later(self.delay, self.flush)
+
+    def send_scores(self, scores: list[ScoreData]):
+        self.channel.scores.extend(scores)
+        self.sync()
+
+    def flush(self):
+        """发送修改过的主机和新的成绩"""
+        if self._timer is not None:
+            scheduler.cancel(self._timer)
+            self._timer = None
+        if self.channel.writer.is_closing():
+            # 已经断开, 分片进程不会自己写存档
+            return
+        for node in list(self.game.hosts.values()):
+            if not node.resident:
+                continue
+            root = self.interner.freeze(node._file_sys)
+            base = self.known.get(node.host)
+            if base is None and node.generated is not None and node.generated == node.digest(node.to_proto()):
+                # 生成后没有修改过的主机, 每个进程生成的内容都相同
+                self.known[node.host] = root
+                continue
+            if base is not None and base.digest == root.digest:
+                continue
+            h = ShardHostData(ip=node.ip, host=node.host, name=node.name, base=base.digest if base else b"")
+            self.channel.hosts[node.host] = (h, root)
+            self.known[node.host] = root
+        self.channel.send()
+
+    async def receive(self):
+        while (msg := await self.channel.receive()) is not None:
+            for h in msg.hosts:
+                self.apply(h, self.channel.received[h.root])
+            for x in msg.scores:
+                self.game.scores.board(x.game).submit(x.player, x.score, x.time)
+
+    def apply(self, h: ShardHostData, theirs: FrozenTree):
+        node = self.game.hosts.get(h.host)
+        if node is None:
+            node = HostNode(name=h.name, host=h.host, file=theirs.thaw(), game=self.game, ip=h.ip or None)
+            if node.ip is not None and self.game.hosts.ip_of(node.ip) is not None:
+                node.ip = None
+            self.game.hosts[h.host] = node
+            self.known[h.host] = theirs
+            return
+        local = self.interner.freeze(node.file_sys)
+        base = self.known.get(h.host)
+        self.known[h.host] = theirs
+        if local.digest == theirs.digest:
+            return
+        if base is not None and local.digest != base.digest:
+            # 本地还有没有发送的修改, 合并之后再发送
+            merged = merge(self.interner, base, theirs, local)
+            self.sync()
+        else:
+            merged = theirs
+        node.file_sys = merged.thaw()
+        node.config = node.load_config()
+
+    async def close(self):
+        self.game.scores.flush()
+        self.flush()
+        await self.channel.close()
+        if self._receiver is not None:
+            self._receiver.cancel()
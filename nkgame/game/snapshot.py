@@ -0,0 +1,201 @@
+"""
+世界快照
+
+快照由不可变的 FrozenTree 组成, 内容相同的子树按摘要合并为同一个对象, 不同快照之间共享没有修改的部分.
+每个 TreeSystem 缓存自己的不可变版本, 修改时沿父节点清空缓存 (见 TreeSystem._invalidate),
+所以拍快照只需要重建上次之后修改过的路径, 没有修改时直接返回根节点的缓存.
+快照文件是多条 SnapshotStore 消息首尾相接 (protobuf 合并时 repeated 字段依次追加),
+新快照只追加文件中还没有的节点, 删除快照时才整体重写
+"""
+import hashlib
+import struct
+import time
+from pathlib import Path
+from typing import Optional
+
+from nkgame.commands.status import TreeSystem, legacy_mode
+from nkgame.pb.game_status_pb2 import (
+    SnapshotStore as SnapshotStoreData,
+    SnapshotNode as SnapshotNodeData,
+    Snapshot as SnapshotData,
+    SnapshotHost as SnapshotHostData,
+)
+
+
+class FrozenTree:
+    # flags 是 (所有者, 权限位, 是否可见)
+    __slots__ = ("name", "type", "data", "flags", "sub", "digest")
+
+    def __init__(self, name: str, ex: int, data: str, flags: tuple, sub: tuple, digest: bytes):
+        self.name = name
+        self.type = ex
+        self.data = data
+        self.flags = flags
+        self.sub = sub
+        self.digest = digest
+
+    @staticmethod
+    def make_digest(name: str, ex: int, data: str, flags: tuple, sub: tuple) -> bytes:
+        owner, mode, visible = flags
+        h = hashlib.sha1()
+        for x in (name, data or "", owner):
+            b = x.encode()
+            h.update(struct.pack("<I", len(b)))
+            h.update(b)
+        h.update(struct.pack("<BHB", ex, mode, visible))
+        for x in sub:
+            h.update(x.digest)
+        return h.digest()
+
+    def thaw(self) -> TreeSystem:
+        """生成可以修改的文件树, 每个节点都记住对应的不可变版本, 之后再拍快照不需要重建"""
+        tree = TreeSystem(self.name, self.type, data=self.data)
+        tree.owner, tree.mode, tree.visible = self.flags
+        for x in self.sub:
+            tree.add(x.thaw())
+        tree._frozen = self
+        return tree
+
+
+class Snapshot:
+
+    def __init__(self, sid: int, name: str, created: float, hosts: dict[str, FrozenTree]):
+        self.id = sid
+        self.name = name
+        self.created = created
+        # ip -> 根节点
+        self.hosts = hosts
+
+
+class Interner:
+    """按摘要合并相同内容的节点, 快照和分片同步 (见 nkgame.game.shard) 共用"""
+
+    def __init__(self):
+        # 摘要 -> 节点, 相同内容的节点只保留一个
+        self.nodes: dict[bytes, FrozenTree] = {}
+
+    def intern(self, name: str, ex: int, data: str, flags: tuple, sub: tuple) -> FrozenTree:
+        digest = FrozenTree.make_digest(name, ex, data, flags, sub)
+        node = self.nodes.get(digest)
+        if node is None:
+            node = self.nodes[digest] = FrozenTree(name, ex, data, flags, sub, digest)
+        return node
+
+    def freeze(self, tree: TreeSystem) -> FrozenTree:
+        if tree._frozen is not None:
+            return tree._frozen
+        sub = tuple(self.freeze(x) for x in tree.sub)
+        flags = (tree.owner, tree.mode, tree.visible)
+        tree._frozen = self.intern(tree.name, tree.type, tree.data, flags, sub)
+        return tree._frozen
+
+    def decode(self, x: SnapshotNodeData, nodes: list[FrozenTree]) -> FrozenTree:
+        """读取 encode_nodes 写出的节点, 子节点的下标指向 nodes 中已经读取的节点"""
+        flags = (x.owner, x.mode if x.HasField("mode") else legacy_mode(x.readable, x.writable, x.executable), x.visible)
+        return self.intern(x.name, x.type, x.data, flags, tuple(nodes[i] for i in x.sub))
+
+    def collect(self, roots) -> None:
+        """只保留 roots 中用到的节点"""
+        used = {}
+        for root in roots:
+            _collect(root, used)
+        self.nodes = used
+
+
+def _collect(node: FrozenTree, used: dict[bytes, FrozenTree]):
+    if node.digest in used:
+        return
+    used[node.digest] = node
+    for x in node.sub:
+        _collect(x, used)
+
+
+def encode_nodes(root: FrozenTree, index: dict[bytes, int], nodes: list[SnapshotNodeData]) -> int:
+    """
+    把 index 中没有的节点追加到 nodes, 返回根节点的下标.
+    新节点的下标接在 index 后面, 每个节点只写一次, 子节点在父节点之前
+    """
+    # 按摘要去重, 文件树缓存的节点可能不在同一个 Interner 中
+    i = index.get(root.digest)
+    if i is not None:
+        return i
+    sub = [encode_nodes(x, index, nodes) for x in root.sub]
+    owner, mode, visible = root.flags
+    nodes.append(SnapshotNodeData(
+        name=root.name, type=root.type, data=root.data, sub=sub, owner=owner, mode=mode, visible=visible,
+    ))
+    i = index[root.digest] = len(index)
+    return i
+
+
+class SnapshotStore(Interner):
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = path
+        self.snapshots: dict[int, Snapshot] = {}
+        # 摘要 -> 节点在文件中的下标
+        self.written: dict[bytes, int] = {}
+        self.loaded = False
+
+    def take(self, name: str, trees: dict[str, TreeSystem]) -> Snapshot:
+        self.load()
+        sid = max(self.snapshots, default=0) + 1
+        snapshot = self.snapshots[sid] = Snapshot(
+            sid, name, time.time(), {ip: self.freeze(tree) for ip, tree in trees.items()}
+        )
+        self.append(snapshot)
+        return snapshot
+
+    def get(self, sid: int) -> Optional[Snapshot]:
+        self.load()
+        return self.snapshots.get(sid)
+
+    def delete(self, sid: int) -> bool:
+        self.load()
+        if self.snapshots.pop(sid, None) is None:
+            return False
+        self.save()
+        return True
+
+    def encode(self, snapshots: list[Snapshot], index: dict[bytes, int]) -> bytes:
+        """编码快照和 index 中没有的节点, 见 encode_nodes"""
+        nodes = []
+        data = [
+            SnapshotData(
+                id=x.id, name=x.name, time=x.created,
+                hosts=[SnapshotHostData(ip=ip, root=encode_nodes(root, index, nodes)) for ip, root in x.hosts.items()],
+            )
+            for x in snapshots
+        ]
+        return SnapshotStoreData(nodes=nodes, snapshots=data).SerializeToString()
+
+    def append(self, snapshot: Snapshot):
+        """追加一个快照, 只写入之前没有保存过的节点"""
+        data = self.encode([snapshot], self.written)
+        with self.path.open("ab") as f:
+            f.write(data)
+
+    def save(self):
+        """重写快照文件, 只保留快照还在使用的节点"""
+        index: dict[bytes, int] = {}
+        data = self.encode(list(self.snapshots.values()), index)
+        self.path.write_bytes(data)
+        self.written = index
+        # 删除快照后不再使用的节点也从内存中释放
+        self.collect(root for x in self.snapshots.values() for root in x.hosts.values())
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if not self.path.exists():
+            return
+        r = SnapshotStoreData.FromString(self.path.read_bytes())
+        nodes: list[FrozenTree] = []
+        for x in r.nodes:
+            node = self.decode(x, nodes)
+            self.written.setdefault(node.digest, len(nodes))
+            nodes.append(node)
+        for x in r.snapshots:
+            self.snapshots[x.id] = Snapshot(x.id, x.name, x.time, {h.ip: nodes[h.root] for h in x.hosts})
@@ -0,0 +1,160 @@
+"""
+文本内容
+
+大文件按块保存, 每块是一个不可变的 str, 修改时只复制被修改的块, 其余的块在新旧版本之间共享.
+Text 本身也不可变, 修改返回新的 Text, 所以可以直接在文件, 快照和复制的文件之间共享
+"""
+import bisect
+import itertools
+from typing import Iterator, Union
+
+# 每块最多的字符数, 追加时不足一半的最后一块会和新内容合并, 避免产生很多小块
+CHUNK_SIZE = 64 * 1024
+
+
+def split(s: str) -> list[str]:
+    return [s[i:i + CHUNK_SIZE] for i in range(0, len(s), CHUNK_SIZE)]
+
+
+def nbytes(s: str) -> int:
+    """utf-8 编码后的字节数"""
+    return len(s) if s.isascii() else len(s.encode())
+
+
+class Text:
+    __slots__ = ("_chunks", "_offsets", "_flat", "_sizes")
+
+    def __init__(self, chunks: list[str] = None, flat: str = None, sizes: list[int] = None):
+        self._chunks: list[str] = chunks or []
+        # 每块的起始位置, 第一次按位置查找时计算
+        self._offsets: Union[None, list[int]] = None
+        self._flat = flat
+        # 每块编码后的字节数, 修改时共享的块沿用原来的值, 只计算新的块
+        self._sizes: Union[None, list[int]] = sizes
+
+    @classmethod
+    def of(cls, value: Union[None, str, 'Text']) -> 'Text':
+        if isinstance(value, Text):
+            return value
+        if not value:
+            return cls()
+        return cls(split(value), value)
+
+    @property
+    def offsets(self) -> list[int]:
+        if self._offsets is None:
+            self._offsets = [0, *itertools.accumulate(len(x) for x in self._chunks)]
+        return self._offsets
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    @property
+    def sizes(self) -> list[int]:
+        if self._sizes is None:
+            self._sizes = [nbytes(x) for x in self._chunks]
+        return self._sizes
+
+    @property
+    def nbytes(self) -> int:
+        """utf-8 编码后的字节数, 和 len 不同, 非 ascii 字符占多个字节"""
+        return sum(self.sizes)
+
+    def _derive(self, i: int, chunks: list[str], j: int, flat: str = None) -> 'Text':
+        """用 chunks 替换第 i 到 j 块 (不含 j) 得到新版本, 已经计算过的字节数保留"""
+        sizes = None
+        if self._sizes is not None:
+            sizes = self._sizes[:i] + [nbytes(x) for x in chunks] + self._sizes[j:]
+        return Text(self._chunks[:i] + chunks + self._chunks[j:], flat, sizes)
+
+    def __bool__(self):
+        return bool(self._chunks)
+
+    def __str__(self):
+        """拼接成一个 str, 结果缓存到下次修改"""
+        if self._flat is None:
+            self._flat = "".join(self._chunks)
+        return self._flat
+
+    def __eq__(self, other):
+        if isinstance(other, Text):
+            if self._chunks == other._chunks:
+                return True
+            other = str(other)
+        if isinstance(other, str):
+            return len(self) == len(other) and str(self) == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __repr__(self):
+        return f"Text({len(self)} chars, {len(self._chunks)} chunks)"
+
+    def chunks(self) -> Iterator[str]:
+        return iter(self._chunks)
+
+    def _locate(self, pos: int) -> tuple[int, int]:
+        """位置所在的块和块内的偏移"""
+        offsets = self.offsets
+        i = bisect.bisect_right(offsets, pos) - 1
+        i = min(max(i, 0), max(len(self._chunks) - 1, 0))
+        return i, pos - offsets[i]
+
+    def __getitem__(self, item: slice) -> str:
+        start, stop, step = item.indices(len(self))
+        if step != 1 or start >= stop:
+            return str(self)[item]
+        if self._flat is not None:
+            return self._flat[start:stop]
+        i, a = self._locate(start)
+        j, b = self._locate(stop)
+        if i == j:
+            return self._chunks[i][a:b]
+        return "".join((self._chunks[i][a:], *self._chunks[i + 1:j], self._chunks[j][:b]))
+
+    def append(self, s: str) -> 'Text':
+        """在末尾追加, 只复制最后一块"""
+        if not s:
+            return self
+        i = len(self._chunks)
+        if i and len(self._chunks[-1]) < CHUNK_SIZE // 2:
+            i -= 1
+            s = self._chunks[-1] + s
+        return self._derive(i, split(s), len(self._chunks))
+
+    def replace(self, start: int, stop: int, s: str = "") -> 'Text':
+        """把 [start, stop) 替换为 s, 只复制首尾两块"""
+        size = len(self)
+        start, stop = max(min(start, size), 0), max(min(stop, size), 0)
+        if start > stop:
+            start, stop = stop, start
+        if start == size:
+            return self.append(s)
+        i, a = self._locate(start)
+        j, b = self._locate(stop)
+        middle = self._chunks[i][:a] + s + self._chunks[j][b:]
+        return self._derive(i, split(middle), j + 1)
+
+    def update(self, s: str) -> 'Text':
+        """
+        换成新的内容, 跳过首尾没有变化的块, 只替换中间修改过的部分, 没有变化时返回自身
+        """
+        chunks = self._chunks
+        i, start = 0, 0
+        while i < len(chunks) and s.startswith(chunks[i], start):
+            start += len(chunks[i])
+            i += 1
+        if i == len(chunks) and start == len(s):
+            return self
+        j, stop = len(chunks), len(s)
+        while j > i and stop - len(chunks[j - 1]) >= start and s.endswith(chunks[j - 1], 0, stop):
+            stop -= len(chunks[j - 1])
+            j -= 1
+        return self._derive(i, split(s[start:stop]), j, s)
+
+    def insert(self, pos: int, s: str) -> 'Text':
+        return self.replace(pos, pos, s)
+
+    def delete(self, start: int, stop: int) -> 'Text':
+        return self.replace(start, stop)
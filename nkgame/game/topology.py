@@ -0,0 +1,214 @@
+"""
+网络拓扑
+
+主机按 /24 子网分组, 组内的主机都连到组里地址最小的网关 (局域网链路),
+网关之间依次相连并随机增加一条捷径 (广域网链路).
+最短路径按源主机缓存为最短路径树, 增加主机或链路时只对缓存的树做增量松弛,
+删除链路时只丢弃用到这条链路的树, 下次查询时再重新计算
+"""
+import heapq
+import random
+import socket
+import zlib
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+
+class Link:
+    __slots__ = ("latency", "bandwidth")
+
+    def __init__(self, latency: float, bandwidth: float):
+        # 延迟, 毫秒
+        self.latency = latency
+        # 带宽, 字节/秒
+        self.bandwidth = bandwidth
+
+    def __repr__(self):
+        return f"<Link {self.latency:.1f}ms {self.bandwidth / 1024:.0f}KB/s>"
+
+
+class PathTree:
+    """单源最短路径树"""
+    __slots__ = ("source", "dist", "parent")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.dist: dict[str, float] = {source: 0.0}
+        self.parent: dict[str, Optional[str]] = {source: None}
+
+
+class Route:
+
+    def __init__(self, hops: list[str], links: list[Link]):
+        self.hops = hops
+        self.links = links
+
+    @property
+    def latency(self) -> float:
+        return sum(x.latency for x in self.links)
+
+    @property
+    def bandwidth(self) -> float:
+        return min((x.bandwidth for x in self.links), default=float("inf"))
+
+
+def ipv4(host: str) -> Optional[int]:
+    try:
+        return int.from_bytes(socket.inet_aton(host), "big") if host.count(".") == 3 else None
+    except OSError:
+        return None
+
+
+def host_key(host: str):
+    ip = ipv4(host)
+    return (1, 0, host) if ip is None else (0, ip, host)
+
+
+def host_group(host: str) -> str:
+    """主机所在的 /24 子网, 不是 ip 地址的主机都在 local 组"""
+    ip = ipv4(host)
+    if ip is None:
+        return "local"
+    return socket.inet_ntoa((ip & 0xffffff00).to_bytes(4, "big")) + "/24"
+
+
+class Topology:
+
+    lan_latency = (0.2, 2.0)
+    lan_bandwidth = (10 * 1024 ** 2, 100 * 1024 ** 2)
+    wan_latency = (5.0, 60.0)
+    wan_bandwidth = (256 * 1024, 4 * 1024 ** 2)
+
+    def __init__(self, seed: int = 0, max_trees: int = 64):
+        self.seed = seed
+        self.max_trees = max_trees
+        self.links: dict[str, dict[str, Link]] = {}
+        # 子网 -> 网关
+        self.gateways: dict[str, str] = {}
+        self.backbone: list[str] = []
+        self._trees: OrderedDict[str, PathTree] = OrderedDict()
+
+    @classmethod
+    def build(cls, hosts: Iterable[str], seed: int = 0) -> 'Topology':
+        topology = cls(seed)
+        for host in sorted(hosts, key=host_key):
+            topology.add_host(host)
+        return topology
+
+    def __contains__(self, host):
+        return host in self.links
+
+    def make_link(self, a: str, b: str, wan: bool) -> Link:
+        # 链路参数由两端地址确定, 每次创建的拓扑都一样
+        h1 = zlib.crc32(f"{self.seed}:{a}:{b}".encode())
+        h2 = zlib.crc32(b"bandwidth", h1)
+        (l0, l1), (b0, b1) = (self.wan_latency, self.wan_bandwidth) if wan else (self.lan_latency, self.lan_bandwidth)
+        return Link(l0 + (l1 - l0) * h1 / 0xffffffff, b0 + (b1 - b0) * h2 / 0xffffffff)
+
+    def add_host(self, host: str):
+        if host in self.links:
+            return
+        self.links[host] = {}
+        group = host_group(host)
+        gateway = self.gateways.get(group)
+        if gateway is not None:
+            self.add_link(host, gateway, self.make_link(host, gateway, wan=False))
+            return
+
+        # 新的子网, 当前主机作为网关接入骨干网
+        self.gateways[group] = host
+        if self.backbone:
+            prev = self.backbone[-1]
+            self.add_link(host, prev, self.make_link(host, prev, wan=True))
+            other = random.Random(f"{self.seed}:{host}").choice(self.backbone)
+            if other != prev:
+                self.add_link(host, other, self.make_link(host, other, wan=True))
+        self.backbone.append(host)
+
+    def remove_host(self, host: str):
+        if host not in self.links:
+            return
+        for other in list(self.links[host]):
+            self.remove_link(host, other)
+        self.links.pop(host)
+        group = host_group(host)
+        if self.gateways.get(group) == host:
+            self.gateways.pop(group)
+            self.backbone.remove(host)
+        for tree in self._trees.values():
+            tree.dist.pop(host, None)
+            tree.parent.pop(host, None)
+        self._trees.pop(host, None)
+
+    def add_link(self, a: str, b: str, link: Link):
+        self.links.setdefault(a, {})[b] = link
+        self.links.setdefault(b, {})[a] = link
+        for tree in self._trees.values():
+            self._relax(tree, a, b, link.latency)
+            self._relax(tree, b, a, link.latency)
+
+    def remove_link(self, a: str, b: str):
+        self.links.get(a, {}).pop(b, None)
+        self.links.get(b, {}).pop(a, None)
+        # 只有用到这条链路的最短路径树需要重新计算
+        for source in [
+            s for s, t in self._trees.items() if t.parent.get(a) == b or t.parent.get(b) == a
+        ]:
+            self._trees.pop(source)
+
+    def _relax(self, tree: PathTree, u: str, v: str, w: float):
+        """增加链路 u -> v 后, 从 v 开始把变短的距离向外传播"""
+        du = tree.dist.get(u)
+        if du is None or du + w >= tree.dist.get(v, float("inf")):
+            return
+        tree.dist[v] = du + w
+        tree.parent[v] = u
+        heap = [(du + w, v)]
+        while heap:
+            d, x = heapq.heappop(heap)
+            if d > tree.dist[x]:
+                continue
+            for y, link in self.links[x].items():
+                nd = d + link.latency
+                if nd < tree.dist.get(y, float("inf")):
+                    tree.dist[y] = nd
+                    tree.parent[y] = x
+                    heapq.heappush(heap, (nd, y))
+
+    def _dijkstra(self, source: str) -> PathTree:
+        tree = PathTree(source)
+        heap = [(0.0, source)]
+        dist = tree.dist
+        while heap:
+            d, x = heapq.heappop(heap)
+            if d > dist[x]:
+                continue
+            for y, link in self.links[x].items():
+                nd = d + link.latency
+                if nd < dist.get(y, float("inf")):
+                    dist[y] = nd
+                    tree.parent[y] = x
+                    heapq.heappush(heap, (nd, y))
+        return tree
+
+    def tree(self, source: str) -> PathTree:
+        tree = self._trees.get(source)
+        if tree is not None:
+            self._trees.move_to_end(source)
+            return tree
+        tree = self._trees[source] = self._dijkstra(source)
+        if len(self._trees) > self.max_trees:
+            self._trees.popitem(last=False)
+        return tree
+
+    def route(self, source: str, target: str) -> Optional[Route]:
+        if source not in self.links or target not in self.links:
+            return None
+        tree = self.tree(source)
+        if target not in tree.dist:
+            return None
+        hops = [target]
+        while hops[-1] != source:
+            hops.append(tree.parent[hops[-1]])
+        hops.reverse()
+        return Route(hops, [self.links[a][b] for a, b in zip(hops, hops[1:])])
@@ -0,0 +1,217 @@
+"""
+按种子生成的大型网络
+
+主机地址在创建世界时就按种子确定, 每台主机的文件树只在第一次访问时才按 种子 + 主机地址 确定性地生成,
+存档时只保存和生成结果不同的主机.
+生成的主机按角色启动常驻进程和定时任务, 定时任务由共用的调度器触发
+"""
+import ipaddress
+import json
+import random
+
+from nkgame.commands.status import HostNode, TreeSystem, ROOT
+from nkgame.game.player import Player
+from nkgame.game.scheduler import scheduler
+from nkgame.pb.game_status_pb2 import FileType
+
+users = (
+    "alice", "bob", "carol", "dave", "eve", "frank", "grace", "heidi",
+    "ivan", "judy", "mallory", "oscar", "peggy", "trent", "victor", "walter",
+)
+
+words = (
+    "system", "backup", "password", "server", "network", "deploy", "config", "error",
+    "update", "kernel", "daemon", "restart", "disk", "memory", "cache", "report",
+    "todo", "meeting", "secret", "key", "log", "release", "patch", "monitor",
+)
+
+
+class HostContext:
+
+    def __init__(self, generator: 'WorldGenerator', host: str, rng: random.Random):
+        self.generator = generator
+        self.host = host
+        self.rng = rng
+        self.role = rng.choice(list(templates))
+        self.user = rng.choice(users)
+
+
+def sentence(ctx: HostContext, n=(4, 10)):
+    return " ".join(ctx.rng.choice(words) for _ in range(ctx.rng.randint(*n))).capitalize() + "."
+
+
+def text(ctx: HostContext, lines=(3, 12)):
+    return "\n".join(sentence(ctx) for _ in range(ctx.rng.randint(*lines))) + "\n"
+
+
+def script(ctx: HostContext):
+    commands = ["ls", "pwd", "cd lib", "cd ..", "ls -l", "open notes.txt", "exp 1+1"]
+    return "\n".join(ctx.rng.choice(commands) for _ in range(ctx.rng.randint(2, 6))) + "\n"
+
+
+def blob(ctx: HostContext):
+    return json.dumps([ctx.rng.randint(0, 255) for _ in range(ctx.rng.randint(8, 64))])
+
+
+def known_hosts(ctx: HostContext):
+    """记录几台邻近的主机, 玩家可以顺着这些记录探索网络"""
+    names = ctx.generator.names
+    return "\n".join(ctx.rng.choice(names) for _ in range(ctx.rng.randint(1, 4))) + "\n"
+
+
+def memos(ctx: HostContext):
+    return {f"memo_{i}.txt": (FileType.txt, text) for i in range(ctx.rng.randint(0, 4))}
+
+
+def config(ctx: HostContext):
+    return json.dumps({"role": ctx.role, "user": ctx.user})
+
+
+# 所有主机共有的目录结构
+# 值为 dict 表示目录, (类型, 生成函数) 表示文件, 函数表示按上下文生成的目录内容, 名称中可以使用 {user}
+common = {
+    "lib": {
+        "libc.so": (FileType.bin, blob),
+        "v1.sh": (FileType.exe, script),
+    },
+    "home": {
+        "{user}": {
+            "notes.txt": (FileType.txt, text),
+            ".ssh": {"known_hosts": (FileType.txt, known_hosts)},
+            "*": memos,
+        },
+    },
+    "etc": {
+        "hostname": (FileType.txt, lambda ctx: ctx.host + "\n"),
+        "motd.txt": (FileType.txt, sentence),
+    },
+    ".config": (FileType.bin, config),
+}
+
+templates = {
+    "web": {
+        "var": {"www": {
+            "index.html": (FileType.txt, text),
+            "robots.txt": (FileType.txt, lambda ctx: "User-agent: *\nDisallow: /admin\n"),
+        }},
+        "lib": {"libssl.so": (FileType.bin, blob)},
+        "etc": {"nginx.conf": (FileType.txt, text)},
+    },
+    "db": {
+        "var": {"db": {f"table_{i}.bin": (FileType.bin, blob) for i in range(4)}},
+        "etc": {"db.conf": (FileType.txt, text)},
+    },
+    "dev": {
+        "home": {"{user}": {"projects": {
+            "main.py": (FileType.txt, text),
+            "build.sh": (FileType.exe, script),
+        }}},
+        "lib": {"v2.sh": (FileType.exe, script)},
+    },
+    "mail": {
+        "var": {"mail": {"{user}": (FileType.txt, text)}},
+        "data": {"img": {"logo.jpg": (FileType.img, blob)}},
+    },
+}
+
+
+# 常驻进程, (名称, 负载, 内存)
+daemons = {
+    "common": [("init", 0, 1), ("sshd", 1, 2), ("crond", 0, 1)],
+    "web": [("nginx", 4, 12)],
+    "db": [("mysqld", 8, 40)],
+    "dev": [("code-server", 6, 24)],
+    "mail": [("postfix", 2, 8)],
+}
+
+# 定时任务, (名称, 负载, 内存, 间隔秒数, 运行秒数)
+crontab = {
+    "common": [("logrotate", 5, 4, (120, 600), (1, 5))],
+    "web": [],
+    "db": [("backup.sh", 30, 24, (60, 300), (5, 30))],
+    "dev": [("build.sh", 40, 32, (90, 600), (10, 60))],
+    "mail": [("spamd", 10, 16, (30, 120), (2, 8))],
+}
+
+
+def cron(player: Player, rng: random.Random, job: tuple, delay: float):
+    """到期时启动定时任务进程, 再安排下一次执行, 所有主机共用一个调度器"""
+    player.crons[job[0]] = scheduler.call_later(delay, run_cron, player, rng, job)
+
+
+def run_cron(player: Player, rng: random.Random, job: tuple):
+    name, load, memory, interval, duration = job
+    # 资源不足时跳过这一次
+    player.spawn(name, load, memory, duration=rng.uniform(*duration))
+    cron(player, rng, job, rng.uniform(*interval))
+
+
+def merge(a: dict, b: dict) -> dict:
+    r = dict(a)
+    for k, v in b.items():
+        if isinstance(v, dict) and isinstance(r.get(k), dict):
+            r[k] = merge(r[k], v)
+        else:
+            r[k] = v
+    return r
+
+
+class WorldGenerator:
+    """
+    世界生成器
+    """
+
+    network = ipaddress.ip_network("10.0.0.0/16")
+
+    def __init__(self, seed: int, size: int):
+        self.seed = seed
+        self.size = min(size, self.network.num_addresses - 2)
+        rng = random.Random(seed)
+        base = int(self.network.network_address)
+        offsets = rng.sample(range(1, self.network.num_addresses - 1), self.size)
+        self.hosts: dict[str, int] = {str(ipaddress.ip_address(base + x)): i for i, x in enumerate(offsets)}
+        self.names = list(self.hosts)
+
+    def __contains__(self, host):
+        return host in self.hosts
+
+    def generate(self, host: str, game) -> HostNode:
+        ctx = HostContext(self, host, random.Random(f"{self.seed}:{host}"))
+        tree = TreeSystem("root", FileType.dir, data="")
+        # 系统文件属于 root, 登录的用户只有 home 下自己的目录
+        tree.owner = ROOT
+        self.build(tree, merge(common, templates[ctx.role]), ctx, writable=False)
+        node = HostNode(name=ctx.user, host=host, file=tree, game=game, ip=host)
+        node.generated = node.digest(node.to_proto())
+        self.start(node, ctx)
+        return node
+
+    def start(self, node: HostNode, ctx: HostContext):
+        rng = random.Random(f"{self.seed}:{node.host}:cron")
+        for name, load, memory in daemons["common"] + daemons[ctx.role]:
+            node.player.spawn(name, load, memory)
+        for job in crontab["common"] + crontab[ctx.role]:
+            cron(node.player, rng, job, rng.uniform(0, job[3][1]))
+
+    def build(self, tree: TreeSystem, template: dict, ctx: HostContext, writable: bool):
+        tree.readable = tree.executable = tree.visible = True
+        tree.writable = writable
+        for name, value in template.items():
+            if callable(value):
+                self.build(tree, value(ctx), ctx, writable)
+                continue
+            name = name.format(user=ctx.user)
+            if isinstance(value, dict):
+                sub = TreeSystem(name, FileType.dir, data="")
+                if tree.name == "home" and name == ctx.user:
+                    sub.owner = ctx.user
+                tree.add(sub)
+                # home 下的目录可以写
+                self.build(sub, value, ctx, writable or tree.name == "home")
+                continue
+            ft, fn = value
+            f = TreeSystem(name, ft, data=fn(ctx))
+            f.readable = f.visible = True
+            f.writable = writable
+            f.executable = ft == FileType.exe
+            tree.add(f)
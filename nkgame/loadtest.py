@@ -0,0 +1,417 @@
+"""
+压力测试
+
+    nkgame loadtest [-n 客户端数] [-r 每秒命令数] [-d 秒] [--mix ls=30,cd=20,...] [-w 分片进程数]
+
+在一个进程里同时启动多个模拟玩家, 每个玩家一台新主机, 和 ssh 登录一样各自运行一个 shell,
+按权重随机执行 cd, ls, open, 编辑器写入, mkdir/rm 和小游戏的帧. 命令通过 prompt_toolkit 的管道输入
+逐字输入到真正的 PromptSession 中 (和 prompt_toolkit 的 telnet 服务一样每个会话一个 app session),
+--direct 时跳过 prompt_toolkit 直接交给 shell, 用来区分输入处理的开销.
+
+每个玩家的命令按泊松过程排好时间, 延迟从计划执行的时间算起, 前一条命令太慢时后面等待的时间也算在内,
+不会因为服务变慢就少发命令而低估延迟. 同时记录事件循环的延迟 (定时器实际唤醒比预期晚多少) 和进程的内存.
+在存档的临时副本上运行, 不修改原来的存档.
+-w 时当前进程作为协调进程, 玩家按主机分到多个分片进程 (见 nkgame.game.shard), 可以比较吞吐量随进程数的变化
+"""
+import argparse
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from prompt_toolkit.application import create_app_session
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
+from prompt_toolkit.shortcuts import PromptSession
+from rich.console import Console
+from rich.table import Table
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from nkgame import metrics
+from nkgame.commands import shell
+from nkgame.commands.console import VFileIO
+from nkgame.commands.status import GameStatus, HostNode, TreeSystem
+from nkgame.game.game_base import BreakGame, TetrisGame
+from nkgame.game.shard import Coordinator, ShardClient, shard_of
+from nkgame.pb.game_status_pb2 import FileType
+
+console = Console()
+
+actions = ("ls", "cd", "open", "vim", "mkdir", "rm", "game")
+default_mix = "ls=30,cd=20,open=20,vim=10,mkdir=5,rm=5,game=10"
+
+# 每个玩家的主机上预先生成的目录和文件
+DIRS = 4
+FILES = 5
+
+# 检查事件循环延迟的间隔, 秒
+LAG_INTERVAL = 0.01
+
+
+def parse_mix(text: str) -> dict[str, int]:
+    mix = {}
+    for item in text.split(","):
+        k, _, v = item.partition("=")
+        k = k.strip()
+        if k not in actions:
+            raise argparse.ArgumentTypeError(f"unknown command {k}, choose from {', '.join(actions)}")
+        try:
+            mix[k] = int(v)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"weight of {k} must be an integer")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("all weights are zero")
+    return mix
+
+
+def seed_tree() -> TreeSystem:
+    root = TreeSystem("root", FileType.dir)
+    for i in range(DIRS):
+        d = TreeSystem(f"d{i}", FileType.dir)
+        for j in range(FILES):
+            d.add(TreeSystem(f"f{j}.txt", FileType.txt, f"file {i}/{j}\n" * 20))
+        root.add(d)
+    return root
+
+
+def rss() -> int:
+    """当前的常驻内存, 字节"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        # 取不到当前值时用峰值代替, macOS 的单位是字节, linux 是 KB
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return 0
+
+
+class Recorder:
+    """按命令类型记录延迟"""
+
+    def __init__(self):
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.lag: list[float] = []
+        self.rss: list[int] = []
+        self.elapsed = 0.0
+        self.start_rss = self.end_rss = self.peak_rss = 0
+
+    def record(self, kind: str, seconds: float):
+        self.latency[kind].append(seconds)
+
+    def merge(self, other: 'Recorder'):
+        """合并另一个进程的结果, 内存按进程相加"""
+        for kind, values in other.latency.items():
+            self.latency[kind].extend(values)
+        for kind, n in other.errors.items():
+            self.errors[kind] += n
+        self.lag.extend(other.lag)
+        self.elapsed = max(self.elapsed, other.elapsed)
+        self.start_rss += other.start_rss
+        self.end_rss += other.end_rss
+        self.peak_rss += other.peak_rss
+
+    async def monitor(self):
+        """定时器实际唤醒比预期晚的时间就是事件循环被阻塞的时间"""
+        last = sampled = time.perf_counter()
+        while True:
+            await asyncio.sleep(LAG_INTERVAL)
+            now = time.perf_counter()
+            self.lag.append(max(now - last - LAG_INTERVAL, 0.0))
+            if now - sampled >= 1:
+                self.rss.append(rss())
+                sampled = now
+            last = now
+
+
+def percentile(values: list[float], q: float) -> float:
+    """values 已经排好序"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Client:
+    """
+    一个模拟玩家, 作为 shell 的 session 使用: shell 每次要读下一行时, 上一条命令已经执行完,
+    记录延迟, 等到下一条命令计划的时间再输入. 编辑器和小游戏需要终端, 直接在这里执行并计时
+    """
+
+    def __init__(self, status: HostNode, recorder: Recorder, mix: dict[str, int], rate: float,
+                 deadline: float, rng: random.Random, direct: bool):
+        self.status = status
+        self.recorder = recorder
+        self.kinds = list(mix.keys())
+        self.weights = list(mix.values())
+        self.rate = rate
+        self.deadline = deadline
+        self.rng = rng
+        self.direct = direct
+        self.session: Optional[PromptSession] = None
+        self.pipe = None
+        # 前一条输入 shell 的命令和计划的时间
+        self.pending: Optional[tuple[str, float]] = None
+        self.next_at = time.perf_counter() + rng.expovariate(rate)
+        self.made: list[str] = []
+        self.serial = 0
+        self.io = VFileIO(status)
+        self.tetris: Optional[TetrisGame] = None
+
+    async def run(self):
+        with contextlib.ExitStack() as stack:
+            if not self.direct:
+                self.pipe = stack.enter_context(create_pipe_input())
+                stack.enter_context(create_app_session(input=self.pipe, output=DummyOutput()))
+                self.session = PromptSession()
+            try:
+                await shell(self, self.status)
+            finally:
+                self.io.close()
+
+    def finish(self):
+        if self.pending is not None:
+            kind, scheduled = self.pending
+            self.recorder.record(kind, time.perf_counter() - scheduled)
+            self.pending = None
+
+    async def prompt_async(self, message, **kwargs) -> str:
+        self.finish()
+        while True:
+            scheduled = self.next_at
+            self.next_at += self.rng.expovariate(self.rate)
+            # 过载时积压的命令不再执行, 运行时间不超过设定的时间
+            if scheduled >= self.deadline or time.perf_counter() >= self.deadline:
+                raise EOFError()
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind = self.rng.choices(self.kinds, self.weights)[0]
+            if kind == "rm" and not self.made:
+                kind = "mkdir"
+            line = self.line(kind)
+            if line is None:
+                # 编辑器和小游戏不经过 shell
+                try:
+                    await getattr(self, kind)()
+                except Exception:
+                    self.recorder.errors[kind] += 1
+                self.recorder.record(kind, time.perf_counter() - scheduled)
+                continue
+            self.pending = (kind, scheduled)
+            if self.session is None:
+                return line
+            self.pipe.send_text(line + "\r")
+            return await self.session.prompt_async(message, **kwargs)
+
+    def line(self, kind: str) -> Optional[str]:
+        rng = self.rng
+        if kind == "ls":
+            return "ls"
+        if kind == "cd":
+            return rng.choice(["cd /", f"cd /d{rng.randrange(DIRS)}"])
+        if kind == "open":
+            return f"open /d{rng.randrange(DIRS)}/f{rng.randrange(FILES)}.txt"
+        if kind == "mkdir":
+            self.serial += 1
+            name = f"t{self.serial}"
+            self.made.append("/".join(self.status.path[1:] + [name]))
+            return f"mkdir {name}"
+        if kind == "rm":
+            return f"rm -r /{self.made.pop(0)}"
+        return None
+
+    async def vim(self):
+        """和编辑器保存时一样写入文件"""
+        location = f"/d{self.rng.randrange(DIRS)}/f{self.rng.randrange(FILES)}.txt"
+        data, _ = self.io.read(location)
+        self.io.write(location, data + f"edit {self.serial}\n")
+        self.serial += 1
+
+    async def game(self):
+        """小游戏不按键的一帧, 结束后提交成绩, 开始新的一局"""
+        if self.tetris is None:
+            self.tetris = TetrisGame(self.status)
+        try:
+            self.status.console.print(await self.tetris.next_frame(b""))
+        except BreakGame:
+            self.tetris.close()
+            self.tetris.submit_score()
+            self.tetris = None
+        except Exception:
+            self.tetris = None
+            raise
+
+
+def report(recorder: Recorder, clients: int, workers: int):
+    elapsed = recorder.elapsed
+    title = f"{clients} clients, {workers} workers, {elapsed:.1f}s" if workers else f"{clients} clients, {elapsed:.1f}s"
+    table = Table("command", "count", "ops/s", "p50 ms", "p99 ms", "max ms", "errors", title=title)
+    total = 0
+    for kind in sorted(recorder.latency):
+        values = sorted(recorder.latency[kind])
+        total += len(values)
+        table.add_row(
+            kind, f"{len(values)}", f"{len(values) / elapsed:.1f}",
+            f"{percentile(values, 0.5) * 1000:.2f}", f"{percentile(values, 0.99) * 1000:.2f}",
+            f"{values[-1] * 1000:.2f}", f"{recorder.errors.get(kind, 0)}",
+        )
+    console.print(table)
+    lag = sorted(recorder.lag)
+    console.print(
+        f"throughput [green]{total / elapsed:.1f}[/] ops/s, "
+        f"loop lag p50 {percentile(lag, 0.5) * 1000:.2f}ms p99 {percentile(lag, 0.99) * 1000:.2f}ms "
+        f"max {(lag[-1] if lag else 0) * 1000:.2f}ms"
+    )
+    mb = 1024 ** 2
+    console.print(
+        f"rss start {recorder.start_rss / mb:.1f}MB, end {recorder.end_rss / mb:.1f}MB, "
+        f"peak {recorder.peak_rss / mb:.1f}MB"
+    )
+
+
+def add_hosts(game: GameStatus, n: int) -> list[tuple[int, str]]:
+    """每个玩家一台新主机"""
+    hosts = []
+    for i in range(n):
+        host = f"load{i}"
+        game.hosts[host] = HostNode(name=f"player{i}", host=host, file=seed_tree(), game=game)
+        hosts.append((i, host))
+    return hosts
+
+
+async def run_clients(args: argparse.Namespace, game: GameStatus, hosts: list[tuple[int, str]]) -> Recorder:
+    recorder = Recorder()
+    deadline = time.perf_counter() + args.duration
+    clients = []
+    for i, host in hosts:
+        node = game.hosts[host]
+        # 输出照常渲染, 只是不显示
+        node.console = Console(file=open(os.devnull, "w"), width=100, height=30, force_terminal=True)
+        # 每个玩家的随机数只和编号有关, 分到哪个进程都执行相同的命令
+        rng = random.Random(f"{args.seed}-{i}")
+        clients.append(Client(node, recorder, args.mix, args.rate, deadline, rng, args.direct))
+
+    errors_before = dict(metrics.command_errors.values)
+    recorder.start_rss = rss()
+    monitor = asyncio.ensure_future(recorder.monitor())
+    st = time.perf_counter()
+    try:
+        await asyncio.gather(*(x.run() for x in clients))
+    finally:
+        monitor.cancel()
+        for x in clients:
+            x.status.console.file.close()
+    recorder.elapsed = time.perf_counter() - st
+
+    for labels, value in metrics.command_errors.values.items():
+        diff = value - errors_before.get(labels, 0)
+        if diff:
+            recorder.errors[dict(labels).get("command", "")] += int(diff)
+    recorder.end_rss = rss()
+    recorder.peak_rss = max(recorder.rss + [recorder.start_rss, recorder.end_rss])
+    return recorder
+
+
+async def load_test(args: argparse.Namespace, game: GameStatus) -> Recorder:
+    hosts = add_hosts(game, args.clients)
+    try:
+        return await run_clients(args, game, hosts)
+    finally:
+        game.close()
+
+
+def worker(args: argparse.Namespace, shard: int, save: str, path: str) -> Recorder:
+    """分片进程, 只运行主机分到这个分片的玩家"""
+    return asyncio.run(_worker(args, shard, save, path))
+
+
+async def _worker(args: argparse.Namespace, shard: int, save: str, path: str) -> Recorder:
+    game = GameStatus()
+    game._path = Path(save)
+    game.load()
+    client = ShardClient(game)
+    await client.connect(path)
+    hosts = [(i, f"load{i}") for i in range(args.clients) if shard_of(f"load{i}", args.workers) == shard]
+    try:
+        return await run_clients(args, game, hosts)
+    finally:
+        await client.close()
+
+
+async def sharded(args: argparse.Namespace, game: GameStatus, tmp: str) -> Recorder:
+    """
+    协调进程, 分片进程读取的存档中已经有所有玩家的主机.
+    报告中的延迟和错误是所有分片的合计, 内存是协调进程和所有分片进程的合计
+    """
+    add_hosts(game, args.clients)
+    game.save()
+    coordinator = Coordinator(game)
+    path = os.path.join(tmp, "shard.sock")
+    await coordinator.serve(path)
+    recorder = Recorder()
+    recorder.start_rss = rss()
+    loop = asyncio.get_running_loop()
+    try:
+        with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(pool, worker, args, shard, str(game._path), path) for shard in range(args.workers)
+            ))
+    finally:
+        await coordinator.close()
+    recorder.end_rss = recorder.peak_rss = rss()
+    for x in results:
+        recorder.merge(x)
+    return recorder
+
+
+parser = argparse.ArgumentParser(prog="nkgame loadtest", description="模拟多个玩家同时操作, 统计吞吐量, 延迟和内存")
+parser.add_argument("--save", dest="save", help="存档文件, 默认是游戏自带的存档, 在临时副本上运行", default=None)
+parser.add_argument("-n", "--clients", dest="clients", help="同时在线的玩家数", type=int, default=20)
+parser.add_argument("-r", "--rate", dest="rate", help="每个玩家每秒执行的命令数", type=float, default=2.0)
+parser.add_argument("-d", "--duration", dest="duration", help="运行时间, 秒", type=float, default=30.0)
+parser.add_argument("--mix", dest="mix", help=f"命令的权重, 默认 {default_mix}", type=parse_mix, default=None)
+parser.add_argument("--direct", dest="direct", help="不经过 prompt_toolkit, 直接把命令交给 shell", action="store_true")
+parser.add_argument("--seed", dest="seed", help="随机数种子", type=int, default=0)
+parser.add_argument("-w", "--workers", dest="workers", help="分片进程数, 玩家按主机分到各个进程, 0 时在当前进程运行",
+                    type=int, default=0)
+
+
+def main(argv: list[str]) -> int:
+    args = parser.parse_args(argv)
+    if args.mix is None:
+        args.mix = parse_mix(default_mix)
+    if args.clients < 1 or args.rate <= 0 or args.workers < 0:
+        console.print("[red]ERR[/] clients and rate must be positive, workers must not be negative.")
+        return 1
+    source = Path(args.save) if args.save else GameStatus()._path
+    with tempfile.TemporaryDirectory(prefix="nkgame-loadtest-") as tmp:
+        game = GameStatus()
+        game._path = Path(tmp) / source.name
+        shutil.copy(source, game._path)
+        game.load()
+        if args.workers:
+            recorder = asyncio.run(sharded(args, game, tmp))
+        else:
+            recorder = asyncio.run(load_test(args, game))
+    report(recorder, args.clients, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
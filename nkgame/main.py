@@ -1,6 +1,7 @@
 # from nkgame import cli
 
 import asyncio
+import sys
 
 import pyfiglet
 from prompt_toolkit.patch_stdout import patch_stdout
@@ -20,7 +21,10 @@ async def interactive_shell():
 
     localhost = status.user0
     localhost.console.print(pyfiglet.figlet_format("NK Game XD"))
-    await shell(session, localhost)
+    try:
+        await shell(session, localhost)
+    finally:
+        status.close()
     localhost.console.print("Bye.")
 
 
@@ -30,6 +34,13 @@ async def main():
 
 
 def entrypoint():
+    if len(sys.argv) > 1 and sys.argv[1] == "loadtest":
+        from nkgame import loadtest
+        sys.exit(loadtest.main(sys.argv[2:]))
+    if len(sys.argv) > 1:
+        # nkgame import / nkgame export
+        from nkgame import bulk
+        sys.exit(bulk.main(sys.argv[1:]))
     asyncio.run(main())
 
 
@@ -0,0 +1,130 @@
+"""
+运行时指标
+计数器和直方图都按标签分组, 可以导出为 prometheus 文本格式
+"""
+import bisect
+from collections import defaultdict
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: dict[tuple, float] = defaultdict(float)
+
+    def inc(self, value: float = 1, **labels):
+        self.values[tuple(sorted(labels.items()))] += value
+
+    def get(self, **labels) -> float:
+        return self.values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+
+class HistogramValue:
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class Histogram:
+    type = "histogram"
+
+    default_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, help: str, buckets=default_buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.values: dict[tuple, HistogramValue] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        h = self.values.get(key)
+        if h is None:
+            h = self.values[key] = HistogramValue(len(self.buckets) + 1)
+        h.counts[bisect.bisect_left(self.buckets, value)] += 1
+        h.count += 1
+        h.sum += value
+        h.max = max(h.max, value)
+
+    def quantile(self, q: float, labels: tuple) -> float:
+        """按桶估算分位数, 返回所在桶的上界"""
+        h = self.values.get(labels)
+        if h is None or h.count == 0:
+            return 0.0
+        rank = q * h.count
+        total = 0
+        for i, c in enumerate(h.counts):
+            total += c
+            if total >= rank:
+                return min(self.buckets[i], h.max) if i < len(self.buckets) else h.max
+        return h.max
+
+    def samples(self):
+        for labels, h in self.values.items():
+            total = 0
+            for le, c in zip(self.buckets + ("+Inf",), h.counts):
+                total += c
+                yield f"{self.name}_bucket", labels + (("le", str(le)),), total
+            yield f"{self.name}_sum", labels, h.sum
+            yield f"{self.name}_count", labels, h.count
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics: dict[str, object] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self.metrics.setdefault(name, Gauge(name, help))
+
+    def histogram(self, name: str, help: str, **kwargs) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help, **kwargs))
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for m in self.metrics.values():
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.type}")
+            for name, labels, value in m.samples():
+                if labels:
+                    label = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"{name}{{{label}}} {value}")
+                else:
+                    lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+command_total = registry.counter("nkgame_command_total", "执行的命令数")
+command_errors = registry.counter("nkgame_command_errors_total", "执行出错的命令数")
+command_seconds = registry.histogram("nkgame_command_seconds", "命令执行耗时")
+save_seconds = registry.histogram("nkgame_save_seconds", "存档耗时")
+save_bytes = registry.counter("nkgame_save_bytes_total", "存档写入的字节数")
+journal_bytes = registry.counter("nkgame_journal_bytes_total", "增量存档写入的字节数")
+script_cache_hits = registry.counter("nkgame_script_cache_hits_total", "脚本执行时编译结果已经缓存的次数")
+script_cache_misses = registry.counter("nkgame_script_cache_misses_total", "脚本执行时需要重新编译的次数")
+scores_submitted = registry.counter("nkgame_scores_submitted_total", "提交到排行榜的成绩数")
+host_cache_hits = registry.counter("nkgame_host_cache_hits_total", "访问时文件系统在内存中的次数")
+host_cache_misses = registry.counter("nkgame_host_cache_misses_total", "访问时需要从磁盘读取文件系统的次数")
+host_cache_evictions = registry.counter("nkgame_host_cache_evictions_total", "文件系统写到磁盘并释放的次数")
+host_cache_bytes = registry.gauge("nkgame_host_cache_bytes", "内存中文件系统的估算大小")
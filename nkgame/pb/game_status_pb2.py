@@ -15,7 +15,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11game_status.proto\"4\n\nGameStatus\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x18\n\x05nones\x18\x03 \x03(\x0b\x32\t.HostNode\"B\n\x08HostNode\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0c\n\x04host\x18\x02 \x01(\t\x12\x1a\n\x05\x66iles\x18\x03 \x01(\x0b\x32\x0b.TreeSystem\"\xa4\x01\n\nTreeSystem\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x17\n\x04type\x18\x02 \x01(\x0e\x32\t.FileType\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\t\x12\x18\n\x03sub\x18\x04 \x03(\x0b\x32\x0b.TreeSystem\x12\x10\n\x08readable\x18\x05 \x01(\x08\x12\x10\n\x08writable\x18\x06 \x01(\x08\x12\x12\n\nexecutable\x18\x07 \x01(\x08\x12\x0f\n\x07visible\x18\x08 \x01(\x08*@\n\x08\x46ileType\x12\x07\n\x03\x64ir\x10\x00\x12\x07\n\x03img\x10\x01\x12\x07\n\x03txt\x10\x02\x12\x07\n\x03\x65xe\x10\x03\x12\x07\n\x03\x62in\x10\x04\x12\x07\n\x03\x65nc\x10\x05\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11game_status.proto\"V\n\nGameStatus\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x18\n\x05nones\x18\x03 \x03(\x0b\x32\t.HostNode\x12\x0c\n\x04seed\x18\x04 \x01(\x04\x12\x12\n\nworld_size\x18\x05 \x01(\r\"N\n\x08HostNode\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x0c\n\x04host\x18\x02 \x01(\t\x12\x1a\n\x05\x66iles\x18\x03 \x01(\x0b\x32\x0b.TreeSystem\x12\n\n\x02ip\x18\x04 \x01(\t\"\xcf\x01\n\nTreeSystem\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x17\n\x04type\x18\x02 \x01(\x0e\x32\t.FileType\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\t\x12\x18\n\x03sub\x18\x04 \x03(\x0b\x32\x0b.TreeSystem\x12\x10\n\x08readable\x18\x05 \x01(\x08\x12\x10\n\x08writable\x18\x06 \x01(\x08\x12\x12\n\nexecutable\x18\x07 \x01(\x08\x12\x0f\n\x07visible\x18\x08 \x01(\x08\x12\r\n\x05owner\x18\t \x01(\t\x12\x11\n\x04mode\x18\n \x01(\rH\x00\x88\x01\x01\x42\x07\n\x05_mode\"\xc4\x01\n\x0cSnapshotNode\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x17\n\x04type\x18\x02 \x01(\x0e\x32\t.FileType\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\t\x12\x0b\n\x03sub\x18\x04 \x03(\r\x12\x10\n\x08readable\x18\x05 \x01(\x08\x12\x10\n\x08writable\x18\x06 \x01(\x08\x12\x12\n\nexecutable\x18\x07 \x01(\x08\x12\x0f\n\x07visible\x18\x08 \x01(\x08\x12\r\n\x05owner\x18\t \x01(\t\x12\x11\n\x04mode\x18\n \x01(\rH\x00\x88\x01\x01\x42\x07\n\x05_mode\"(\n\x0cSnapshotHost\x12\n\n\x02ip\x18\x01 \x01(\t\x12\x0c\n\x04root\x18\x02 \x01(\r\"P\n\x08Snapshot\x12\n\n\x02id\x18\x01 \x01(\r\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\x0c\n\x04time\x18\x03 \x01(\x01\x12\x1c\n\x05hosts\x18\x04 \x03(\x0b\x32\r.SnapshotHost\"K\n\rSnapshotStore\x12\x1c\n\x05nodes\x18\x01 \x03(\x0b\x32\r.SnapshotNode\x12\x1c\n\tsnapshots\x18\x02 \x03(\x0b\x32\t.Snapshot\"C\n\x0cJournalEntry\x12\n\n\x02ip\x18\x01 \x01(\t\x12\x0c\n\x04path\x18\x02 \x03(\t\x12\x19\n\x04\x66ile\x18\x03 \x01(\x0b\x32\x0b.TreeSystem\")\n\x07Journal\x12\x1e\n\x07\x65ntries\x18\x01 \x03(\x0b\x32\r.JournalEntry\"B\n\x05Score\x12\x0c\n\x04game\x18\x01 \x01(\t\x12\x0e\n\x06player\x18\x02 \x01(\t\x12\r\n\x05score\x18\x03 \x01(\x04\x12\x0c\n\x04time\x18\x04 \x01(\x01\"*\n\nScoreCount\x12\r\n\x05score\x18\x01 \x01(\x04\x12\r\n\x05\x63ount\x18\x02 \x01(\x04\"e\n\nScoreBoard\x12\x0c\n\x04game\x18\x01 \x01(\t\x12\x13\n\x03top\x18\x02 \x03(\x0b\x32\x06.Score\x12\x17\n\x07players\x18\x03 \x03(\x0b\x32\x06.Score\x12\x1b\n\x06\x63ounts\x18\x04 \x03(\x0b\x32\x0b.ScoreCount\"?\n\x08ScoreLog\x12\x16\n\x06scores\x18\x01 \x03(\x0b\x32\x06.Score\x12\x1b\n\x06\x62oards\x18\x02 \x03(\x0b\x32\x0b.ScoreBoard\"O\n\tShardHost\x12\n\n\x02ip\x18\x01 \x01(\t\x12\x0c\n\x04host\x18\x02 \x01(\t\x12\x0c\n\x04name\x18\x03 \x01(\t\x12\x0c\n\x04root\x18\x04 \x01(\r\x12\x0c\n\x04\x62\x61se\x18\x05 \x01(\x0c\"n\n\x0cShardMessage\x12\r\n\x05reset\x18\x01 \x01(\x08\x12\x1c\n\x05nodes\x18\x02 \x03(\x0b\x32\r.SnapshotNode\x12\x19\n\x05hosts\x18\x03 \x03(\x0b\x32\n.ShardHost\x12\x16\n\x06scores\x18\x04 \x03(\x0b\x32\x06.Score*@\n\x08\x46ileType\x12\x07\n\x03\x64ir\x10\x00\x12\x07\n\x03img\x10\x01\x12\x07\n\x03txt\x10\x02\x12\x07\n\x03\x65xe\x10\x03\x12\x07\n\x03\x62in\x10\x04\x12\x07\n\x03\x65nc\x10\x05\x62\x06proto3')
 
 _FILETYPE = DESCRIPTOR.enum_types_by_name['FileType']
 FileType = enum_type_wrapper.EnumTypeWrapper(_FILETYPE)
@@ -30,6 +30,18 @@ enc = 5
 _GAMESTATUS = DESCRIPTOR.message_types_by_name['GameStatus']
 _HOSTNODE = DESCRIPTOR.message_types_by_name['HostNode']
 _TREESYSTEM = DESCRIPTOR.message_types_by_name['TreeSystem']
+_SNAPSHOTNODE = DESCRIPTOR.message_types_by_name['SnapshotNode']
+_SNAPSHOTHOST = DESCRIPTOR.message_types_by_name['SnapshotHost']
+_SNAPSHOT = DESCRIPTOR.message_types_by_name['Snapshot']
+_SNAPSHOTSTORE = DESCRIPTOR.message_types_by_name['SnapshotStore']
+_JOURNALENTRY = DESCRIPTOR.message_types_by_name['JournalEntry']
+_JOURNAL = DESCRIPTOR.message_types_by_name['Journal']
+_SCORE = DESCRIPTOR.message_types_by_name['Score']
+_SCORECOUNT = DESCRIPTOR.message_types_by_name['ScoreCount']
+_SCOREBOARD = DESCRIPTOR.message_types_by_name['ScoreBoard']
+_SCORELOG = DESCRIPTOR.message_types_by_name['ScoreLog']
+_SHARDHOST = DESCRIPTOR.message_types_by_name['ShardHost']
+_SHARDMESSAGE = DESCRIPTOR.message_types_by_name['ShardMessage']
 GameStatus = _reflection.GeneratedProtocolMessageType('GameStatus', (_message.Message,), {
   'DESCRIPTOR' : _GAMESTATUS,
   '__module__' : 'game_status_pb2'
@@ -51,15 +63,123 @@ TreeSystem = _reflection.GeneratedProtocolMessageType('TreeSystem', (_message.Me
   })
 _sym_db.RegisterMessage(TreeSystem)
 
+SnapshotNode = _reflection.GeneratedProtocolMessageType('SnapshotNode', (_message.Message,), {
+  'DESCRIPTOR' : _SNAPSHOTNODE,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:SnapshotNode)
+  })
+_sym_db.RegisterMessage(SnapshotNode)
+
+SnapshotHost = _reflection.GeneratedProtocolMessageType('SnapshotHost', (_message.Message,), {
+  'DESCRIPTOR' : _SNAPSHOTHOST,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:SnapshotHost)
+  })
+_sym_db.RegisterMessage(SnapshotHost)
+
+Snapshot = _reflection.GeneratedProtocolMessageType('Snapshot', (_message.Message,), {
+  'DESCRIPTOR' : _SNAPSHOT,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:Snapshot)
+  })
+_sym_db.RegisterMessage(Snapshot)
+
+SnapshotStore = _reflection.GeneratedProtocolMessageType('SnapshotStore', (_message.Message,), {
+  'DESCRIPTOR' : _SNAPSHOTSTORE,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:SnapshotStore)
+  })
+_sym_db.RegisterMessage(SnapshotStore)
+
+JournalEntry = _reflection.GeneratedProtocolMessageType('JournalEntry', (_message.Message,), {
+  'DESCRIPTOR' : _JOURNALENTRY,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:JournalEntry)
+  })
+_sym_db.RegisterMessage(JournalEntry)
+
+Journal = _reflection.GeneratedProtocolMessageType('Journal', (_message.Message,), {
+  'DESCRIPTOR' : _JOURNAL,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:Journal)
+  })
+_sym_db.RegisterMessage(Journal)
+
+Score = _reflection.GeneratedProtocolMessageType('Score', (_message.Message,), {
+  'DESCRIPTOR' : _SCORE,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:Score)
+  })
+_sym_db.RegisterMessage(Score)
+
+ScoreCount = _reflection.GeneratedProtocolMessageType('ScoreCount', (_message.Message,), {
+  'DESCRIPTOR' : _SCORECOUNT,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:ScoreCount)
+  })
+_sym_db.RegisterMessage(ScoreCount)
+
+ScoreBoard = _reflection.GeneratedProtocolMessageType('ScoreBoard', (_message.Message,), {
+  'DESCRIPTOR' : _SCOREBOARD,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:ScoreBoard)
+  })
+_sym_db.RegisterMessage(ScoreBoard)
+
+ScoreLog = _reflection.GeneratedProtocolMessageType('ScoreLog', (_message.Message,), {
+  'DESCRIPTOR' : _SCORELOG,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:ScoreLog)
+  })
+_sym_db.RegisterMessage(ScoreLog)
+
+ShardHost = _reflection.GeneratedProtocolMessageType('ShardHost', (_message.Message,), {
+  'DESCRIPTOR' : _SHARDHOST,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:ShardHost)
+  })
+_sym_db.RegisterMessage(ShardHost)
+
+ShardMessage = _reflection.GeneratedProtocolMessageType('ShardMessage', (_message.Message,), {
+  'DESCRIPTOR' : _SHARDMESSAGE,
+  '__module__' : 'game_status_pb2'
+  # @@protoc_insertion_point(class_scope:ShardMessage)
+  })
+_sym_db.RegisterMessage(ShardMessage)
+
 if _descriptor._USE_C_DESCRIPTORS == False:
 
   DESCRIPTOR._options = None
-  _FILETYPE._serialized_start=310
-  _FILETYPE._serialized_end=374
+  _FILETYPE._serialized_start=1384
+  _FILETYPE._serialized_end=1448
   _GAMESTATUS._serialized_start=21
-  _GAMESTATUS._serialized_end=73
-  _HOSTNODE._serialized_start=75
-  _HOSTNODE._serialized_end=141
-  _TREESYSTEM._serialized_start=144
-  _TREESYSTEM._serialized_end=308
+  _GAMESTATUS._serialized_end=107
+  _HOSTNODE._serialized_start=109
+  _HOSTNODE._serialized_end=187
+  _TREESYSTEM._serialized_start=190
+  _TREESYSTEM._serialized_end=397
+  _SNAPSHOTNODE._serialized_start=400
+  _SNAPSHOTNODE._serialized_end=596
+  _SNAPSHOTHOST._serialized_start=598
+  _SNAPSHOTHOST._serialized_end=638
+  _SNAPSHOT._serialized_start=640
+  _SNAPSHOT._serialized_end=720
+  _SNAPSHOTSTORE._serialized_start=722
+  _SNAPSHOTSTORE._serialized_end=797
+  _JOURNALENTRY._serialized_start=799
+  _JOURNALENTRY._serialized_end=866
+  _JOURNAL._serialized_start=868
+  _JOURNAL._serialized_end=909
+  _SCORE._serialized_start=911
+  _SCORE._serialized_end=977
+  _SCORECOUNT._serialized_start=979
+  _SCORECOUNT._serialized_end=1021
+  _SCOREBOARD._serialized_start=1023
+  _SCOREBOARD._serialized_end=1124
+  _SCORELOG._serialized_start=1126
+  _SCORELOG._serialized_end=1189
+  _SHARDHOST._serialized_start=1191
+  _SHARDHOST._serialized_end=1270
+  _SHARDMESSAGE._serialized_start=1272
+  _SHARDMESSAGE._serialized_end=1382
 # @@protoc_insertion_point(module_scope)
@@ -38,15 +38,21 @@ class GameStatus(google.protobuf.message.Message):
     DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
     NAME_FIELD_NUMBER: builtins.int
     NONES_FIELD_NUMBER: builtins.int
+    SEED_FIELD_NUMBER: builtins.int
+    WORLD_SIZE_FIELD_NUMBER: builtins.int
     name: typing.Text = ...
     @property
     def nones(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___HostNode]: ...
+    seed: builtins.int = ...
+    world_size: builtins.int = ...
     def __init__(self,
         *,
         name : typing.Text = ...,
         nones : typing.Optional[typing.Iterable[global___HostNode]] = ...,
+        seed : builtins.int = ...,
+        world_size : builtins.int = ...,
         ) -> None: ...
-    def ClearField(self, field_name: typing_extensions.Literal[u"name",b"name",u"nones",b"nones"]) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"name",b"name",u"nones",b"nones",u"seed",b"seed",u"world_size",b"world_size"]) -> None: ...
 global___GameStatus = GameStatus
 
 class HostNode(google.protobuf.message.Message):
@@ -54,18 +60,21 @@ class HostNode(google.protobuf.message.Message):
     NAME_FIELD_NUMBER: builtins.int
     HOST_FIELD_NUMBER: builtins.int
     FILES_FIELD_NUMBER: builtins.int
+    IP_FIELD_NUMBER: builtins.int
     name: typing.Text = ...
     host: typing.Text = ...
     @property
     def files(self) -> global___TreeSystem: ...
+    ip: typing.Text = ...
     def __init__(self,
         *,
         name : typing.Text = ...,
         host : typing.Text = ...,
         files : typing.Optional[global___TreeSystem] = ...,
+        ip : typing.Text = ...,
         ) -> None: ...
     def HasField(self, field_name: typing_extensions.Literal[u"files",b"files"]) -> builtins.bool: ...
-    def ClearField(self, field_name: typing_extensions.Literal[u"files",b"files",u"host",b"host",u"name",b"name"]) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"files",b"files",u"host",b"host",u"ip",b"ip",u"name",b"name"]) -> None: ...
 global___HostNode = HostNode
 
 class TreeSystem(google.protobuf.message.Message):
@@ -78,6 +87,8 @@ class TreeSystem(google.protobuf.message.Message):
     WRITABLE_FIELD_NUMBER: builtins.int
     EXECUTABLE_FIELD_NUMBER: builtins.int
     VISIBLE_FIELD_NUMBER: builtins.int
+    OWNER_FIELD_NUMBER: builtins.int
+    MODE_FIELD_NUMBER: builtins.int
     name: typing.Text = ...
     type: global___FileType.V = ...
     data: typing.Text = ...
@@ -87,6 +98,8 @@ class TreeSystem(google.protobuf.message.Message):
     writable: builtins.bool = ...
     executable: builtins.bool = ...
     visible: builtins.bool = ...
+    owner: typing.Text = ...
+    mode: builtins.int = ...
     def __init__(self,
         *,
         name : typing.Text = ...,
@@ -97,6 +110,265 @@ class TreeSystem(google.protobuf.message.Message):
         writable : builtins.bool = ...,
         executable : builtins.bool = ...,
         visible : builtins.bool = ...,
+        owner : typing.Text = ...,
+        mode : builtins.int = ...,
         ) -> None: ...
-    def ClearField(self, field_name: typing_extensions.Literal[u"data",b"data",u"executable",b"executable",u"name",b"name",u"readable",b"readable",u"sub",b"sub",u"type",b"type",u"visible",b"visible",u"writable",b"writable"]) -> None: ...
+    def HasField(self, field_name: typing_extensions.Literal[u"_mode",b"_mode",u"mode",b"mode"]) -> builtins.bool: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"_mode",b"_mode",u"data",b"data",u"executable",b"executable",u"mode",b"mode",u"name",b"name",u"owner",b"owner",u"readable",b"readable",u"sub",b"sub",u"type",b"type",u"visible",b"visible",u"writable",b"writable"]) -> None: ...
+    def WhichOneof(self, oneof_group: typing_extensions.Literal[u"_mode",b"_mode"]) -> typing.Optional[typing_extensions.Literal["mode"]]: ...
 global___TreeSystem = TreeSystem
+
+class SnapshotNode(google.protobuf.message.Message):
+    """快照中的节点, 内容相同的子树只保存一次, sub 是子节点在 SnapshotStore.nodes 中的下标"""
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    NAME_FIELD_NUMBER: builtins.int
+    TYPE_FIELD_NUMBER: builtins.int
+    DATA_FIELD_NUMBER: builtins.int
+    SUB_FIELD_NUMBER: builtins.int
+    READABLE_FIELD_NUMBER: builtins.int
+    WRITABLE_FIELD_NUMBER: builtins.int
+    EXECUTABLE_FIELD_NUMBER: builtins.int
+    VISIBLE_FIELD_NUMBER: builtins.int
+    OWNER_FIELD_NUMBER: builtins.int
+    MODE_FIELD_NUMBER: builtins.int
+    name: typing.Text = ...
+    type: global___FileType.V = ...
+    data: typing.Text = ...
+    @property
+    def sub(self) -> google.protobuf.internal.containers.RepeatedScalarFieldContainer[builtins.int]: ...
+    readable: builtins.bool = ...
+    writable: builtins.bool = ...
+    executable: builtins.bool = ...
+    visible: builtins.bool = ...
+    owner: typing.Text = ...
+    mode: builtins.int = ...
+    def __init__(self,
+        *,
+        name : typing.Text = ...,
+        type : global___FileType.V = ...,
+        data : typing.Text = ...,
+        sub : typing.Optional[typing.Iterable[builtins.int]] = ...,
+        readable : builtins.bool = ...,
+        writable : builtins.bool = ...,
+        executable : builtins.bool = ...,
+        visible : builtins.bool = ...,
+        owner : typing.Text = ...,
+        mode : builtins.int = ...,
+        ) -> None: ...
+    def HasField(self, field_name: typing_extensions.Literal[u"_mode",b"_mode",u"mode",b"mode"]) -> builtins.bool: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"_mode",b"_mode",u"data",b"data",u"executable",b"executable",u"mode",b"mode",u"name",b"name",u"owner",b"owner",u"readable",b"readable",u"sub",b"sub",u"type",b"type",u"visible",b"visible",u"writable",b"writable"]) -> None: ...
+    def WhichOneof(self, oneof_group: typing_extensions.Literal[u"_mode",b"_mode"]) -> typing.Optional[typing_extensions.Literal["mode"]]: ...
+global___SnapshotNode = SnapshotNode
+
+class SnapshotHost(google.protobuf.message.Message):
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    IP_FIELD_NUMBER: builtins.int
+    ROOT_FIELD_NUMBER: builtins.int
+    ip: typing.Text = ...
+    root: builtins.int = ...
+    def __init__(self,
+        *,
+        ip : typing.Text = ...,
+        root : builtins.int = ...,
+        ) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"ip",b"ip",u"root",b"root"]) -> None: ...
+global___SnapshotHost = SnapshotHost
+
+class Snapshot(google.protobuf.message.Message):
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    ID_FIELD_NUMBER: builtins.int
+    NAME_FIELD_NUMBER: builtins.int
+    TIME_FIELD_NUMBER: builtins.int
+    HOSTS_FIELD_NUMBER: builtins.int
+    id: builtins.int = ...
+    name: typing.Text = ...
+    time: builtins.float = ...
+    @property
+    def hosts(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___SnapshotHost]: ...
+    def __init__(self,
+        *,
+        id : builtins.int = ...,
+        name : typing.Text = ...,
+        time : builtins.float = ...,
+        hosts : typing.Optional[typing.Iterable[global___SnapshotHost]] = ...,
+        ) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"hosts",b"hosts",u"id",b"id",u"name",b"name",u"time",b"time"]) -> None: ...
+global___Snapshot = Snapshot
+
+class SnapshotStore(google.protobuf.message.Message):
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    NODES_FIELD_NUMBER: builtins.int
+    SNAPSHOTS_FIELD_NUMBER: builtins.int
+    @property
+    def nodes(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___SnapshotNode]: ...
+    @property
+    def snapshots(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___Snapshot]: ...
+    def __init__(self,
+        *,
+        nodes : typing.Optional[typing.Iterable[global___SnapshotNode]] = ...,
+        snapshots : typing.Optional[typing.Iterable[global___Snapshot]] = ...,
+        ) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"nodes",b"nodes",u"snapshots",b"snapshots"]) -> None: ...
+global___SnapshotStore = SnapshotStore
+
+class JournalEntry(google.protobuf.message.Message):
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    IP_FIELD_NUMBER: builtins.int
+    PATH_FIELD_NUMBER: builtins.int
+    FILE_FIELD_NUMBER: builtins.int
+    ip: typing.Text = ...
+    @property
+    def path(self) -> google.protobuf.internal.containers.RepeatedScalarFieldContainer[typing.Text]: ...
+    @property
+    def file(self) -> global___TreeSystem: ...
+    def __init__(self,
+        *,
+        ip : typing.Text = ...,
+        path : typing.Optional[typing.Iterable[typing.Text]] = ...,
+        file : typing.Optional[global___TreeSystem] = ...,
+        ) -> None: ...
+    def HasField(self, field_name: typing_extensions.Literal[u"file",b"file"]) -> builtins.bool: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"file",b"file",u"ip",b"ip",u"path",b"path"]) -> None: ...
+global___JournalEntry = JournalEntry
+
+class Journal(google.protobuf.message.Message):
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    ENTRIES_FIELD_NUMBER: builtins.int
+    @property
+    def entries(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___JournalEntry]: ...
+    def __init__(self,
+        *,
+        entries : typing.Optional[typing.Iterable[global___JournalEntry]] = ...,
+        ) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"entries",b"entries"]) -> None: ...
+global___Journal = Journal
+
+class Score(google.protobuf.message.Message):
+    """小游戏的一局成绩, 见 nkgame.game.scores"""
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    GAME_FIELD_NUMBER: builtins.int
+    PLAYER_FIELD_NUMBER: builtins.int
+    SCORE_FIELD_NUMBER: builtins.int
+    TIME_FIELD_NUMBER: builtins.int
+    game: typing.Text = ...
+    player: typing.Text = ...
+    score: builtins.int = ...
+    time: builtins.float = ...
+    def __init__(self,
+        *,
+        game : typing.Text = ...,
+        player : typing.Text = ...,
+        score : builtins.int = ...,
+        time : builtins.float = ...,
+        ) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"game",b"game",u"player",b"player",u"score",b"score",u"time",b"time"]) -> None: ...
+global___Score = Score
+
+class ScoreCount(google.protobuf.message.Message):
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    SCORE_FIELD_NUMBER: builtins.int
+    COUNT_FIELD_NUMBER: builtins.int
+    score: builtins.int = ...
+    count: builtins.int = ...
+    def __init__(self,
+        *,
+        score : builtins.int = ...,
+        count : builtins.int = ...,
+        ) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"count",b"count",u"score",b"score"]) -> None: ...
+global___ScoreCount = ScoreCount
+
+class ScoreBoard(google.protobuf.message.Message):
+    """一个小游戏的排行榜: 全局前几名, 每个玩家的前几名, 每个分数的局数"""
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    GAME_FIELD_NUMBER: builtins.int
+    TOP_FIELD_NUMBER: builtins.int
+    PLAYERS_FIELD_NUMBER: builtins.int
+    COUNTS_FIELD_NUMBER: builtins.int
+    game: typing.Text = ...
+    @property
+    def top(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___Score]: ...
+    @property
+    def players(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___Score]: ...
+    @property
+    def counts(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___ScoreCount]: ...
+    def __init__(self,
+        *,
+        game : typing.Text = ...,
+        top : typing.Optional[typing.Iterable[global___Score]] = ...,
+        players : typing.Optional[typing.Iterable[global___Score]] = ...,
+        counts : typing.Optional[typing.Iterable[global___ScoreCount]] = ...,
+        ) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"counts",b"counts",u"game",b"game",u"players",b"players",u"top",b"top"]) -> None: ...
+global___ScoreBoard = ScoreBoard
+
+class ScoreLog(google.protobuf.message.Message):
+    """成绩文件中的一个数据块, 新的成绩或者重写后的完整排行榜"""
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    SCORES_FIELD_NUMBER: builtins.int
+    BOARDS_FIELD_NUMBER: builtins.int
+    @property
+    def scores(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___Score]: ...
+    @property
+    def boards(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___ScoreBoard]: ...
+    def __init__(self,
+        *,
+        scores : typing.Optional[typing.Iterable[global___Score]] = ...,
+        boards : typing.Optional[typing.Iterable[global___ScoreBoard]] = ...,
+        ) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"boards",b"boards",u"scores",b"scores"]) -> None: ...
+global___ScoreLog = ScoreLog
+
+class ShardHost(google.protobuf.message.Message):
+    """分片模式下一台主机的新内容, 见 nkgame.game.shard"""
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    IP_FIELD_NUMBER: builtins.int
+    HOST_FIELD_NUMBER: builtins.int
+    NAME_FIELD_NUMBER: builtins.int
+    ROOT_FIELD_NUMBER: builtins.int
+    BASE_FIELD_NUMBER: builtins.int
+    ip: typing.Text = ...
+    host: typing.Text = ...
+    name: typing.Text = ...
+    root: builtins.int = ...
+    """ShardMessage.nodes 中的下标, 和之前的消息中的节点连续编号"""
+
+    base: builtins.bytes = ...
+    """修改前的版本的摘要, 用来合并同时的修改, 新主机为空"""
+
+    def __init__(self,
+        *,
+        ip : typing.Text = ...,
+        host : typing.Text = ...,
+        name : typing.Text = ...,
+        root : builtins.int = ...,
+        base : builtins.bytes = ...,
+        ) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"base",b"base",u"host",b"host",u"ip",b"ip",u"name",b"name",u"root",b"root"]) -> None: ...
+global___ShardHost = ShardHost
+
+class ShardMessage(google.protobuf.message.Message):
+    """分片进程和协调进程之间的一批消息"""
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    RESET_FIELD_NUMBER: builtins.int
+    NODES_FIELD_NUMBER: builtins.int
+    HOSTS_FIELD_NUMBER: builtins.int
+    SCORES_FIELD_NUMBER: builtins.int
+    reset: builtins.bool = ...
+    """之后的节点重新从 0 开始编号"""
+
+    @property
+    def nodes(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___SnapshotNode]: ...
+    @property
+    def hosts(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___ShardHost]: ...
+    @property
+    def scores(self) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[global___Score]: ...
+    def __init__(self,
+        *,
+        reset : builtins.bool = ...,
+        nodes : typing.Optional[typing.Iterable[global___SnapshotNode]] = ...,
+        hosts : typing.Optional[typing.Iterable[global___ShardHost]] = ...,
+        scores : typing.Optional[typing.Iterable[global___Score]] = ...,
+        ) -> None: ...
+    def ClearField(self, field_name: typing_extensions.Literal[u"hosts",b"hosts",u"nodes",b"nodes",u"reset",b"reset",u"scores",b"scores"]) -> None: ...
+global___ShardMessage = ShardMessage